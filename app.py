@@ -1,72 +1,58 @@
+import json
+import os
 
+from flask import Flask, Response, request, jsonify
 
-from flask import Flask, request, jsonify
-import pandas as pd
-import numpy as np
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics, NullMetrics
+from nutriscout import (
+    ASSESS_SCHEMA, BATCH_INDICATORS_MESSAGE, CHILD_SCHEMA, INDICATOR_COLUMNS, ScoringError,
+    assessment_response, build_results, child_z_scores, get_growth_tables, indicator_scores,
+    lookup_result, recommendation_store, score_record_columns, validate_child
+)
+from profiling import PROFILE_HEADER, request_profiler
+from response_cache import ResponseCache, backend_from_config
+from serialization import Serializer
 
 app = Flask(__name__)
 
-def load_growth_data():
-    """Load and prepare all growth standard datasets with proper type conversion"""
-    # Load height-for-age data
-    height_data = pd.read_excel("dataset.xlsx", header=None, skiprows=3, nrows=61)
-    height_data.columns = ['AGE', 'BOYS_MEDIAN_HEIGHT', 'BOYS_SD_HEIGHT', 
-                         'GIRLS_MEDIAN_HEIGHT', 'GIRLS_SD_HEIGHT']
-    
-        
-    # Load weight-for-age data
-    weight_data = pd.read_excel("dataset.xlsx", header=None, skiprows=67, nrows=61)
-    weight_data.columns = ['AGE', 'BOYS_MEDIAN_WEIGHT', 'BOYS_SD_WEIGHT',
-                        'GIRLS_MEDIAN_WEIGHT', 'GIRLS_SD_WEIGHT']
-
-    # Load weight-for-height data
-    wfh_data = pd.read_excel("dataset.xlsx", skiprows=132, nrows=101)
-
-    # Split into gender-specific tables properly
-    # Columns: HEIGHT, GIRLS_MEDIAN, GIRLS_SD, BOYS_MEDIAN, BOYS_SD
-    wfh_girls = wfh_data.iloc[:, 0:3].copy()
-    wfh_girls.columns = ['HEIGHT', 'GIRLS_MEDIAN_WEIGHT', 'GIRLS_SD_WEIGHT']
-
-    wfh_boys = wfh_data.iloc[:, [0, 3, 4]].copy()  
-    wfh_boys.columns = ['HEIGHT', 'BOYS_MEDIAN_WEIGHT', 'BOYS_SD_WEIGHT']
-
-    
-    # Convert all numeric columns to float and handle missing values
-    for df in [height_data, weight_data, wfh_girls, wfh_boys]:
-        for col in df.columns[1:]:  # Skip the first column (AGE/HEIGHT)
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-    
-    return {
-        'height': height_data,
-        'weight': weight_data,
-        'wfh_girls': wfh_girls,
-        'wfh_boys': wfh_boys
-    }
-
-growth_data = load_growth_data()
-
-REGION_RECOMMENDATIONS = {
-    "Central": {
-        "Stunting": "Provide a balanced diet rich in proteins (eggs, fish, beans), energy-giving foods (sweet potatoes, matoke), and vegetables for vitamins.",
-        "Wasting": "Ensure high-energy foods like full-fat milk, millet porridge, and groundnut paste. Seek medical help for severe cases.",
-        "Underweight": "Increase meal frequency and include foods like avocado, peanut sauce, and fresh fruits. If no improvement, consult a nutritionist."
-    },
-    "Western": {
-        "Stunting": "Include milk, millet bread, beef, and leafy greens. Regular checkups are recommended to monitor growth.",
-        "Wasting": "Give high-energy foods such as millet porridge, ghee, roasted groundnuts, and milk. Seek medical care for severe cases.",
-        "Underweight": "Increase portions of protein-rich foods (beans, chicken) and serve meals with avocado. Encourage fresh milk consumption."
-    },
-    "Eastern": {
-        "Stunting": "Encourage millet porridge with groundnut paste, rice with fish, and leafy greens. Seek medical assessment if stunting persists.",
-        "Wasting": "Provide fish, energy-rich porridge with milk, and fresh fruit. Severe cases require immediate medical attention.",
-        "Underweight": "Increase portions of rice, beans, and cassava, and add roasted groundnuts. Fresh fruits and vegetables improve overall health."
-    },
-    "Northern": {
-        "Stunting": "Give nutrient-rich foods like sorghum bread, goat meat, and leafy greens. Periodic health checkups are essential.",
-        "Wasting": "Include sorghum porridge with groundnut paste, dry fish, and sim-sim. Seek urgent medical attention for severe malnutrition.",
-        "Underweight": "Increase meals with protein (goat meat, beans) and energy foods (cassava, avocado). If weight gain is slow, seek medical advice."
-    }
-}
+# Scoring settings (default age and weight-for-height modes, recommendations
+# file, result table) are in nutriscout.config
+
+# Rendered responses kept per worker (0 keeps none), and an optional backend
+# shared between workers, used whatever the size: "memory" or "sqlite:<path>"
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('NUTRISCOUT_CACHE_SIZE', '4096'))
+app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('NUTRISCOUT_CACHE_BACKEND', '')
+
+# JSON encoder for responses: "auto" (orjson when installed), "orjson" or "json"
+app.config['JSON_ENCODER'] = os.environ.get('NUTRISCOUT_JSON_ENCODER', 'auto')
+
+# Per-stage timings and counters served on /metrics; "0" turns them off
+app.config['METRICS'] = os.environ.get('NUTRISCOUT_METRICS', '1') != '0'
+
+# Directory where every worker writes its metrics, so /metrics serves the
+# totals of all workers (gunicorn.conf.py sets one up)
+app.config['METRICS_DIR'] = os.environ.get('NUTRISCOUT_METRICS_DIR') or None
+
+# Largest cohort accepted by the batch endpoint in one request
+MAX_BATCH_RECORDS = 50000
+
+# Endpoint names in the metrics
+RECOMMENDATION = 'recommendation'
+BATCH = 'batch'
+
+serializer = Serializer(app.config['JSON_ENCODER'])
+
+response_cache = ResponseCache(
+    app.config['RESPONSE_CACHE_SIZE'], backend_from_config(app.config['RESPONSE_CACHE_BACKEND'])
+)
+
+metrics = Metrics(app.config['METRICS_DIR']) if app.config['METRICS'] else NullMetrics()
+
+# Cached responses start with their status bands, so cache hits are
+# classified too; the format in the key keeps older shared entries unread,
+# and is bumped whenever scoring changes
+CACHE_FORMAT = 'bands+body:2'
+CACHED_BANDS = len(INDICATOR_COLUMNS)
 
 
 # REGION_RECOMMENDATIONS = {
@@ -165,169 +151,246 @@ REGION_RECOMMENDATIONS = {
 #     }
 # }
 
-def safe_float_conversion(value):
-    """Safely convert value to float, return 0 if conversion fails"""
+def compact_json():
+    """Whether Flask would serialize responses without indentation"""
+    return app.json.compact is True or (app.json.compact is None and not app.debug)
+
+def error_body(message, errors=None):
+    """Encoded {"error": message}, with per-field "errors" when given.
+
+    Bodies without field errors are reused for repeated messages.
+    """
+    if errors:
+        return serializer.dumps({"error": message, "errors": errors})
+    return serializer.error(message)
+
+def http_response(status, body, content_type=None):
+    """Flask response for a handler's (status, body), JSON unless content_type says otherwise"""
+    if content_type is not None:
+        return Response(body, status=status, content_type=content_type)
+    if not compact_json():
+        # Debug mode indents the JSON, as jsonify does
+        response = jsonify(json.loads(body))
+        response.status_code = status
+        return response
+    return Response(body, status=status, mimetype=app.json.mimetype)
+
+def response_key(child, engine):
+    """Cache key for a validated child, or None when responses are not cached.
+
+    The inputs are already normalized by validate_child. The recommendations
+    version keeps entries from outliving a reload of the advice text, and
+    the tables' fingerprint from outliving a change of the growth tables,
+    as a shared backend outlives restarts.
+    """
+    if response_cache.maxsize <= 0 and response_cache.backend is None:
+        return None
+    return (
+        CACHE_FORMAT, get_growth_tables().fingerprint, engine.version, child['age'],
+        child['gender'], child['height'], child['weight'], child['location'],
+        child['age_mode'], child['wfh_mode']
+    )
+
+def cache_entry(bands, body):
+    """Cached form of a response: its status bands, a byte each, then the body"""
+    return bytes(bands) + body
+
+def cache_metrics():
+    """Response cache counters, read when /metrics is scraped"""
+    stats = response_cache.stats()
+    return [
+        ('nutriscout_response_cache_hits_total', 'counter',
+         "Responses served from the cache", stats['hits'] + stats['shared_hits']),
+        ('nutriscout_response_cache_misses_total', 'counter',
+         "Cacheable responses that had to be scored", stats['misses']),
+        ('nutriscout_response_cache_evictions_total', 'counter',
+         "Responses evicted from the cache", stats['evictions']),
+        ('nutriscout_response_cache_size', 'gauge',
+         "Responses in the workers' caches", stats['size']),
+    ]
+
+if metrics.enabled:
+    metrics.registry.collect(cache_metrics)
+
+def handle_recommendation(load_json):
+    """Body of the recommendations endpoint for any web framework: (status, body bytes).
+
+    load_json() returns the request payload; whatever it raises becomes a
+    "Server error" response, as request.get_json() failures always have.
+    """
+    timer = metrics.timer(RECOMMENDATION)
+    status, body = recommendation_response(load_json, timer)
+    metrics.response(status, timer)
+    return status, body
+
+def assessment_body(child, timer):
+    """Body of a request that lists its "indicators", scored without the result table or cache"""
     try:
-        return float(value)
-    except (ValueError, TypeError):
-        return 0.0
-
-def calculate_z_score(value, median, sd):
-    """Safe Z-score calculation with type checking"""
+        results = indicator_scores(child, child['indicators'])
+    except ScoringError as e:
+        metrics.error(RECOMMENDATION, e.status, e.errors)
+        return e.status, error_body(e.message, e.errors)
+    timer.lap('assess')
+    metrics.assessed(results)
+    body = serializer.dumps(assessment_response(child['location'], results))
+    timer.lap('render')
+    return 200, body
+
+def recommendation_response(load_json, timer):
+    """handle_recommendation() with each stage lapped on timer"""
     try:
-        value = safe_float_conversion(value)
-        median = safe_float_conversion(median)
-        sd = safe_float_conversion(sd)
-        
-        if sd == 0:
-            return 0.0
-        return (value - median) / sd
-    except:
-        return 0.0
-
-def get_closest_height_data(height, gender):
-    """Find closest height with robust type handling"""
+        input_data = load_json()
+        timer.lap('parse')
+        assessing = isinstance(input_data, dict) and 'indicators' in input_data
+        child, error = validate_child(input_data, ASSESS_SCHEMA if assessing else CHILD_SCHEMA)
+        timer.lap('validate')
+        if error:
+            metrics.error(RECOMMENDATION, error[1], error[2])
+            return error[1], error_body(error[0], error[2])
+        if assessing:
+            return assessment_body(child, timer)
+
+        engine = recommendation_store.get()
+
+        # Quantized measurements are read straight from the result table
+        result = lookup_result(child)
+        timer.lap('result_table')
+        if result is not None:
+            z_scores, bands = result
+            metrics.classified(bands)
+            body = engine.render(child['location'], z_scores, bands)
+            timer.lap('render')
+            return 200, body
+
+        # Repeated measurements are served from the response cache
+        cache_key = response_key(child, engine)
+        if cache_key is not None:
+            entry = response_cache.get(cache_key)
+            timer.lap('cache_get')
+            if entry is not None:
+                metrics.classified(entry[:CACHED_BANDS])
+                return 200, entry[CACHED_BANDS:]
+
+        try:
+            z_scores = child_z_scores(child, timer)
+        except ScoringError as e:
+            metrics.error(RECOMMENDATION, e.status)
+            return e.status, error_body(e.message)
+
+        bands = [engine.band(i, z_score) for i, z_score in enumerate(z_scores)]
+        metrics.classified(bands)
+        body = engine.render(child['location'], z_scores, bands)
+        timer.lap('render')
+        if cache_key is not None:
+            response_cache.put(cache_key, cache_entry(bands, body))
+            timer.lap('cache_put')
+        return 200, body
+
+    except Exception as e:
+        metrics.exception(RECOMMENDATION, e)
+        return 500, error_body(f"Server error: {str(e)}")
+
+def batch_mimetype(output_format):
+    """Content type of a successful batch response in output_format"""
+    if output_format == 'json':
+        return None
+    from columnar import MIMETYPES
+    return MIMETYPES[output_format]
+
+def handle_batch(load_json, output_format='json'):
+    """Body of the batch endpoint for any web framework: (status, body bytes).
+
+    output_format "json" answers with the results as a JSON document;
+    "parquet", "arrow" and "npz" answer with a columnar file of them, with
+    errors still reported as JSON.
+    """
+    timer = metrics.timer(BATCH)
+    status, body = batch_response(load_json, output_format, timer)
+    metrics.response(status, timer)
+    return status, body
+
+def batch_response(load_json, output_format, timer):
+    """handle_batch() with each stage lapped on timer"""
     try:
-        data = growth_data['wfh_girls'] if gender == 'girl' else growth_data['wfh_boys']
-        height = safe_float_conversion(height)
-        
-        # Convert HEIGHT column to float and drop NA
-        heights = pd.to_numeric(data['HEIGHT'], errors='coerce')
-        valid_heights = heights.dropna()
-        
-        if valid_heights.empty:
-            raise ValueError("No valid height data available")
-            
-        closest_idx = (valid_heights - height).abs().idxmin()
-        return data.loc[closest_idx]
+        if output_format != 'json':
+            # pyarrow is only imported here, when columnar output is asked for
+            import columnar
+            try:
+                columnar.check_format(output_format)
+            except ValueError as e:
+                metrics.error(BATCH, 400)
+                return 400, error_body(str(e))
+
+        input_data = load_json()
+        timer.lap('parse')
+        records = input_data.get('records') if isinstance(input_data, dict) else input_data
+
+        if isinstance(input_data, dict) and 'indicators' in input_data:
+            metrics.error(BATCH, 400)
+            return 400, error_body(BATCH_INDICATORS_MESSAGE)
+        if not isinstance(records, list):
+            metrics.error(BATCH, 400)
+            return 400, error_body("Expected a list of records")
+        if len(records) > MAX_BATCH_RECORDS:
+            metrics.error(BATCH, 413)
+            return 413, error_body(f"At most {MAX_BATCH_RECORDS} records per batch")
+
+        scores = score_record_columns(records)
+        timer.lap('score')
+        metrics.scored(BATCH, scores)
+
+        if output_format != 'json':
+            body = columnar.encode(columnar.result_columns(scores), output_format)
+        else:
+            results = build_results(scores)
+            body = serializer.dumps({
+                "count": len(results),
+                "errors": sum(1 for result in results if "error" in result),
+                "results": results
+            })
+        timer.lap('render')
+        return 200, body
+
     except Exception as e:
-        raise ValueError(f"Error finding closest height: {str(e)}")
+        metrics.exception(BATCH, e)
+        return 500, error_body(f"Server error: {str(e)}")
 
-def classify_growth(z_score, thresholds, labels):
-    """Classify growth status based on Z-score thresholds"""
-    for i, threshold in enumerate(thresholds):
-        if z_score < threshold:
-            return labels[i]
-    return labels[-1]
+def run_handler(name, profile_header, handler, *args):
+    """handler(*args), under the request profiler when this request is picked for profiling"""
+    if request_profiler.enabled and request_profiler.wanted(profile_header):
+        return request_profiler.run(name, handler, *args)
+    return handler(*args)
 
 @app.route('/get_nutrition_recommendations', methods=['POST'])
 def get_nutrition_recommendations():
-    try:
-        input_data = request.get_json()
-        required_fields = ['age', 'gender', 'height', 'weight', 'location']
-        
-        if not all(field in input_data for field in required_fields):
-            return jsonify({"error": "Missing required fields"}), 400
-
-        # Convert and validate input values
-        try:
-            age = int(input_data['age'])
-            height = safe_float_conversion(input_data['height'])
-            weight = safe_float_conversion(input_data['weight'])
-            gender = input_data['gender'].lower()
-            location = input_data['location']
-        except:
-            return jsonify({"error": "Invalid input values"}), 400
-
-        if age < 1 or age > 60:
-            return jsonify({"error": "Age must be between 1-60 months"}), 400
-        if height <= 0 or weight <= 0:
-            return jsonify({"error": "Height and weight must be positive"}), 400
-        if gender not in ['boy', 'girl']:
-            return jsonify({"error": "Gender must be 'boy' or 'girl'"}), 400
-        if location not in REGION_RECOMMENDATIONS:
-            return jsonify({"error": "Invalid location specified"}), 400
-
-        # Calculate Z-scores with error handling
-        try:
-            # Height-for-age
-            hfa_row = growth_data['height'][growth_data['height']['AGE'] == age]
-            if hfa_row.empty:
-                return jsonify({"error": f"No height data for age {age} months"}), 404
-                
-            height_z = round(calculate_z_score(
-                height,
-                hfa_row[f"{gender.upper()}S_MEDIAN_HEIGHT"].values[0],
-                hfa_row[f"{gender.upper()}S_SD_HEIGHT"].values[0]
-            ), 2)
-
-            # Weight-for-age
-            wfa_row = growth_data['weight'][growth_data['weight']['AGE'] == age]
-            if wfa_row.empty:
-                return jsonify({"error": f"No weight data for age {age} months"}), 404
-                
-            weight_z = round(calculate_z_score(
-                weight,
-                wfa_row[f"{gender.upper()}S_MEDIAN_WEIGHT"].values[0],
-                wfa_row[f"{gender.upper()}S_SD_WEIGHT"].values[0]
-            ), 2)
-
-            # Weight-for-height
-            wfh_row = get_closest_height_data(height, gender)
-            wfh_z = round(calculate_z_score(
-                weight,
-                wfh_row[f"{gender.upper()}S_MEDIAN_WEIGHT"],
-                wfh_row[f"{gender.upper()}S_SD_WEIGHT"]
-            ), 2)
-
-        except Exception as e:
-            return jsonify({"error": f"Calculation error: {str(e)}"}), 500
-
-        # Classify results
-        height_status = classify_growth(
-            height_z,
-            [-3, -2, 2],
-            ["Severely Stunted", "Moderately Stunted", "Normal Height", "Above Average"]
-        )
-        
-        weight_status = classify_growth(
-            weight_z,
-            [-3, -2, 1],
-            ["Severely Underweight", "Moderately Underweight", "Normal Weight", "Overweight"]
-        )
-        
-        wasting_status = classify_growth(
-            wfh_z,
-            [-3, -2],
-            ["Severe Wasting", "Moderate Wasting", "Normal"]
-        )
-
-        # Prepare response with consistent field names
-        response = {
-            "Height": {
-                "Z-score": height_z,
-                "Status": height_status,
-                "Recommendation": (
-                    REGION_RECOMMENDATIONS[location]["Stunting"] 
-                    if height_z < -2 
-                    else "Normal height for age"
-                )
-            },
-            "Weight-for-Age": {
-                "Z-score": weight_z,
-                "Status": weight_status,
-                "Recommendation": (
-                    REGION_RECOMMENDATIONS[location]["Underweight"]
-                    if weight_z < -2
-                    else "Normal weight for age"
-                )
-            },
-            "Weight-for-Height": {
-                "Z-score": wfh_z,
-                "Status": wasting_status,
-                "Recommendation": (
-                    REGION_RECOMMENDATIONS[location]["Wasting"]
-                    if wfh_z < -2
-                    else "Normal weight for height"
-                )
-            },
-            "Region": location
-        }
-
-        return jsonify(response)
-
-    except Exception as e:
-        return jsonify({"error": f"Server error: {str(e)}"}), 500
+    return http_response(*run_handler(
+        RECOMMENDATION, request.headers.get(PROFILE_HEADER), handle_recommendation,
+        request.get_json
+    ))
+
+@app.route('/get_nutrition_recommendations/batch', methods=['POST'])
+def get_nutrition_recommendations_batch():
+    output_format = request.args.get('format', 'json')
+    status, body = run_handler(
+        BATCH, request.headers.get(PROFILE_HEADER), handle_batch, request.get_json, output_format
+    )
+    return http_response(status, body, batch_mimetype(output_format) if status == 200 else None)
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return http_response(200, serializer.dumps(response_cache.stats()))
+
+def handle_metrics():
+    """Body of the metrics endpoint: (status, body bytes), the text in METRICS_CONTENT_TYPE"""
+    text = metrics.render()
+    if text is None:
+        return 404, error_body("Metrics are disabled")
+    return 200, text.encode()
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    status, body = handle_metrics()
+    return http_response(status, body, METRICS_CONTENT_TYPE if status == 200 else None)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
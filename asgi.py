@@ -0,0 +1,182 @@
+"""ASGI application serving the same endpoints as the Flask app.
+
+An event loop keeps each idle or slow connection open for the price of a
+socket, so thousands of mobile clients holding keep-alive connections do not
+tie up a worker each. Requests go through the same handle_recommendation and
+handle_batch functions as the Flask routes, so both give identical responses.
+Nothing beyond the app's own requirements is imported; run it under any ASGI
+server, e.g.
+
+    uvicorn asgi:app --workers 4
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+
+from app import (
+    METRICS_CONTENT_TYPE, batch_mimetype, error_body, handle_batch, handle_metrics,
+    handle_recommendation, response_cache, serializer
+)
+from nutriscout import get_growth_tables
+from profiling import PROFILE_HEADER, install_sampler_signal, request_profiler
+
+# Largest request body read; a full batch of records is well below this
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+def load_json_body(body, content_type):
+    """Parse a request body as Flask's request.get_json() does, raising the same errors"""
+    mimetype = content_type.split(';', 1)[0].strip().lower()
+    if not (mimetype == 'application/json'
+            or (mimetype.startswith('application/') and mimetype.endswith('+json'))):
+        raise UnsupportedMediaType(
+            "Did not attempt to load JSON data because the request Content-Type"
+            " was not 'application/json'."
+        )
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise BadRequest()
+
+
+# Handlers take the JSON loader and the query arguments and return (status,
+# body, content type), with None for JSON
+
+def recommendation(load_json, args):
+    return (*handle_recommendation(load_json), None)
+
+
+def batch(load_json, args):
+    output_format = args.get('format', 'json')
+    status, body = handle_batch(load_json, output_format)
+    return status, body, batch_mimetype(output_format) if status == 200 else None
+
+
+def cache_stats(load_json, args):
+    return 200, serializer.dumps(response_cache.stats()), None
+
+
+def prometheus_metrics(load_json, args):
+    status, body = handle_metrics()
+    return status, body, METRICS_CONTENT_TYPE if status == 200 else None
+
+
+# Path to (method, handler, whether to run it off the event loop). A batch
+# can take long enough to stall every other connection, so it runs in a thread.
+# So do recommendations when responses are cached in a shared backend, whose
+# lookups and stores can block, SQLite's for up to its busy timeout.
+SHARED_CACHE = response_cache.backend is not None
+
+ROUTES = {
+    '/get_nutrition_recommendations': ('POST', recommendation, SHARED_CACHE),
+    '/get_nutrition_recommendations/batch': ('POST', batch, True),
+    '/cache_stats': ('GET', cache_stats, False),
+    '/metrics': ('GET', prometheus_metrics, False),
+}
+
+
+async def send_response(send, status, body, headers=(), content_type=None, head=False):
+    """Send a whole response; for a HEAD request only its headers"""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', (content_type or 'application/json').encode()),
+            (b'content-length', str(len(body)).encode()),
+            *headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+
+async def read_body(receive, limit):
+    """Whole request body, None if the client went away, or False if it exceeds limit"""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            return False
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def lifespan(receive, send):
+    """Load the growth tables at startup so the first request does not pay for it.
+
+    SIGUSR2 then toggles the stack sampler, as under gunicorn.
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            install_sampler_signal()
+            try:
+                get_growth_tables()
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    route = ROUTES.get(scope['path'])
+    if route is None:
+        await send_response(send, 404, error_body("Not found"))
+        return
+    method, handler, threaded = route
+    # GET routes answer HEAD too, as Flask's do
+    methods = (method, 'HEAD') if method == 'GET' else (method,)
+    allow = ", ".join(methods + ('OPTIONS',)).encode()
+    if scope['method'] == 'OPTIONS':
+        await send_response(send, 200, b'', [(b'allow', allow)])
+        return
+    if scope['method'] not in methods:
+        await send_response(send, 405, error_body("Method not allowed"), [(b'allow', allow)])
+        return
+
+    body = await read_body(receive, MAX_BODY_BYTES)
+    if body is None:
+        return
+    if body is False:
+        await send_response(send, 413, error_body("Request body too large"))
+        return
+
+    headers = dict(scope['headers'])
+    content_type = headers.get(b'content-type', b'').decode('latin-1')
+    # First value of each query argument, as Flask's request.args.get gives
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+    args = {name: values[0] for name, values in query.items()}
+
+    def load_json():
+        return load_json_body(body, content_type)
+
+    function, call_args = handler, (load_json, args)
+    if request_profiler.enabled:
+        profile_header = headers.get(PROFILE_HEADER.lower().encode())
+        if request_profiler.wanted(profile_header and profile_header.decode('latin-1')):
+            function, call_args = request_profiler.run, (handler.__name__, handler, load_json, args)
+
+    if threaded:
+        status, response, response_type = await asyncio.get_running_loop().run_in_executor(
+            None, function, *call_args
+        )
+    else:
+        status, response, response_type = function(*call_args)
+    await send_response(
+        send, status, response, content_type=response_type, head=scope['method'] == 'HEAD'
+    )
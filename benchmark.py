@@ -0,0 +1,308 @@
+"""Benchmark the scoring hot path and the HTTP endpoint on synthetic cohorts.
+
+Each benchmark runs on cohorts of every --sizes size, drawn around the
+reference medians with a fixed seed, and the timings are written as JSON
+together with the commit and environment they were taken on. Comparing
+against an earlier run prints the change of each best time and exits with
+status 1 if any got slower than --threshold. Nothing is fetched from the
+network; only dataset.xlsx and its compiled tables are read.
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+    python benchmark.py --only endpoint --sizes 1000 --repeat 10
+
+The response cache is off unless NUTRISCOUT_CACHE_SIZE is set, so endpoint
+timings measure scoring rather than cache hits.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import nutriscout
+from nutriscout import (
+    calculate_z_score, classify_growth, get_closest_height_data, get_growth_tables,
+    load_growth_data, load_growth_tables, score_many
+)
+from recommendations import INDICATORS
+from reference_tables import AGE_INDICATORS
+
+RESULTS_VERSION = 1
+
+DEFAULT_SIZES = (100, 1000, 10000)
+
+
+def synthetic_cohort(size, seed=0):
+    """size children with measurements around the medians, all of them scorable.
+
+    Ages are whole months the height and weight tables both list, so each child gets a
+    full response rather than an error.
+    """
+    rnd = random.Random(seed)
+    tables = get_growth_tables()
+    present = tables.age_present[:len(AGE_INDICATORS)].all(axis=0)
+    ages = [int(age) for age in np.flatnonzero(present) if age >= 1]
+    regions = sorted(nutriscout.REGION_RECOMMENDATIONS)
+    children = []
+    for _ in range(size):
+        gender = rnd.choice(('boy', 'girl'))
+        age = rnd.choice(ages)
+        height_median, height_sd = tables.age_row('height', gender, age)
+        weight_median, weight_sd = tables.age_row('weight', gender, age)
+        children.append({
+            "age": age,
+            "gender": gender,
+            "height": round(max(height_median + rnd.gauss(0, 1.3) * height_sd, 45.0), 1),
+            "weight": round(max(weight_median + rnd.gauss(0, 1.3) * weight_sd, 2.0), 1),
+            "location": rnd.choice(regions),
+        })
+    return children
+
+
+def cohort_columns(cohort):
+    """The cohort as score_many() columns"""
+    return {
+        field: np.array([child[field] for child in cohort])
+        for field in ('age', 'gender', 'height', 'weight', 'location')
+    }
+
+
+# Each benchmark takes a cohort (None for the unsized ones) and returns the
+# function to time, so setup is left out of the measurement
+
+def bench_load_growth_data(cohort):
+    return load_growth_data
+
+
+def bench_load_growth_tables(cohort):
+    return load_growth_tables
+
+
+def bench_closest_height(cohort):
+    rows = [(child['height'], child['gender']) for child in cohort]
+
+    def run():
+        for height, gender in rows:
+            get_closest_height_data(height, gender)
+    return run
+
+
+def bench_z_score_classify(cohort):
+    tables = get_growth_tables()
+    rows = []
+    for child in cohort:
+        gender = child['gender']
+        wfh = get_closest_height_data(child['height'], gender)
+        rows.append((
+            (child['height'],) + tables.age_row('height', gender, child['age']),
+            (child['weight'],) + tables.age_row('weight', gender, child['age']),
+            (child['weight'], wfh[f"{gender.upper()}S_MEDIAN_WEIGHT"],
+             wfh[f"{gender.upper()}S_SD_WEIGHT"]),
+        ))
+    cutoffs = [(thresholds, labels) for _, thresholds, labels, _, _ in INDICATORS]
+
+    def run():
+        for row in rows:
+            for (value, median, sd), (thresholds, labels) in zip(row, cutoffs):
+                classify_growth(round(calculate_z_score(value, median, sd), 2), thresholds, labels)
+    return run
+
+
+def bench_score_many(cohort):
+    columns = cohort_columns(cohort)
+    return lambda: score_many(columns)
+
+
+def bench_score_many_bands(cohort):
+    columns = cohort_columns(cohort)
+    return lambda: score_many(columns, z_scores=False)
+
+
+def bench_endpoint(cohort):
+    os.environ.setdefault('NUTRISCOUT_CACHE_SIZE', '0')
+    from app import app
+    client = app.test_client()
+
+    def run():
+        for child in cohort:
+            response = client.post('/get_nutrition_recommendations', json=child)
+            if response.status_code != 200:
+                raise RuntimeError(f"Endpoint answered {response.status_code}: {response.data!r}")
+    return run
+
+
+def bench_batch_endpoint(cohort):
+    os.environ.setdefault('NUTRISCOUT_CACHE_SIZE', '0')
+    from app import app
+    client = app.test_client()
+    body = json.dumps({"records": cohort})
+
+    def run():
+        response = client.post(
+            '/get_nutrition_recommendations/batch', data=body, content_type='application/json'
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Batch endpoint answered {response.status_code}")
+    return run
+
+
+# Name to (benchmark, whether it runs per cohort size)
+BENCHMARKS = {
+    'load_growth_data': (bench_load_growth_data, False),
+    'load_growth_tables': (bench_load_growth_tables, False),
+    'get_closest_height_data': (bench_closest_height, True),
+    'calculate_z_score+classify_growth': (bench_z_score_classify, True),
+    'score_many': (bench_score_many, True),
+    'score_many(bands only)': (bench_score_many_bands, True),
+    'endpoint': (bench_endpoint, True),
+    'batch_endpoint': (bench_batch_endpoint, True),
+}
+
+
+def measure(function, repeat, min_time=0.05):
+    """Seconds per call of function, for each of repeat timed runs.
+
+    An untimed call warms up caches first and sets how many calls each run
+    makes, so that a run takes at least min_time and timer noise on fast
+    functions stays small.
+    """
+    started = time.perf_counter()
+    function()
+    number = max(1, math.ceil(min_time / max(time.perf_counter() - started, 1e-9)))
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - started) / number)
+    return timings, number
+
+
+def run_benchmark(name, size, repeat, seed):
+    """Result entry of one benchmark at one cohort size (None when unsized)"""
+    benchmark, _ = BENCHMARKS[name]
+    cohort = synthetic_cohort(size, seed) if size else None
+    timings, number = measure(benchmark(cohort), repeat)
+    median = statistics.median(timings)
+    return {
+        "name": name,
+        "size": size,
+        "repeat": repeat,
+        "number": number,
+        "min": min(timings),
+        "median": median,
+        "mean": statistics.fmean(timings),
+        "max": max(timings),
+        "per_item_us": median / size * 1e6 if size else None,
+    }
+
+
+def git_commit():
+    """Commit being benchmarked, with a + if the tree has local changes"""
+    def git(*args):
+        return subprocess.run(
+            ['git', *args], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+
+    try:
+        commit = git('rev-parse', '--short', 'HEAD')
+        dirty = git('status', '--porcelain', '--untracked-files=no')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('+' if dirty else '')
+
+
+def environment():
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the change of each best time against baseline; return the regressions.
+
+    The fastest run is compared rather than the median, as it is the least
+    disturbed by other load on the machine.
+    """
+    previous = {(entry['name'], entry['size']): entry for entry in baseline['results']}
+    regressions = []
+    print(f"{'benchmark':<36}{'size':>8}{'before':>12}{'after':>12}{'change':>9}")
+    for entry in results:
+        before = previous.get((entry['name'], entry['size']))
+        if before is None:
+            continue
+        ratio = entry['min'] / before['min']
+        flag = ''
+        if ratio > threshold:
+            regressions.append(entry)
+            flag = '  slower'
+        print(
+            f"{entry['name']:<36}{entry['size'] or '-':>8}"
+            f"{before['min'] * 1e3:>10.3f}ms{entry['min'] * 1e3:>10.3f}ms"
+            f"{(ratio - 1) * 100:>+8.1f}%{flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated cohort sizes (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="timed runs of each benchmark (default: 5)")
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                        help="run only this benchmark; may be given several times")
+    parser.add_argument('--seed', type=int, default=0, help="cohort seed (default: 0)")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="earlier results to compare against")
+    parser.add_argument('--threshold', type=float, default=1.10,
+                        help="best time ratio counted as a regression (default: 1.10)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    names = args.only or list(BENCHMARKS)
+
+    results = []
+    for name in names:
+        for size in (sizes if BENCHMARKS[name][1] else [None]):
+            entry = run_benchmark(name, size, args.repeat, args.seed)
+            results.append(entry)
+            per_item = f", {entry['per_item_us']:.1f} us/child" if size else ''
+            print(
+                f"{name} [{size or '-'}]: median {entry['median'] * 1e3:.2f} ms{per_item}",
+                file=sys.stderr
+            )
+
+    report = {"version": RESULTS_VERSION, "environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
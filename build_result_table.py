@@ -0,0 +1,152 @@
+"""Precompute the result table for whole-month ages on the 0.1 cm / 0.1 kg grid.
+
+Every grid point is scored through the live vectorized code and stored in a
+memory-mappable .npz. Serve it by setting NUTRISCOUT_RESULT_TABLE to its path;
+the app ignores it once dataset.xlsx changes.
+
+    python build_result_table.py --report
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from nutriscout import (
+    DATASET_PATH, RESULT_TABLE_PATH, age_z_score, age_z_scores, calculate_z_score,
+    classify_growth, get_closest_height_data, wfh_z_scores
+)
+from recommendations import INDICATORS
+from reference_tables import SEXES, file_checksum
+from result_table import (
+    HEIGHT_RANGE, MISSING, NAMES, WEIGHT_RANGE, compile_result_table, load_result_table,
+    save_result_table
+)
+
+
+def score_age(indicator, sexes, ages, values):
+    return age_z_scores(
+        indicator, sexes, ages.astype(np.float64), values, np.zeros(len(ages), dtype=bool)
+    )
+
+
+def score_wfh(sexes, heights, weights):
+    return wfh_z_scores(sexes, heights, weights, np.zeros(len(heights), dtype=bool))
+
+
+def live_z_score(indicator, gender, age, height, weight):
+    """Unrounded Z-score through the scalar calculate_z_score path"""
+    if indicator == 0:
+        return age_z_score('height', gender, age, height, 'months')
+    if indicator == 1:
+        return age_z_score('weight', gender, age, weight, 'months')
+    row = get_closest_height_data(height, gender)
+    return calculate_z_score(
+        weight, row[f"{gender.upper()}S_MEDIAN_WEIGHT"], row[f"{gender.upper()}S_SD_WEIGHT"]
+    )
+
+
+def grid_points(table, indicator):
+    """(sex, age, height, weight) of every entry of one indicator's table"""
+    heights = (table.height_start + np.arange(table.n_heights)) / 10
+    weights = (table.weight_start + np.arange(table.n_weights)) / 10
+    for index in np.ndindex(table.codes[indicator].shape):
+        if indicator == 0:
+            sex, age, h = index
+            yield index, (sex, age, heights[h], 1.0)
+        elif indicator == 1:
+            sex, age, w = index
+            yield index, (sex, age, 1.0, weights[w])
+        else:
+            sex, h, w = index
+            yield index, (sex, None, heights[h], weights[w])
+
+
+def accuracy_report(table):
+    """Compare every tabulated entry with the scalar live path"""
+    print("Accuracy against the live calculate_z_score path:")
+    for i, name in enumerate(NAMES):
+        key, thresholds, labels = INDICATORS[i][:3]
+        checked = missing = mismatched = 0
+        for index, (sex, age, height, weight) in grid_points(table, i):
+            code = int(table.codes[i][index])
+            if code == MISSING:
+                missing += 1
+                continue
+            z = live_z_score(i, SEXES[sex], age, float(height), float(weight))
+            checked += 1
+            if round(z, 2) != code / 100 or labels[int(table.bands[i][index])] != classify_growth(
+                round(z, 2), thresholds, labels
+            ):
+                mismatched += 1
+        print(f"  {name:<18} {checked:>9} entries, {mismatched} mismatches, "
+              f"{missing} left to the live path")
+
+
+def latency_report(table, path, samples=20000):
+    """Table size and per-child lookup time against scoring live"""
+    print("Size:")
+    for name, codes, bands in zip(NAMES, table.codes, table.bands):
+        print(f"  {name:<18} {'x'.join(map(str, codes.shape)):>12}  "
+              f"{(codes.nbytes + bands.nbytes) / 1e6:6.2f} MB")
+    print(f"  {'file':<18} {'':>12}  {os.path.getsize(path) / 1e6:6.2f} MB")
+
+    rng = random.Random(0)
+    children = [
+        (rng.randrange(2), rng.randint(1, table.max_age),
+         rng.randrange(450, 1200) / 10, rng.randrange(20, 300) / 10)
+        for _ in range(samples)
+    ]
+
+    started = time.perf_counter()
+    for sex, age, height, weight in children:
+        table.lookup(sex, age, height, weight)
+    lookup = (time.perf_counter() - started) / samples
+
+    started = time.perf_counter()
+    for sex, age, height, weight in children:
+        for i in range(3):
+            z = live_z_score(i, SEXES[sex], age, height, weight)
+            if z is not None:
+                round(z, 2)
+    live = (time.perf_counter() - started) / samples
+
+    print("Latency per child (three indicators):")
+    print(f"  table lookup {lookup * 1e6:6.2f} us")
+    print(f"  live scoring {live * 1e6:6.2f} us")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=RESULT_TABLE_PATH,
+                        help=f"table path (default: {RESULT_TABLE_PATH})")
+    parser.add_argument('--heights', type=float, nargs=2, default=HEIGHT_RANGE,
+                        metavar=('MIN', 'MAX'), help="height range in cm (default: %(default)s)")
+    parser.add_argument('--weights', type=float, nargs=2, default=WEIGHT_RANGE,
+                        metavar=('MIN', 'MAX'), help="weight range in kg (default: %(default)s)")
+    parser.add_argument('--report', action='store_true',
+                        help="check every entry against the live path and time lookups")
+    args = parser.parse_args(argv)
+
+    checksum = file_checksum(DATASET_PATH)
+    if checksum is None:
+        print(f"{DATASET_PATH} not found", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    table = compile_result_table(score_age, score_wfh, args.heights, args.weights)
+    save_result_table(table, args.output, checksum)
+    print(f"Wrote {args.output} ({table.nbytes / 1e6:.2f} MB) in "
+          f"{time.perf_counter() - started:.1f}s")
+
+    if args.report:
+        table = load_result_table(args.output, checksum, mmap=True)
+        accuracy_report(table)
+        latency_report(table, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
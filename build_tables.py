@@ -0,0 +1,33 @@
+"""Compile dataset.xlsx into the binary tables artifact loaded by nutriscout.py.
+
+Run after every change to the workbook; the app falls back to parsing the
+workbook at startup while the artifact is missing or stale.
+
+    python build_tables.py
+"""
+import argparse
+import sys
+
+from nutriscout import DATASET_PATH, TABLES_PATH, load_growth_data
+from reference_tables import compile_reference_tables, file_checksum, save_reference_tables
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=TABLES_PATH,
+                        help=f"artifact path (default: {TABLES_PATH})")
+    args = parser.parse_args(argv)
+
+    checksum = file_checksum(DATASET_PATH)
+    if checksum is None:
+        print(f"{DATASET_PATH} not found", file=sys.stderr)
+        return 1
+
+    tables = compile_reference_tables(load_growth_data())
+    save_reference_tables(tables, args.output, checksum)
+    print(f"Wrote {args.output} from {DATASET_PATH} (sha256 {checksum[:12]})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
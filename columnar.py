@@ -0,0 +1,150 @@
+"""Columnar encodings of scoring results: Parquet, Arrow IPC and NPZ.
+
+One row per child. Z-scores are float32 (NaN where the child was not
+scored). Statuses are dictionary-encoded: an int8 code into the indicator's
+labels, null where not scored. The error message and the HTTP status of
+each row follow. Parquet and Arrow need pyarrow and can be streamed chunk
+by chunk with ColumnarWriter. NPZ needs only NumPy and stores each status as
+its codes (-1 for none) next to a <column>_labels array; it cannot be
+appended to, so it is only written whole by encode().
+"""
+import io
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from nutriscout import INDICATOR_COLUMNS, empty_scores
+from recommendations import INDICATORS
+
+FORMATS = ('parquet', 'arrow', 'npz')
+
+# Formats ColumnarWriter writes a chunk at a time
+STREAM_FORMATS = ('parquet', 'arrow')
+
+MIMETYPES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+    'npz': 'application/octet-stream',
+}
+
+# Labels of each dictionary-encoded status column
+STATUS_LABELS = {
+    f"{name}_status": labels
+    for name, (_, _, labels, _, _) in zip(INDICATOR_COLUMNS, INDICATORS)
+}
+
+
+def available(fmt):
+    """Whether results can be written in fmt here"""
+    return fmt == 'npz' or (fmt in FORMATS and pyarrow is not None)
+
+
+def check_format(fmt):
+    """Raise ValueError if results cannot be written in fmt"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown columnar format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    if not available(fmt):
+        raise ValueError(f"The {fmt} format needs the pyarrow package")
+
+
+def result_columns(scores):
+    """Output columns of score_many() results"""
+    columns = {}
+    for name in INDICATOR_COLUMNS:
+        columns[f"{name}_z"] = scores[f"{name}_z"].astype(np.float32)
+        columns[f"{name}_status"] = scores[f"{name}_band"]
+    columns['error'] = list(scores['error'])
+    columns['status'] = scores['status']
+    return columns
+
+
+def to_arrow(columns):
+    """pyarrow Table of result columns, with any extra columns as strings"""
+    arrays = {}
+    for name, column in columns.items():
+        if name in STATUS_LABELS:
+            arrays[name] = pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(column, mask=column < 0),
+                pyarrow.array(STATUS_LABELS[name], type=pyarrow.string())
+            )
+        elif isinstance(column, np.ndarray):
+            arrays[name] = pyarrow.array(column)
+        else:
+            arrays[name] = pyarrow.array(column, type=pyarrow.string())
+    return pyarrow.table(arrays)
+
+
+def to_npz_arrays(columns):
+    """Arrays for an NPZ file; strings become codes and labels unless mostly distinct"""
+    arrays = {}
+    for name, column in columns.items():
+        if name in STATUS_LABELS:
+            arrays[name] = column
+            arrays[f"{name}_labels"] = np.array(STATUS_LABELS[name])
+        elif isinstance(column, np.ndarray):
+            arrays[name] = column
+        else:
+            values = np.array(['' if value is None else value for value in column], dtype=str)
+            labels, codes = np.unique(values, return_inverse=True)
+            if len(labels) > len(values) // 2:
+                arrays[name] = values
+            else:
+                arrays[name] = codes.astype(np.int32)
+                arrays[f"{name}_labels"] = labels
+    return arrays
+
+
+def encode(columns, fmt):
+    """File contents of result columns in fmt"""
+    check_format(fmt)
+    buffer = io.BytesIO()
+    if fmt == 'npz':
+        np.savez_compressed(buffer, **to_npz_arrays(columns))
+    else:
+        writer = ColumnarWriter(buffer, fmt)
+        writer.write(columns)
+        writer.close()
+    return buffer.getvalue()
+
+
+class ColumnarWriter:
+    """Streams chunks of result columns to one Parquet or Arrow file.
+
+    Each chunk goes out as a row group or record batch as soon as it is
+    written, so memory use does not grow with the number of chunks.
+    """
+
+    def __init__(self, target, fmt):
+        check_format(fmt)
+        if fmt not in STREAM_FORMATS:
+            raise ValueError(
+                f"The {fmt} format cannot be streamed, use one of {', '.join(STREAM_FORMATS)}"
+            )
+        self.target = target
+        self.fmt = fmt
+        self._writer = None
+
+    def _open(self, schema):
+        if self.fmt == 'parquet':
+            self._writer = pyarrow.parquet.ParquetWriter(self.target, schema)
+        else:
+            self._writer = pyarrow.ipc.new_file(
+                self.target, schema, options=pyarrow.ipc.IpcWriteOptions(compression='zstd')
+            )
+
+    def write(self, columns):
+        table = to_arrow(columns)
+        if self._writer is None:
+            self._open(table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        # Without any chunk the file is still valid, with no rows and the result columns
+        if self._writer is None:
+            self._open(to_arrow(result_columns(empty_scores(0))).schema)
+        self._writer.close()
@@ -0,0 +1,266 @@
+"""Status cutoffs in cm and kg, so children are classified without computing Z-scores.
+
+A status band is decided by round((value - median) / sd, 2) against the
+indicator's thresholds. For a reference row with a positive SD that is a
+non-decreasing function of the measurement, so each threshold has a
+smallest measurement that reaches it. Those measurements are found once per
+row by bisection over doubles through the very same arithmetic, which keeps
+the rounding, and the float error of the division, exactly as the Z-score
+path has them. A child's band is then how many of its row's cutoffs its
+measurement reaches: one comparison per threshold and no division.
+
+Rows with a zero SD always score 0.0, so their cutoffs are -inf or +inf.
+Rows with a negative or non-finite SD have NaN cutoffs and are left to the
+Z-score path.
+
+The rows of the WHO LMS tables are bisected the same way through
+lms.lms_z_score(), whose Z-scores also grow with the measurement, so every
+age table shares one array of cutoffs.
+"""
+import bisect
+import math
+
+import numpy as np
+
+from lms import lms_z_score
+
+# Steps of (threshold - 0.005) * sd tried outwards to bracket a cutoff
+BRACKET_STEPS = 64
+
+
+def reaches(value, median, sd, threshold):
+    """Whether value scores at least threshold, as calculate_z_score and round() have it"""
+    return round((value - median) / sd, 2) >= threshold
+
+
+def cutoff(median, sd, threshold):
+    """Smallest double that scores at least threshold against (median, sd).
+
+    sd must be finite and not negative. Both must be Python floats, as NumPy
+    scalars round() differently.
+    """
+    if sd == 0:
+        return -math.inf if 0.0 >= threshold else math.inf
+    return first_reaching(
+        lambda value: reaches(value, median, sd, threshold),
+        median + (threshold - 0.005) * sd, sd * 0.01
+    )
+
+
+def first_reaching(reached, guess, step):
+    """Smallest double at which reached() turns true, bracketed outwards from guess.
+
+    reached must be false below some double and true from it on.
+    """
+    lo = hi = guess
+    width = step
+    for _ in range(BRACKET_STEPS):
+        if not reached(lo):
+            break
+        lo -= width
+        width *= 2
+    width = step
+    for _ in range(BRACKET_STEPS):
+        if reached(hi):
+            break
+        hi += width
+        width *= 2
+
+    # reached(lo) is False and reached(hi) is True; close in on the first double that reaches
+    while True:
+        mid = lo + (hi - lo) / 2
+        if mid <= lo or mid >= hi:
+            return hi
+        if reached(mid):
+            hi = mid
+        else:
+            lo = mid
+
+
+def row_cutoffs(median, sd, thresholds, width):
+    """Cutoffs of one reference row, padded with +inf to width"""
+    if not (math.isfinite(median) and math.isfinite(sd)) or sd < 0:
+        return [math.nan] * width
+    return [cutoff(median, sd, t) for t in thresholds] + [math.inf] * (width - len(thresholds))
+
+
+def lms_row_cutoffs(l, m, s, restricted, thresholds, width):
+    """row_cutoffs of one LMS row; a zero S scores 0.0 everywhere, as a zero SD does"""
+    if not (math.isfinite(l) and math.isfinite(m) and math.isfinite(s)) or m <= 0 or s < 0:
+        return [math.nan] * width
+    if s == 0:
+        cutoffs = [-math.inf if 0.0 >= t else math.inf for t in thresholds]
+    else:
+        cutoffs = [
+            first_reaching(
+                lambda value: round(lms_z_score(value, l, m, s, restricted), 2) >= t,
+                m * (1 + (t - 0.005) * s), m * s * 0.01
+            )
+            for t in thresholds
+        ]
+    return cutoffs + [math.inf] * (width - len(thresholds))
+
+
+def age_row_cutoffs(tables, i, sex, thresholds, width):
+    """Cutoffs of every age row of one table of ReferenceTables for one sex"""
+    rows = tables.age_values[i, sex].tolist()
+    if not tables.lms[i]:
+        return [row_cutoffs(median, sd, thresholds, width) for median, sd in rows]
+    return [
+        lms_row_cutoffs(l, m, s, tables.restricted[i], thresholds, width)
+        for l, (m, s) in zip(tables.age_l[i, sex].tolist(), rows)
+    ]
+
+
+def height_bins(tables, sex):
+    """(first height, sorted table position) of each run of heights sharing a nearest row.
+
+    The breakpoints are found by bisection over doubles with
+    closest_height_position itself, ties included; the first bin starts at
+    -inf. Empty for a sex without weight-for-height rows.
+    """
+    heights = tables.wfh_heights[sex].tolist()
+    if not heights:
+        return [], []
+
+    def position(height):
+        return tables.closest_height_position(sex, height)
+
+    starts, positions = [-math.inf], [position(heights[0])]
+    last = position(heights[-1])
+    lo = heights[0]
+    while positions[-1] != last:
+        # position(lo) is the current bin's and position(hi) is not
+        hi = heights[-1]
+        while True:
+            mid = lo + (hi - lo) / 2
+            if mid <= lo or mid >= hi:
+                break
+            if position(mid) == positions[-1]:
+                lo = mid
+            else:
+                hi = mid
+        starts.append(hi)
+        positions.append(position(hi))
+        lo = hi
+    return starts, positions
+
+
+class CutoffTables:
+    """Cutoffs of every reference row of ReferenceTables, per indicator.
+
+    age_cutoffs has shape (indicator, sex, age, threshold) for the
+    age-indexed tables, LMS ones included, in the order of
+    tables.indicators, padded with +inf past a table's own thresholds.
+    Weight-for-height
+    is split per sex into height bins, each the run of heights whose nearest
+    row is the same: wfh_starts holds the first height of every bin and
+    wfh_cutoffs the (bin, threshold) cutoffs of its row. thresholds gives
+    each indicator's Z-score thresholds, ascending: the age indicators'
+    first, then weight-for-height's.
+    """
+
+    def __init__(self, tables, thresholds):
+        self.tables = tables
+        self.thresholds = [tuple(t) for t in thresholds]
+        width = max(len(t) for t in self.thresholds)
+
+        values = tables.age_values
+        self.age_cutoffs = np.array([
+            [age_row_cutoffs(tables, i, s, self.thresholds[i], width)
+             for s in range(values.shape[1])]
+            for i in range(values.shape[0])
+        ]).reshape(values.shape[:3] + (width,))
+
+        starts, cutoffs = [], []
+        for sex, rows in enumerate(tables.wfh_values):
+            sex_starts, positions = height_bins(tables, sex)
+            row_values = rows.tolist()
+            starts.append(np.array(sex_starts, dtype=np.float64))
+            cutoffs.append(np.array([
+                row_cutoffs(*row_values[p], self.thresholds[-1], width) for p in positions
+            ]).reshape(-1, width))
+        self.wfh_starts = tuple(starts)
+        self.wfh_cutoffs = tuple(cutoffs)
+
+        # Per-threshold columns over flat (sex, age) and (sex, bin) indexes,
+        # each gathered with one take(); the +inf padding is left out
+        n_ages = values.shape[2]
+        self._age_columns = [
+            np.ascontiguousarray(
+                self.age_cutoffs[i].reshape(-1, width).T[:max(len(self.thresholds[i]), 1)]
+            )
+            for i in range(values.shape[0])
+        ]
+        self._n_ages = n_ages
+        self._wfh_offsets = np.cumsum([0] + [len(c) for c in cutoffs])[:-1].tolist()
+        self._wfh_columns = np.ascontiguousarray(
+            np.concatenate(cutoffs).reshape(-1, width).T[:max(len(self.thresholds[-1]), 1)]
+        )
+
+        self._age_lists = self.age_cutoffs.tolist()
+        self._wfh_start_lists = tuple(s.tolist() for s in starts)
+        self._wfh_lists = tuple(c.tolist() for c in cutoffs)
+
+    def age_band(self, indicator, sex, age, value):
+        """Band of a measurement at a whole-month age, or None without a usable row"""
+        i = self.tables.indicators.index(indicator)
+        if age < 0 or age > self.tables.max_age or not self.tables.age_present[i, age]:
+            return None
+        cutoffs = self._age_lists[i][sex][age]
+        if cutoffs[0] != cutoffs[0]:
+            return None
+        return bisect.bisect_right(cutoffs, value)
+
+    def wfh_band(self, sex, height, weight):
+        """Weight-for-height band from the nearest row, or None without a usable row"""
+        starts = self._wfh_start_lists[sex]
+        if not starts or height != height:
+            return None
+        cutoffs = self._wfh_lists[sex][bisect.bisect_right(starts, height) - 1]
+        if cutoffs[0] != cutoffs[0]:
+            return None
+        return bisect.bisect_right(cutoffs, weight)
+
+    def age_bands(self, indicator, sexes, ages, values):
+        """Vectorized age_band, returning (bands, found, exact) arrays.
+
+        Rows with NaN cutoffs are found but not exact and need the Z-score path.
+        """
+        i = self.tables.indicators.index(indicator)
+        ages = np.asarray(ages, dtype=np.int64)
+        found = (ages >= 0) & (ages <= self.tables.max_age)
+        ages = np.where(found, ages, 0)
+        found &= self.tables.age_present[i, ages]
+        return self.bands(self._age_columns[i], sexes * self._n_ages + ages, values, found)
+
+    def wfh_bands(self, sexes, heights, weights):
+        """Vectorized wfh_band, returning (bands, found, exact) arrays.
+
+        A child's bin is one searchsorted() over its sex's bin starts.
+        """
+        heights = np.asarray(heights, dtype=np.float64)
+        found = ~np.isnan(heights)
+        index = np.zeros(len(heights), dtype=np.intp)
+        for sex, (starts, offset) in enumerate(zip(self.wfh_starts, self._wfh_offsets)):
+            if not len(starts):
+                found &= sexes != sex
+                continue
+            bins = np.searchsorted(starts, heights, side='right') - 1 + offset
+            index = bins if sex == 0 else np.where(sexes == sex, bins, index)
+        return self.bands(self._wfh_columns, index, weights, found)
+
+    @staticmethod
+    def bands(columns, index, values, found):
+        """How many of the cutoffs at index a value reaches.
+
+        columns holds one row of cutoffs per threshold, ascending, so this is
+        searchsorted(side='right') against every child's own cutoffs.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        first = columns[0].take(index)
+        exact = found & ~np.isnan(first)
+        bands = (values >= first).astype(np.int8)
+        for column in columns[1:]:
+            bands += values >= column.take(index)
+        return bands, found, exact
@@ -0,0 +1,497 @@
+"""Golden corpus of legacy scoring results, and a differential checker for engines.
+
+build scores the whole age x sex x height x weight grid with a frozen copy
+of the original scoring code: DataFrame lookups on the tables read by
+load_growth_data(), calculate_z_score, the idxmin() nearest-height search
+and classify_growth. Every legacy quirk is therefore part of the corpus:
+cells that fillna(0) turned into a zero SD score 0.0, heights midway
+between two weight-for-height rows take the row listed first, Z-scores are
+round()ed to two decimals (negative zero included) and a missing age row
+leaves the child unscored. The corpus is factored like the result table:
+height-for-age over (sex, age, height), weight-for-age over (sex, age,
+weight) and weight-for-height over (sex, height, weight).
+
+check scores a set of children covering every cell of the corpus with each
+engine (the scalar path, score_many(), classification against the cutoffs
+in cm and kg, the indicator registry's assess(), the result table, the
+endpoint with its response cache) and reports every Z-score or status that
+differs.
+
+    python golden.py build
+    python golden.py check
+    python golden.py check --engine score_many --engine endpoint --sample 20000
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from nutriscout import (
+    DATASET_PATH, INDICATOR_COLUMNS, RESULT_TABLE_PATH, ScoringError, assess, child_z_scores,
+    classify, classify_growth, load_growth_data, score_many
+)
+from recommendations import INDICATORS
+from reference_tables import SEXES, file_checksum
+from result_table import HEIGHT_RANGE, WEIGHT_RANGE, grid_tenths, load_result_table
+
+CORPUS_PATH = "golden_corpus.npz"
+
+CORPUS_VERSION = 1
+
+# Ages the API accepts
+AGES = range(1, 61)
+
+# Spacing of the weight-for-height rows whose midpoints are added to the heights
+WFH_ROW_STEP = 0.5
+
+
+# Frozen copy of the original scoring code, which the corpus is built from.
+# Keep it as it is: faster code belongs in nutriscout and is checked against it.
+
+def legacy_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def legacy_z_score(value, median, sd):
+    try:
+        value = legacy_float(value)
+        median = legacy_float(median)
+        sd = legacy_float(sd)
+
+        if sd == 0:
+            return 0.0
+        return (value - median) / sd
+    except:
+        return 0.0
+
+
+def legacy_age_row(data, measure, gender, age):
+    """(median, sd) of the first row for age, or None when there is none"""
+    row = data[data['AGE'] == age]
+    if row.empty:
+        return None
+    return (row[f"{gender.upper()}S_MEDIAN_{measure}"].values[0],
+            row[f"{gender.upper()}S_SD_{measure}"].values[0])
+
+
+def legacy_closest_height(data, height):
+    import pandas as pd
+
+    heights = pd.to_numeric(data['HEIGHT'], errors='coerce')
+    valid_heights = heights.dropna()
+    if valid_heights.empty:
+        raise ValueError("No valid height data available")
+    return data.loc[(valid_heights - height).abs().idxmin()]
+
+
+def legacy_classify(z_score, thresholds, labels):
+    for i, threshold in enumerate(thresholds):
+        if z_score < threshold:
+            return labels[i]
+    return labels[-1]
+
+
+def legacy_scores(values, median, sd, indicator):
+    """(rounded Z-scores, status bands) of values against one reference row"""
+    _, thresholds, labels = INDICATORS[indicator][:3]
+    z_scores = [round(legacy_z_score(value, median, sd), 2) for value in values]
+    bands = [labels.index(legacy_classify(z, thresholds, labels)) for z in z_scores]
+    return z_scores, bands
+
+
+def corpus_axes(height_range=HEIGHT_RANGE, weight_range=WEIGHT_RANGE):
+    """Ages, heights and weights of the grid.
+
+    Heights and weights are every 0.1 over the result table's ranges; the
+    heights also get every point midway between two weight-for-height rows,
+    where the nearest-height search has to break a tie.
+    """
+    heights = grid_tenths(*height_range) / 10
+    midpoints = (
+        round(height_range[0] / WFH_ROW_STEP) * WFH_ROW_STEP + WFH_ROW_STEP / 2
+        + WFH_ROW_STEP * np.arange(int((height_range[1] - height_range[0]) / WFH_ROW_STEP))
+    )
+    heights = np.unique(np.concatenate([heights, midpoints]))
+    return np.array(AGES), heights, grid_tenths(*weight_range) / 10
+
+
+def build_corpus(growth_data, ages, heights, weights):
+    """Golden Z-scores and bands of every grid cell, NaN and -1 where there is no row"""
+    corpus = {'age': ages, 'height': heights, 'weight': weights}
+    shapes = {
+        'height': (len(SEXES), len(ages), len(heights)),
+        'weight_for_age': (len(SEXES), len(ages), len(weights)),
+        'weight_for_height': (len(SEXES), len(heights), len(weights)),
+    }
+    for name in INDICATOR_COLUMNS:
+        corpus[f"{name}_z"] = np.full(shapes[name], np.nan)
+        corpus[f"{name}_band"] = np.full(shapes[name], -1, dtype=np.int8)
+
+    height_list, weight_list = heights.tolist(), weights.tolist()
+    for s, gender in enumerate(SEXES):
+        for a, age in enumerate(ages.tolist()):
+            for indicator, (name, table, measure, values) in enumerate([
+                ('height', 'height', 'HEIGHT', height_list),
+                ('weight_for_age', 'weight', 'WEIGHT', weight_list),
+            ]):
+                row = legacy_age_row(growth_data[table], measure, gender, age)
+                if row is not None:
+                    corpus[f"{name}_z"][s, a], corpus[f"{name}_band"][s, a] = (
+                        legacy_scores(values, *row, indicator)
+                    )
+
+        wfh = growth_data[f"wfh_{gender}s"]
+        for h, height in enumerate(height_list):
+            row = legacy_closest_height(wfh, height)
+            corpus['weight_for_height_z'][s, h], corpus['weight_for_height_band'][s, h] = (
+                legacy_scores(
+                    weight_list, row[f"{gender.upper()}S_MEDIAN_WEIGHT"],
+                    row[f"{gender.upper()}S_SD_WEIGHT"], 2
+                )
+            )
+    return corpus
+
+
+def save_corpus(corpus, path, source_checksum):
+    np.savez_compressed(
+        path, version=np.array(CORPUS_VERSION), source_sha256=np.array(source_checksum or ''),
+        **corpus
+    )
+
+
+def load_corpus(path, source_checksum=None):
+    """Read a corpus, or None if it is missing, from another version or built from other data"""
+    try:
+        with np.load(path, allow_pickle=False) as archive:
+            data = {name: archive[name] for name in archive.files}
+    except (OSError, ValueError):
+        return None
+    version, source = int(data.pop('version')), str(data.pop('source_sha256'))
+    if version != CORPUS_VERSION or source_checksum and source != source_checksum:
+        return None
+    return data
+
+
+def covering_children(corpus):
+    """Children that between them hit every cell of the corpus.
+
+    Each (sex, height, weight) gets one child, its age cycling through the
+    ages where both age tables have a row, so every (sex, age, height) and
+    (sex, age, weight) is reached too. Ages missing from a table get one child
+    per (sex, height) and per (sex, weight) to check the child goes unscored.
+    Returns the children's sex, age, height and weight as grid positions.
+    """
+    n_heights, n_weights = len(corpus['height']), len(corpus['weight'])
+    sexes, h, w = (axis.ravel() for axis in np.meshgrid(
+        np.arange(len(SEXES)), np.arange(n_heights), np.arange(n_weights), indexing='ij'
+    ))
+    complete = (corpus['height_band'][:, :, 0] >= 0) & (corpus['weight_for_age_band'][:, :, 0] >= 0)
+
+    positions = [(np.empty(0, dtype=np.intp),) * 4]
+    for s in range(len(SEXES)):
+        rows = sexes == s
+        ages = np.flatnonzero(complete[s])
+        if len(ages):
+            positions.append((sexes[rows], ages[(h[rows] + w[rows]) % len(ages)], h[rows], w[rows]))
+        for a in np.flatnonzero(~complete[s]):
+            positions.append((np.full(n_heights, s), np.full(n_heights, a), np.arange(n_heights),
+                              np.arange(n_heights) % n_weights))
+            positions.append((np.full(n_weights, s), np.full(n_weights, a),
+                              np.arange(n_weights) % n_heights, np.arange(n_weights)))
+    return {
+        field: np.concatenate([p[i] for p in positions]).astype(np.intp)
+        for i, field in enumerate(('sex', 'age', 'height', 'weight'))
+    }
+
+
+def expected_scores(corpus, positions):
+    """Golden Z-scores and bands of children, all NaN and -1 for an unscored child"""
+    s, a, h, w = (positions[field] for field in ('sex', 'age', 'height', 'weight'))
+    expected = {
+        'height': (corpus['height_z'][s, a, h], corpus['height_band'][s, a, h]),
+        'weight_for_age': (corpus['weight_for_age_z'][s, a, w],
+                           corpus['weight_for_age_band'][s, a, w]),
+        'weight_for_height': (corpus['weight_for_height_z'][s, h, w],
+                              corpus['weight_for_height_band'][s, h, w]),
+    }
+    scored = (expected['height'][1] >= 0) & (expected['weight_for_age'][1] >= 0)
+    return {
+        name: (np.where(scored, z, np.nan), np.where(scored, band, -1))
+        for name, (z, band) in expected.items()
+    }
+
+
+class EngineUnavailable(Exception):
+    """An engine that cannot run here, e.g. for lack of its artifact"""
+
+
+def unscored(size):
+    return {
+        name: (np.full(size, np.nan), np.full(size, -1, dtype=np.int8))
+        for name in INDICATOR_COLUMNS
+    }
+
+
+def bands_of(z_scores):
+    return [
+        labels.index(classify_growth(z, thresholds, labels))
+        for z, (_, thresholds, labels, _, _) in zip(z_scores, INDICATORS)
+    ]
+
+
+# Each engine takes children as columns of sex index, whole-month age,
+# height and weight, and returns name -> (Z-scores, bands) for each of
+# INDICATOR_COLUMNS, NaN and -1 where a child is not scored. Engines that
+# only classify return None for the Z-scores
+
+def engine_scalar(children):
+    """child_z_scores() and classify_growth(), one child at a time"""
+    scores = unscored(len(children['age']))
+    rows = zip(*(children[field].tolist() for field in ('sex', 'age', 'height', 'weight')))
+    for i, (sex, age, height, weight) in enumerate(rows):
+        child = {'age': age, 'gender': SEXES[sex], 'height': height, 'weight': weight,
+                 'age_mode': 'months', 'wfh_mode': 'nearest'}
+        try:
+            z_scores = child_z_scores(child)
+        except ScoringError:
+            continue
+        for name, z, band in zip(INDICATOR_COLUMNS, z_scores, bands_of(z_scores)):
+            scores[name][0][i], scores[name][1][i] = z, band
+    return scores
+
+
+def engine_score_many(children):
+    """score_many() over all children at once"""
+    size = len(children['age'])
+    scores = score_many({
+        'age': children['age'], 'gender': np.array(SEXES)[children['sex']],
+        'height': children['height'], 'weight': children['weight'],
+        'location': np.full(size, 'Central'),
+    })
+    return {name: (scores[f"{name}_z"], scores[f"{name}_band"]) for name in INDICATOR_COLUMNS}
+
+
+def engine_cutoffs(children):
+    """score_many() without Z-scores, classifying against the cutoffs in cm and kg"""
+    size = len(children['age'])
+    scores = score_many({
+        'age': children['age'], 'gender': np.array(SEXES)[children['sex']],
+        'height': children['height'], 'weight': children['weight'],
+        'location': np.full(size, 'Central'),
+    }, z_scores=False)
+    return {name: (None, scores[f"{name}_band"]) for name in INDICATOR_COLUMNS}
+
+
+def engine_classify(children):
+    """classify() one child at a time, against the cutoffs in cm and kg"""
+    bands = {name: np.full(len(children['age']), -1, dtype=np.int8) for name in INDICATOR_COLUMNS}
+    rows = zip(*(children[field].tolist() for field in ('sex', 'age', 'height', 'weight')))
+    for i, (sex, age, height, weight) in enumerate(rows):
+        child = {'age': age, 'gender': SEXES[sex], 'height': height, 'weight': weight,
+                 'location': 'Central'}
+        try:
+            result = classify(child)
+        except ScoringError:
+            continue
+        for name, (key, _, labels, _, _) in zip(INDICATOR_COLUMNS, INDICATORS):
+            bands[name][i] = labels.index(result[key]["Status"])
+    return {name: (None, bands[name]) for name in INDICATOR_COLUMNS}
+
+
+def engine_assess(children):
+    """assess() one child at a time, with the original indicators listed"""
+    scores = unscored(len(children['age']))
+    rows = zip(*(children[field].tolist() for field in ('sex', 'age', 'height', 'weight')))
+    for i, (sex, age, height, weight) in enumerate(rows):
+        child = {'age': age, 'gender': SEXES[sex], 'height': height, 'weight': weight,
+                 'location': 'Central', 'indicators': list(INDICATOR_COLUMNS)}
+        try:
+            result = assess(child)
+        except ScoringError:
+            continue
+        for name, (key, _, labels, _, _) in zip(INDICATOR_COLUMNS, INDICATORS):
+            scores[name][0][i] = result[key]["Z-score"]
+            scores[name][1][i] = labels.index(result[key]["Status"])
+    return scores
+
+
+def engine_result_table(children):
+    """Result table lookups, falling back to the live path off the grid"""
+    table = load_result_table(RESULT_TABLE_PATH, file_checksum(DATASET_PATH))
+    if table is None:
+        raise EngineUnavailable(f"{RESULT_TABLE_PATH} missing or stale; run build_result_table.py")
+
+    scores = unscored(len(children['age']))
+    rows = zip(*(children[field].tolist() for field in ('sex', 'age', 'height', 'weight')))
+    for i, (sex, age, height, weight) in enumerate(rows):
+        child = {'age': age, 'gender': SEXES[sex], 'height': height, 'weight': weight,
+                 'age_mode': 'months', 'wfh_mode': 'nearest'}
+        result = table.lookup(sex, age, height, weight)
+        if result is None:
+            try:
+                z_scores = child_z_scores(child)
+            except ScoringError:
+                continue
+            result = z_scores, bands_of(z_scores)
+        for name, z, band in zip(INDICATOR_COLUMNS, *result):
+            scores[name][0][i], scores[name][1][i] = z, band
+    return scores
+
+
+def engine_endpoint(children):
+    """The endpoint through Flask's test client, each child posted twice.
+
+    The second response comes from the response cache unless it is turned
+    off; both must match.
+    """
+    from app import app
+
+    client = app.test_client()
+    scores = unscored(len(children['age']))
+    rows = zip(*(children[field].tolist() for field in ('sex', 'age', 'height', 'weight')))
+    for i, (sex, age, height, weight) in enumerate(rows):
+        child = {'age': age, 'gender': SEXES[sex], 'height': height, 'weight': weight,
+                 'location': 'Central'}
+        first = client.post('/get_nutrition_recommendations', json=child)
+        second = client.post('/get_nutrition_recommendations', json=child)
+        if first.status_code != 200 or second.status_code != 200:
+            continue
+        if first.data != second.data:
+            # Flag every indicator of a child whose cached response differs
+            for name in INDICATOR_COLUMNS:
+                scores[name][1][i] = -2
+            continue
+        body = first.get_json()
+        for name, (key, _, labels, _, _) in zip(INDICATOR_COLUMNS, INDICATORS):
+            scores[name][0][i] = body[key]["Z-score"]
+            scores[name][1][i] = labels.index(body[key]["Status"])
+    return scores
+
+
+# Name to (engine, children it checks by default, None for all of them)
+ENGINES = {
+    'scalar': (engine_scalar, None),
+    'score_many': (engine_score_many, None),
+    'cutoffs': (engine_cutoffs, None),
+    'classify': (engine_classify, None),
+    'assess': (engine_assess, None),
+    'result_table': (engine_result_table, None),
+    'endpoint': (engine_endpoint, 5000),
+}
+
+
+def mismatches(expected, got):
+    """Positions where Z-scores (sign of zero included) or bands differ"""
+    (z_expected, band_expected), (z_got, band_got) = expected, got
+    same = band_expected == np.asarray(band_got)
+    if z_got is not None:
+        z_got = np.asarray(z_got, dtype=np.float64)
+        same &= ((z_expected == z_got) & (np.signbit(z_expected) == np.signbit(z_got))
+                 | np.isnan(z_expected) & np.isnan(z_got))
+    return np.flatnonzero(~same)
+
+
+def got_z(z_scores, i):
+    return 'no Z-score' if z_scores is None else repr(float(z_scores[i]))
+
+
+def describe(corpus, positions, i):
+    return (f"{SEXES[positions['sex'][i]]}, {corpus['age'][positions['age'][i]]} months, "
+            f"{corpus['height'][positions['height'][i]]} cm, "
+            f"{corpus['weight'][positions['weight'][i]]} kg")
+
+
+def check_engine(name, corpus, positions, show):
+    """Run one engine on the children and print its mismatches; returns how many"""
+    engine, _ = ENGINES[name]
+    children = {
+        'sex': positions['sex'],
+        'age': corpus['age'][positions['age']],
+        'height': corpus['height'][positions['height']],
+        'weight': corpus['weight'][positions['weight']],
+    }
+    expected = expected_scores(corpus, positions)
+
+    started = time.perf_counter()
+    try:
+        got = engine(children)
+    except EngineUnavailable as e:
+        print(f"{name}: skipped, {e}")
+        return 0
+    elapsed = time.perf_counter() - started
+
+    total = 0
+    lines = []
+    for indicator in INDICATOR_COLUMNS:
+        wrong = mismatches(expected[indicator], got[indicator])
+        total += len(wrong)
+        for i in wrong[:show].tolist():
+            lines.append(
+                f"  {indicator}: {describe(corpus, positions, i)}: expected "
+                f"{float(expected[indicator][0][i])!r} (band {int(expected[indicator][1][i])}),"
+                f" got {got_z(got[indicator][0], i)} (band {int(got[indicator][1][i])})"
+            )
+    print(f"{name}: {len(children['age'])} children in {elapsed:.1f}s, {total} mismatches")
+    for line in lines:
+        print(line)
+    return total
+
+
+def sample_children(positions, size, seed):
+    """size of the children at random, or all of them"""
+    count = len(positions['age'])
+    if size is None or size >= count:
+        return positions
+    rows = np.sort(np.random.default_rng(seed).choice(count, size, replace=False))
+    return {field: column[rows] for field, column in positions.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="score the grid with the legacy code")
+    build.add_argument('--output', default=CORPUS_PATH,
+                       help=f"corpus path (default: {CORPUS_PATH})")
+    check = commands.add_parser('check', help="compare engines against the corpus")
+    check.add_argument('--corpus', default=CORPUS_PATH,
+                       help=f"corpus path (default: {CORPUS_PATH})")
+    check.add_argument('--engine', action='append', choices=list(ENGINES),
+                       help="check only this engine; may be given several times")
+    check.add_argument('--sample', type=int,
+                       help="check this many children at random rather than the engine's default")
+    check.add_argument('--seed', type=int, default=0, help="sampling seed (default: 0)")
+    check.add_argument('--show', type=int, default=5,
+                       help="mismatches printed per engine and indicator (default: 5)")
+    args = parser.parse_args(argv)
+
+    checksum = file_checksum(DATASET_PATH)
+    if checksum is None:
+        print(f"{DATASET_PATH} not found", file=sys.stderr)
+        return 2
+
+    if args.command == 'build':
+        started = time.perf_counter()
+        corpus = build_corpus(load_growth_data(), *corpus_axes())
+        save_corpus(corpus, args.output, checksum)
+        cells = sum(corpus[f"{name}_z"].size for name in INDICATOR_COLUMNS)
+        print(f"Wrote {args.output} ({cells} cells) in {time.perf_counter() - started:.1f}s")
+        return 0
+
+    corpus = load_corpus(args.corpus, checksum)
+    if corpus is None:
+        print(f"{args.corpus} missing or stale; run python golden.py build", file=sys.stderr)
+        return 2
+    positions = covering_children(corpus)
+    total = 0
+    for name in args.engine or list(ENGINES):
+        size = args.sample if args.sample is not None else ENGINES[name][1]
+        total += check_engine(name, corpus, sample_children(positions, size, args.seed), args.show)
+    return 1 if total else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
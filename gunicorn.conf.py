@@ -0,0 +1,53 @@
+"""Gunicorn settings picked up automatically by `gunicorn app:app`.
+
+With preload on (the default) the master imports app.py, and so maps the
+growth tables, once before forking; workers then share those pages instead
+of each loading their own copy. Set NUTRISCOUT_PRELOAD=0 to import the app
+in every worker, e.g. to reload code with HUP.
+
+Each worker toggles its stack sampler (see profiling.py) on SIGUSR2; send
+it to a worker's pid, as the master treats USR2 as an upgrade.
+
+Workers write their metrics to NUTRISCOUT_METRICS_DIR, by default a fresh
+temporary directory per server, so whichever worker answers /metrics
+serves the totals of all of them. It is emptied when the server starts.
+"""
+import os
+import shutil
+import tempfile
+
+preload_app = os.environ.get('NUTRISCOUT_PRELOAD', '1') != '0'
+
+# Set up before the app is imported, so the master and every worker see it
+metrics_dir_created = None
+metrics_on = os.environ.get('NUTRISCOUT_METRICS', '1') != '0'
+if metrics_on and not os.environ.get('NUTRISCOUT_METRICS_DIR'):
+    metrics_dir_created = tempfile.mkdtemp(prefix='nutriscout-metrics-')
+    os.environ['NUTRISCOUT_METRICS_DIR'] = metrics_dir_created
+
+
+def on_starting(server):
+    """Start the server's metrics from zero"""
+    directory = os.environ.get('NUTRISCOUT_METRICS_DIR')
+    if directory:
+        import metrics
+        metrics.clear_directory(directory)
+
+
+def on_exit(server):
+    """Remove the metrics directory made for this server"""
+    if metrics_dir_created:
+        shutil.rmtree(metrics_dir_created, ignore_errors=True)
+
+
+def when_ready(server):
+    """Load the growth tables in the master so preloaded workers inherit them"""
+    if server.cfg.preload_app:
+        import nutriscout
+        nutriscout.get_growth_tables()
+
+
+def post_worker_init(worker):
+    """Let SIGUSR2 toggle the stack sampler, once gunicorn has set up the worker's signals"""
+    import profiling
+    profiling.install_sampler_signal()
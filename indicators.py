@@ -0,0 +1,200 @@
+"""Registry of growth indicators, each declared by its reference table, axis and cutoffs.
+
+An Indicator names the measurement it classifies, the reference table it
+is read against, the axis that table is indexed by (age in months, or
+height for weight-for-height), and its Z-score thresholds and status labels.
+Every age table, whichever file it comes from, is compiled into the same
+ReferenceTables arrays and its cutoffs into the same CutoffTables, so each
+indicator of a child costs one row lookup and a comparison per threshold,
+and columns of children are scored with NumPy whichever indicators are
+asked for.
+
+The three indicators of the original API read dataset.xlsx. The workbook
+has no BMI-for-age, MUAC-for-age or head-circumference-for-age tables, so
+those are read from the CSV files in NUTRISCOUT_INDICATOR_TABLES, named
+after the table (e.g. bmi_for_age.csv), with the columns
+
+    AGE,BOYS_L,BOYS_M,BOYS_S,GIRLS_L,GIRLS_M,GIRLS_S
+
+one row per whole-month age. indicator_tables/ ships the WHO Child Growth
+Standards (2006) LMS parameters for ages 0-60 months, MUAC from 3 months,
+which are scored with the LMS method, restricted beyond +/-3 SD for BMI and
+MUAC as WHO does. BMI takes WHO's recumbent-length table at 24 months. An
+indicator without its table stays registered but answers 404.
+"""
+import bisect
+import csv
+import logging
+import math
+import os
+
+import numpy as np
+
+from lms import RESTRICTED_INDICATORS
+from recommendations import INDICATORS, RECOMMEND_BELOW
+from reference_tables import SEXES, add_lms_tables
+
+logger = logging.getLogger(__name__)
+
+config = {
+    # Directory of the CSV reference tables that dataset.xlsx does not have
+    'TABLE_DIR': os.environ.get('NUTRISCOUT_INDICATOR_TABLES', 'indicator_tables'),
+}
+
+# Axes a reference table can be indexed by
+AGE, HEIGHT = 'age', 'height'
+
+# Table of the height-indexed weight-for-height rows in ReferenceTables
+WFH_TABLE = 'wfh'
+
+
+def bmi(child):
+    return child['weight'] / (child['height'] / 100) ** 2
+
+
+# Measurement of a validated child each indicator classifies, by name;
+# None when the child did not send it
+MEASURES = {
+    'height': lambda child: child['height'],
+    'weight': lambda child: child['weight'],
+    'bmi': bmi,
+    'muac': lambda child: child.get('muac'),
+    'head_circumference': lambda child: child.get('head_circumference'),
+}
+
+
+class Indicator:
+    """One growth indicator.
+
+    name is its id in requests and result columns, key its member in
+    responses. measure is a MEASURES name and table the reference table it
+    is read against along axis. thresholds (ascending) split Z-scores into
+    the bands that labels names. Below RECOMMEND_BELOW the regional advice
+    under advice is given, otherwise normal; indicators without advice, and
+    regions without that advice, give no recommendation. noun is how errors
+    refer to the measurement.
+    """
+
+    def __init__(self, name, key, measure, table, axis, thresholds, labels, advice=None,
+                 normal=None, noun=None):
+        if len(labels) != len(thresholds) + 1:
+            raise ValueError(f"{name} needs one label more than it has thresholds")
+        self.name = name
+        self.key = key
+        self.measure = measure
+        self.table = table
+        self.axis = axis
+        self.thresholds = tuple(thresholds)
+        self.labels = tuple(labels)
+        self.advice = advice
+        self.normal = normal
+        self.noun = noun or measure
+        # Bands at or past the cut get the normal text
+        self.cut = bisect.bisect_left(self.thresholds, RECOMMEND_BELOW) + 1
+
+    def __repr__(self):
+        return f"Indicator({self.name!r})"
+
+
+def builtin(name, indicator, measure, table, axis):
+    """Indicator for one of recommendations.INDICATORS"""
+    key, thresholds, labels, advice, normal = INDICATORS[indicator]
+    return Indicator(name, key, measure, table, axis, thresholds, labels, advice, normal)
+
+
+# Every known indicator by name, in response order. The first three are the
+# original API's, in the order of recommendations.INDICATORS
+REGISTRY = {indicator.name: indicator for indicator in [
+    builtin('height', 0, 'height', 'height', AGE),
+    builtin('weight_for_age', 1, 'weight', 'weight', AGE),
+    builtin('weight_for_height', 2, 'weight', WFH_TABLE, HEIGHT),
+    Indicator('bmi_for_age', "BMI-for-Age", 'bmi', 'bmi_for_age', AGE, [-3, -2, 1, 2, 3],
+              ["Severely Wasted", "Wasted", "Normal", "Possible Risk of Overweight",
+               "Overweight", "Obese"],
+              'Low BMI', "Normal BMI for age", noun='BMI'),
+    Indicator('muac_for_age', "MUAC-for-Age", 'muac', 'muac_for_age', AGE, [-3, -2],
+              ["Severe Acute Malnutrition", "Moderate Acute Malnutrition", "Normal"],
+              'Low MUAC', "Normal arm circumference for age", noun='MUAC'),
+    Indicator('head_circumference_for_age', "Head-Circumference-for-Age", 'head_circumference',
+              'head_circumference_for_age', AGE, [-3, -2, 2],
+              ["Severe Microcephaly", "Microcephaly", "Normal", "Macrocephaly"],
+              noun='head circumference'),
+]}
+
+# Indicators assessed when a request does not list any
+DEFAULT_INDICATORS = ('height', 'weight_for_age', 'weight_for_height')
+
+
+def read_lms_table(path):
+    """(present, values) of a CSV table, as add_lms_tables() takes them.
+
+    Rows whose age is not a whole number of months or whose L, M and S are
+    not all numbers, M and S positive, are left out, so those ages have no
+    data; the first row for an age wins.
+    """
+    rows = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                age = float(row['AGE'])
+                numbers = [float(row[f"{sex.upper()}S_{column}"])
+                           for sex in SEXES for column in 'LMS']
+            except (KeyError, TypeError, ValueError):
+                continue
+            if (math.isfinite(age) and age >= 0 and age == int(age)
+                    and all(map(math.isfinite, numbers))
+                    and min(numbers[1::3] + numbers[2::3]) > 0):
+                rows.setdefault(int(age), numbers)
+
+    present = np.zeros(max(rows, default=-1) + 1, dtype=bool)
+    values = np.zeros((len(SEXES), len(present), 3))
+    for age, numbers in rows.items():
+        present[age] = True
+        values[:, age] = np.reshape(numbers, (len(SEXES), 3))
+    return present, values
+
+
+def load_lms_tables(directory, names):
+    """The tables among names that directory has a CSV file with rows for"""
+    tables = {}
+    for name in names:
+        path = os.path.join(directory, f"{name}.csv")
+        if not os.path.exists(path):
+            continue
+        try:
+            present, values = read_lms_table(path)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            logger.warning("Could not read %s: %s", path, e)
+            continue
+        if present.any():
+            tables[name] = present, values
+        else:
+            logger.warning("%s has no complete rows", path)
+    return tables
+
+
+def add_indicator_tables(tables, directory, registry=REGISTRY):
+    """The workbook's ReferenceTables with the CSV tables in directory appended"""
+    missing = [
+        indicator.table for indicator in registry.values()
+        if indicator.axis == AGE and indicator.table not in tables.indicators
+    ]
+    lms = load_lms_tables(directory, missing)
+    for table in missing:
+        if table not in lms:
+            logger.warning("No %s.csv in %s, %s is unavailable", table, directory, table)
+    return add_lms_tables(tables, lms, RESTRICTED_INDICATORS)
+
+
+def available_indicators(tables, registry=REGISTRY):
+    """Names of the registered indicators whose table ReferenceTables holds"""
+    return frozenset(
+        name for name, indicator in registry.items()
+        if indicator.table == WFH_TABLE or indicator.table in tables.indicators
+    )
+
+
+def table_thresholds(tables, registry=REGISTRY):
+    """Thresholds of every table of ReferenceTables, weight-for-height's last, for CutoffTables"""
+    by_table = {indicator.table: indicator.thresholds for indicator in registry.values()}
+    return [by_table.get(table, ()) for table in tables.indicators + (WFH_TABLE,)]
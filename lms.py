@@ -0,0 +1,182 @@
+import bisect
+import math
+
+import numpy as np
+
+from reference_tables import SEXES
+
+# WHO convention for converting ages in days to months
+DAYS_PER_MONTH = 365.25 / 12
+
+# LMS tables WHO scores with the restricted method beyond +/-3 SD. Weight-for-age
+# is restricted too, but the workbook's median/SD tables have L = 1, where it
+# changes nothing
+RESTRICTED_INDICATORS = ('bmi_for_age', 'muac_for_age')
+
+
+class LMSTable:
+    """WHO LMS (Box-Cox) parameters along an axis, linearly interpolated.
+
+    The axis is age in months or length/height in cm. Every interval keeps
+    its starting L, M, S and their slopes, so evaluating a Z-score costs one
+    bisection plus a handful of floating-point operations.
+    """
+
+    def __init__(self, axis, l, m, s, restricted=False):
+        self.axis = np.ascontiguousarray(axis, dtype=np.float64)
+        self.l = np.ascontiguousarray(l, dtype=np.float64)
+        self.m = np.ascontiguousarray(m, dtype=np.float64)
+        self.s = np.ascontiguousarray(s, dtype=np.float64)
+        self.restricted = restricted
+
+        # Slopes per interval; the last row gets zero slopes so it is usable at t = 0
+        width = np.diff(self.axis)
+        self.dl = np.append(np.diff(self.l) / width, 0.0)
+        self.dm = np.append(np.diff(self.m) / width, 0.0)
+        self.ds = np.append(np.diff(self.s) / width, 0.0)
+
+        self._axis = self.axis.tolist()
+        self._rows = list(zip(
+            self._axis, self.l.tolist(), self.dl.tolist(), self.m.tolist(),
+            self.dm.tolist(), self.s.tolist(), self.ds.tolist()
+        ))
+
+    def covers(self, x):
+        """Whether x lies within the tabulated axis"""
+        return len(self._axis) > 0 and self._axis[0] <= x <= self._axis[-1]
+
+    def covers_all(self, x):
+        """Vectorized covers"""
+        x = np.asarray(x, dtype=np.float64)
+        if len(self._axis) == 0:
+            return np.zeros(x.shape, dtype=bool)
+        return (x >= self._axis[0]) & (x <= self._axis[-1])
+
+    def z_score(self, x, y):
+        """Z-score of measurement y at axis position x, NaN outside the table"""
+        if not self.covers(x):
+            return float('nan')
+        x0, l0, dl, m0, dm, s0, ds = self._rows[bisect.bisect_right(self._axis, x) - 1]
+        t = x - x0
+        return lms_z_score(y, l0 + dl * t, m0 + dm * t, s0 + ds * t, self.restricted)
+
+    def z_scores(self, x, y):
+        """Vectorized z_score over arrays of axis positions and measurements"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        inside = self.covers_all(x)
+
+        i = np.clip(np.searchsorted(self.axis, x, side='right') - 1, 0, max(len(self.axis) - 1, 0))
+        t = x - self.axis[i]
+        with np.errstate(all='ignore'):
+            z = lms_z_scores(
+                y, self.l[i] + self.dl[i] * t, self.m[i] + self.dm[i] * t,
+                self.s[i] + self.ds[i] * t, self.restricted
+            )
+        return np.where(inside, z, np.nan)
+
+
+
+class MedianSDTable(LMSTable):
+    """Median and SD along an axis, both linearly interpolated: (value - median) / sd.
+
+    As LMS parameters that is L = 1 and S = sd / median, which l, m and s
+    hold, but S is not interpolated: between rows the Z-score is the one of
+    the interpolated median and SD, and at a row exactly calculate_z_score's.
+    WHO's restricted method changes nothing with L = 1, so there is none.
+    """
+
+    def __init__(self, axis, median, sd):
+        median = np.asarray(median, dtype=np.float64)
+        self.sd = np.ascontiguousarray(sd, dtype=np.float64)
+        with np.errstate(all='ignore'):
+            s = np.where(median != 0, self.sd / median, 0.0)
+        super().__init__(axis, np.ones_like(median), median, s)
+        self.dsd = np.append(np.diff(self.sd) / np.diff(self.axis), 0.0)
+        self._sd_rows = list(zip(
+            self._axis, self.m.tolist(), self.dm.tolist(), self.sd.tolist(), self.dsd.tolist()
+        ))
+
+    def z_score(self, x, y):
+        """Z-score of measurement y at axis position x, NaN outside the table"""
+        if not self.covers(x):
+            return float('nan')
+        x0, m0, dm, sd0, dsd = self._sd_rows[bisect.bisect_right(self._axis, x) - 1]
+        t = x - x0
+        sd = sd0 + dsd * t
+        if sd == 0:
+            return 0.0
+        return float((y - (m0 + dm * t)) / sd)
+
+    def z_scores(self, x, y):
+        """Vectorized z_score over arrays of axis positions and measurements"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        inside = self.covers_all(x)
+
+        i = np.clip(np.searchsorted(self.axis, x, side='right') - 1, 0, max(len(self.axis) - 1, 0))
+        t = x - self.axis[i]
+        sd = self.sd[i] + self.dsd[i] * t
+        with np.errstate(all='ignore'):
+            z = np.where(sd == 0, 0.0, (y - (self.m[i] + self.dm[i] * t)) / sd)
+        return np.where(inside, z, np.nan)
+
+def _lms_point(k, l, m, s):
+    """Measurement at k SD for the given LMS parameters"""
+    if l == 0:
+        return m * math.exp(k * s)
+    return m * (1 + l * s * k) ** (1 / l)
+
+
+def lms_z_score(y, l, m, s, restricted):
+    """Scalar LMS Z-score; a zero S gives 0.0, as a zero SD does in calculate_z_score"""
+    if s == 0 or m == 0:
+        return 0.0
+    try:
+        if l == 0:
+            z = math.log(y / m) / s
+        else:
+            z = ((y / m) ** l - 1) / (l * s)
+        if restricted and z > 3:
+            sd3 = _lms_point(3, l, m, s)
+            z = 3 + (y - sd3) / (sd3 - _lms_point(2, l, m, s))
+        elif restricted and z < -3:
+            sd3 = _lms_point(-3, l, m, s)
+            z = -3 - (sd3 - y) / (_lms_point(-2, l, m, s) - sd3)
+        return float(z)
+    except (ValueError, ZeroDivisionError, OverflowError, TypeError):
+        return float('nan')
+
+
+def lms_z_scores(y, l, m, s, restricted):
+    """Vectorized lms_z_score"""
+    safe_l = np.where(l == 0, 1.0, l)
+    ratio = y / m
+    z = np.where(l == 0, np.log(ratio) / s, (ratio ** safe_l - 1) / (safe_l * s))
+
+    if restricted:
+        def point(k):
+            return np.where(l == 0, m * np.exp(k * s), m * (1 + safe_l * s * k) ** (1 / safe_l))
+
+        sd2, sd3 = point(2), point(3)
+        sd2_neg, sd3_neg = point(-2), point(-3)
+        z = np.where(z > 3, 3 + (y - sd3) / (sd3 - sd2), z)
+        z = np.where(z < -3, -3 - (sd3_neg - y) / (sd2_neg - sd3_neg), z)
+
+    return np.where((s == 0) | (m == 0), 0.0, z)
+
+
+def compile_lms_tables(tables):
+    """LMS tables per (indicator, sex index) from compiled ReferenceTables rows"""
+    lms_tables = {}
+    for i, indicator in enumerate(tables.indicators):
+        ages = np.flatnonzero(tables.age_present[i])
+        for s in range(len(SEXES)):
+            rows = tables.age_values[i, s, ages]
+            if tables.lms[i]:
+                lms_tables[indicator, s] = LMSTable(
+                    ages, tables.age_l[i, s, ages], rows[:, 0], rows[:, 1], tables.restricted[i]
+                )
+            else:
+                lms_tables[indicator, s] = MedianSDTable(ages, rows[:, 0], rows[:, 1])
+    return lms_tables
@@ -0,0 +1,360 @@
+"""Drive the service with synthetic children and report throughput and latency.
+
+Children are drawn from the growth standards in dataset.xlsx: sex and age
+(whole months) uniformly, height and weight around the median and SD for
+their age, with a --malnourished share drawn around -2.75 SD (stunted,
+wasted or underweight), and a region from REGION_RECOMMENDATIONS.
+
+Load is driven either closed-loop, --concurrency clients each sending its
+next request as soon as the last one is answered, or open-loop at a fixed
+--rps, where latency counts from when a request was due so a stalled server
+is not hidden by the client slowing down. Everything runs locally; with
+--start-server a gunicorn is started for the run and stopped after it.
+
+    python loadtest.py --start-server --workers 4 --concurrency 16 --duration 30
+    python loadtest.py --url http://127.0.0.1:8000 --rps 400 --duration 60 --json
+    python loadtest.py --start-server --batch-size 500 --concurrency 2
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from nutriscout import REGION_RECOMMENDATIONS, get_growth_tables
+from reference_tables import AGE_INDICATORS
+
+RECOMMENDATION_PATH = '/get_nutrition_recommendations'
+BATCH_PATH = '/get_nutrition_recommendations/batch'
+
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+# Z-score around which malnourished children are drawn, and its spread
+MALNOURISHED_Z = -2.75
+MALNOURISHED_SPREAD = 0.75
+
+# Correlation of a child's weight-for-age Z-score with its height-for-age one
+HEIGHT_WEIGHT_CORRELATION = 0.6
+
+def population(size, malnourished=0.1, seed=0):
+    """size request payloads of children drawn from the growth standards.
+
+    Height and weight are drawn for age around the median with the table's
+    SD, their Z-scores correlated by HEIGHT_WEIGHT_CORRELATION. The
+    weight-for-height sheet is not sampled from, as its SD columns do not
+    hold usable SDs. A malnourished share of the children is stunted,
+    underweight, wasted (light for their height) or stunted and wasted, with
+    the affected Z-score drawn around MALNOURISHED_Z instead.
+    """
+    rnd = random.Random(seed)
+    tables = get_growth_tables()
+    present = tables.age_present[:len(AGE_INDICATORS)].all(axis=0)
+    ages = [int(age) for age in np.flatnonzero(present) if age >= 1]
+    regions = sorted(REGION_RECOMMENDATIONS)
+    spread = (1 - HEIGHT_WEIGHT_CORRELATION ** 2) ** 0.5
+    children = []
+    for _ in range(size):
+        gender = rnd.choice(('boy', 'girl'))
+        age = rnd.choice(ages)
+        height_z = rnd.gauss(0, 1)
+        weight_z = HEIGHT_WEIGHT_CORRELATION * height_z + spread * rnd.gauss(0, 1)
+        if rnd.random() < malnourished:
+            condition = rnd.choice(('stunted', 'underweight', 'wasted', 'stunted and wasted'))
+            low = rnd.gauss(MALNOURISHED_Z, MALNOURISHED_SPREAD)
+            if condition == 'stunted':
+                height_z = low
+            elif condition == 'underweight':
+                weight_z = low
+            elif condition == 'wasted':
+                weight_z = height_z + low
+            else:
+                height_z = low
+                weight_z = low + rnd.gauss(MALNOURISHED_Z, MALNOURISHED_SPREAD)
+
+        height_median, height_sd = tables.age_row('height', gender, age)
+        weight_median, weight_sd = tables.age_row('weight', gender, age)
+        children.append({
+            "age": age,
+            "gender": gender,
+            "height": round(max(height_median + height_z * height_sd, 40.0), 1),
+            "weight": round(max(weight_median + weight_z * weight_sd, 1.5), 1),
+            "location": rnd.choice(regions),
+        })
+    return children
+
+
+def request_bodies(children, batch_size=0):
+    """Encoded request bodies: one child each, or batches of batch_size"""
+    if not batch_size:
+        return [json.dumps(child).encode() for child in children]
+    return [
+        json.dumps({"records": children[i:i + batch_size]}).encode()
+        for i in range(0, len(children), batch_size)
+    ]
+
+
+class Client:
+    """One keep-alive HTTP connection, reopened after any connection error"""
+
+    def __init__(self, host, port, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connection = None
+
+    def post(self, path, body):
+        """Status of a POST, or None if the request failed"""
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, self.timeout)
+            self.connection.request(
+                'POST', path, body, {'Content-Type': 'application/json'}
+            )
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+            return None
+
+
+class Recorder:
+    """Latencies and statuses of completed requests, from any thread"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def record(self, latency, status):
+        with self._lock:
+            self.latencies.append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+def run_closed(host, port, path, bodies, concurrency, deadline, limit=None):
+    """Each of concurrency clients sends requests back to back until deadline or limit"""
+    recorder = Recorder()
+    counter = itertools.count()
+
+    def client_loop():
+        client = Client(host, port)
+        while time.perf_counter() < deadline:
+            n = next(counter)
+            if limit is not None and n >= limit:
+                return
+            started = time.perf_counter()
+            status = client.post(path, bodies[n % len(bodies)])
+            recorder.record(time.perf_counter() - started, status)
+
+    threads = [threading.Thread(target=client_loop, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder
+
+
+def run_open(host, port, path, bodies, rps, deadline, clients=64, limit=None):
+    """Send requests at a fixed rate until deadline or limit.
+
+    Requests are due every 1/rps seconds whatever the server does; latency
+    counts from when each was due, so requests that wait for a free client
+    include that wait.
+    """
+    recorder = Recorder()
+    due = queue.Queue()
+
+    def client_loop():
+        client = Client(host, port)
+        while True:
+            item = due.get()
+            if item is None:
+                return
+            scheduled, body = item
+            status = client.post(path, body)
+            recorder.record(time.perf_counter() - scheduled, status)
+
+    threads = [threading.Thread(target=client_loop, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    for n in itertools.count():
+        if limit is not None and n >= limit:
+            break
+        scheduled = start + n / rps
+        if scheduled >= deadline:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        due.put((scheduled, bodies[n % len(bodies)]))
+
+    for _ in threads:
+        due.put(None)
+    for thread in threads:
+        thread.join()
+    return recorder
+
+
+def summarize(recorder, elapsed, children_per_request=1):
+    """Report dict of a finished run"""
+    latencies = np.array(recorder.latencies)
+    completed = len(latencies)
+    ok = recorder.statuses.get(200, 0)
+    report = {
+        "requests": completed,
+        "elapsed_s": elapsed,
+        "throughput_rps": completed / elapsed if elapsed else 0.0,
+        "children_per_s": ok * children_per_request / elapsed if elapsed else 0.0,
+        "statuses": {
+            str(status) if status is not None else "failed": count
+            for status, count in sorted(recorder.statuses.items(), key=lambda item: str(item[0]))
+        },
+        "latency_ms": {},
+    }
+    if completed:
+        values = np.percentile(latencies, PERCENTILES) * 1000
+        report["latency_ms"] = {
+            "mean": float(latencies.mean() * 1000),
+            **{f"p{p:g}": float(value) for p, value in zip(PERCENTILES, values)},
+            "max": float(latencies.max() * 1000),
+        }
+    return report
+
+
+def print_report(report, out=sys.stdout):
+    print(f"{report['requests']} requests in {report['elapsed_s']:.2f}s: "
+          f"{report['throughput_rps']:,.1f} req/s, {report['children_per_s']:,.1f} children/s",
+          file=out)
+    print("statuses: " + ', '.join(f"{s}: {n}" for s, n in report['statuses'].items()), file=out)
+    if report['latency_ms']:
+        print("latency ms: " + '  '.join(
+            f"{name} {value:.2f}" for name, value in report['latency_ms'].items()
+        ), file=out)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(host, port, timeout=30.0, process=None):
+    """Block until the server answers, raising RuntimeError if it never does"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1.0)
+            connection.request('GET', '/cache_stats')
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server at {host}:{port} did not answer within {timeout:.0f}s")
+
+
+def start_server(port, workers, app='app:app'):
+    """gunicorn process serving app on localhost, with this directory's gunicorn.conf.py"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', app],
+        cwd=directory
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000',
+                        help="server to test (default: %(default)s)")
+    parser.add_argument('--start-server', action='store_true',
+                        help="start gunicorn on a free local port for the run, ignoring --url")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="gunicorn workers with --start-server (default: one per CPU)")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--concurrency', type=int, default=8,
+                      help="closed-loop clients (default: 8)")
+    load.add_argument('--rps', type=float, help="open-loop request rate instead")
+    parser.add_argument('--clients', type=int, default=64,
+                        help="connections used to keep up with --rps (default: 64)")
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help="seconds of load (default: 10)")
+    parser.add_argument('--requests', type=int, help="stop after this many requests")
+    parser.add_argument('--warmup', type=float, default=1.0,
+                        help="seconds of unrecorded load first (default: 1)")
+    parser.add_argument('--batch-size', type=int, default=0,
+                        help="send batches of this many children to the batch endpoint")
+    parser.add_argument('--population', type=int, default=20000,
+                        help="distinct children generated (default: 20000)")
+    parser.add_argument('--malnourished', type=float, default=0.1,
+                        help="share of malnourished children (default: 0.1)")
+    parser.add_argument('--seed', type=int, default=0, help="population seed (default: 0)")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    children = population(args.population, args.malnourished, args.seed)
+    bodies = request_bodies(children, args.batch_size)
+    path = BATCH_PATH if args.batch_size else RECOMMENDATION_PATH
+
+    server = None
+    if args.start_server:
+        host, port = '127.0.0.1', free_port()
+        server = start_server(port, args.workers)
+    else:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+
+    try:
+        wait_for_server(host, port, process=server)
+
+        def run(seconds, limit=None):
+            deadline = time.perf_counter() + seconds
+            if args.rps:
+                return run_open(host, port, path, bodies, args.rps, deadline, args.clients, limit)
+            return run_closed(host, port, path, bodies, args.concurrency, deadline, limit)
+
+        if args.warmup > 0:
+            run(args.warmup)
+        started = time.perf_counter()
+        recorder = run(args.duration, args.requests)
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = summarize(recorder, elapsed, args.batch_size or 1)
+    report["config"] = {
+        "path": path,
+        "mode": f"rps={args.rps:g}" if args.rps else f"concurrency={args.concurrency}",
+        "batch_size": args.batch_size,
+        "malnourished": args.malnourished,
+        "server_workers": args.workers if args.start_server else None,
+    }
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+    return 0 if set(recorder.statuses) <= {200} else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,555 @@
+"""Request metrics of the service, exposed in the Prometheus text format.
+
+Each stage of a request (parsing the body, validation, the result table and
+response cache lookups, the age table lookups, the nearest-height search and
+rendering the response) is timed into a histogram, along with the whole
+request. Counters track responses by status, errors by kind, the fields
+that fail validation and the status band every scored child falls in.
+
+Recording a sample only appends it to a queue; queues are added up in bulk
+every few thousand samples and when /metrics is read, so a fully timed
+request costs a few microseconds. NullMetrics takes the place of Metrics
+when they are turned off.
+
+Metrics are recorded in each process. With a snapshot directory, every
+process also writes its values there about once a second, and /metrics adds
+up all the snapshots. Then any worker behind a shared listener, as under
+gunicorn, answers a scrape with the totals of the whole server.
+gunicorn.conf.py gives each server its own directory. Other servers with
+several workers, e.g. uvicorn --workers, need NUTRISCOUT_METRICS_DIR pointed
+at an empty directory.
+"""
+import itertools
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+import numpy as np
+
+from nutriscout import INDICATOR_COLUMNS
+from recommendations import INDICATORS
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bucket upper bounds in seconds: stages run from about a microsecond
+# (a table lookup) up, whole requests from about a hundred
+STAGE_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2, 0.1
+)
+REQUEST_BUCKETS = (
+    1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 1.0, 2.5, 10.0
+)
+
+# Status labels of each indicator, by band
+STATUS_LABELS = tuple(labels for _, _, labels, _, _ in INDICATORS)
+
+# Queued samples that make a counter or histogram add them up
+FLUSH_SIZE = 4096
+
+# Seconds between the snapshots a process writes to a snapshot directory
+SNAPSHOT_INTERVAL = 1.0
+
+# Kind of error counted for each error status of a child or request
+ERROR_KINDS = {
+    400: 'invalid_input',
+    404: 'no_reference_data',
+    413: 'too_large',
+    500: 'calculation',
+}
+
+
+def escape(value):
+    """Label value escaped for the text format"""
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def drain(queue):
+    """Remove and return everything queued so far, safe against concurrent appends"""
+    return [queue.popleft() for _ in range(len(queue))]
+
+
+class Counter:
+    """Monotonic count per combination of label values.
+
+    inc() only appends to the queue of its label values, which is summed into
+    the total once it holds FLUSH_SIZE entries or when the counter is read.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        self.add(label_values, amount)
+
+    def add(self, label_values, amount=1):
+        """inc() with the label values as a tuple"""
+        series = self._series.get(label_values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(label_values, [deque(), 0])
+        series[0].append(amount)
+        if len(series[0]) >= FLUSH_SIZE:
+            self.flush(series)
+
+    def flush(self, series):
+        with self._lock:
+            series[1] += sum(drain(series[0]))
+
+    def values(self):
+        """Total per tuple of label values, everything queued included"""
+        with self._lock:
+            keys = list(self._series)
+        for label_values in keys:
+            self.flush(self._series[label_values])
+        return {label_values: self._series[label_values][1] for label_values in keys}
+
+    @staticmethod
+    def merge(value, other):
+        """Two processes' values of one series added up"""
+        return value + other
+
+    def samples(self, values):
+        for label_values in sorted(values):
+            yield self.name, format_labels(self.labels, label_values), values[label_values]
+
+
+class Histogram:
+    """Observations counted into fixed buckets, per combination of label values.
+
+    Like Counter.inc(), observe() only queues the value; queued values are
+    binned with NumPy thousands at a time.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = np.array(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        self.add(label_values, value)
+
+    def add(self, label_values, value):
+        """observe() with the label values as a tuple"""
+        series = self._series.get(label_values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(
+                    label_values, [deque(), np.zeros(len(self.buckets) + 1, dtype=np.int64), 0.0]
+                )
+        series[0].append(value)
+        if len(series[0]) >= FLUSH_SIZE:
+            self.flush(series)
+
+    def flush(self, series):
+        with self._lock:
+            values = drain(series[0])
+            if values:
+                # A value equal to a bound belongs to that bucket ("le")
+                series[1] += np.bincount(
+                    np.searchsorted(self.buckets, values, side='left'),
+                    minlength=len(self.buckets) + 1
+                )
+                series[2] += math.fsum(values)
+
+    def values(self):
+        """(bucket counts, sum) per tuple of label values, everything queued included"""
+        with self._lock:
+            keys = list(self._series)
+        values = {}
+        for label_values in keys:
+            series = self._series[label_values]
+            self.flush(series)
+            values[label_values] = (series[1].tolist(), series[2])
+        return values
+
+    @staticmethod
+    def merge(value, other):
+        """Two processes' values of one series added up"""
+        return [a + b for a, b in zip(value[0], other[0])], value[1] + other[1]
+
+    def samples(self, values):
+        names = self.labels + ('le',)
+        bounds = [repr(bound) for bound in self.buckets.tolist()] + ['+Inf']
+        for label_values in sorted(values):
+            counts, total = values[label_values]
+            cumulative = 0
+            for le, count in zip(bounds, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", format_labels(names, label_values + (le,)), cumulative
+            labels = format_labels(self.labels, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    """Metrics rendered together, plus collectors read at scrape time.
+
+    A collector returns (name, kind, help, value) tuples for values that are
+    kept elsewhere, such as the response cache counters.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=STAGE_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self, collector):
+        self.collectors.append(collector)
+
+    def snapshot(self):
+        """This process's metric values and collector readings, as JSON-ready data"""
+        return {
+            'pid': os.getpid(),
+            'metrics': {
+                metric.name: [[list(label_values), value]
+                              for label_values, value in metric.values().items()]
+                for metric in self.metrics
+            },
+            'collected': [list(reading) for collector in self.collectors
+                          for reading in collector()],
+        }
+
+    def render(self, snapshots=None):
+        """All metrics in the Prometheus text exposition format.
+
+        snapshots, by default this process's own, are added up series by
+        series. Gauges are only taken from snapshots not marked "exited".
+        """
+        if snapshots is None:
+            snapshots = [self.snapshot()]
+        lines = []
+        for metric in self.metrics:
+            values = {}
+            for snapshot in snapshots:
+                for label_values, value in snapshot['metrics'].get(metric.name, ()):
+                    label_values = tuple(label_values)
+                    if label_values in values:
+                        value = metric.merge(values[label_values], value)
+                    values[label_values] = value
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples(values):
+                lines.append(f"{name}{labels} {format_value(value)}")
+
+        collected = {}
+        for snapshot in snapshots:
+            for name, kind, help, value in snapshot['collected']:
+                if kind == 'gauge' and snapshot.get('exited'):
+                    value = 0
+                if name in collected:
+                    collected[name][2] += value
+                else:
+                    collected[name] = [kind, help, value]
+        for name, (kind, help, value) in collected.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_directory(path):
+    """Remove the snapshots in a snapshot directory, e.g. when a server starts"""
+    try:
+        names = os.listdir(path)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith(('.json', '.tmp')):
+            try:
+                os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+
+
+class SnapshotDirectory:
+    """Snapshots of a Registry written by every process of a server to one directory.
+
+    Each process writes its own <pid>-<token>.json, replaced atomically,
+    every interval seconds from a background thread and whenever it renders.
+    The files of exited workers stay, so their counts still add to the
+    totals after a restart; clear_directory() empties it when the server
+    starts.
+    """
+
+    def __init__(self, path, registry, interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.registry = registry
+        self.interval = interval
+        self._pid = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start writing this process's snapshots, once per process (forked workers included)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.path, exist_ok=True)
+            self._pid = os.getpid()
+            self._file = os.path.join(self.path, f"{self._pid}-{uuid.uuid4().hex[:8]}.json")
+            threading.Thread(target=self._run, name='metrics-snapshots', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except Exception:
+                logger.exception("Could not write a metrics snapshot to %s", self.path)
+
+    def write(self):
+        """Write this process's snapshot now"""
+        self.start()
+        data = json.dumps(self.registry.snapshot())
+        with self._lock:
+            temporary = self._file + '.tmp'
+            with open(temporary, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temporary, self._file)
+
+    def read(self):
+        """Every process's latest snapshot, with "exited" set for processes that are gone"""
+        snapshots = []
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.path, name), encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                # Removed by clear_directory() since it was listed
+                continue
+            snapshot['exited'] = not process_exists(snapshot['pid'])
+            snapshots.append(snapshot)
+        return snapshots
+
+
+class StageTimer:
+    """Times the consecutive stages of one request to an endpoint.
+
+    Each lap() records the time since the previous one (or since the timer
+    was created) under the given stage name.
+    """
+
+    __slots__ = ('histogram', 'endpoint', 'started', 'last')
+
+    def __init__(self, histogram, endpoint):
+        self.histogram = histogram
+        self.endpoint = endpoint
+        self.started = self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.histogram.add((self.endpoint, stage), now - self.last)
+        self.last = now
+
+
+class Metrics:
+    """The service's metrics, recorded by the endpoint handlers.
+
+    With a directory, rendering adds up the snapshots every process of the
+    server writes there (see SnapshotDirectory).
+    """
+
+    enabled = True
+
+    def __init__(self, directory=None):
+        self.registry = Registry()
+        self.snapshots = SnapshotDirectory(directory, self.registry) if directory else None
+        self.stage_seconds = self.registry.histogram(
+            'nutriscout_stage_duration_seconds', "Time spent in each stage of a request",
+            ('endpoint', 'stage'), STAGE_BUCKETS
+        )
+        self.request_seconds = self.registry.histogram(
+            'nutriscout_request_duration_seconds', "Time to handle a request",
+            ('endpoint',), REQUEST_BUCKETS
+        )
+        self.responses = self.registry.counter(
+            'nutriscout_responses_total', "Responses by endpoint and HTTP status",
+            ('endpoint', 'status')
+        )
+        self.errors = self.registry.counter(
+            'nutriscout_errors_total', "Error responses and batch records by endpoint and kind",
+            ('endpoint', 'kind')
+        )
+        self.invalid_fields = self.registry.counter(
+            'nutriscout_invalid_fields_total', "Input fields that failed validation",
+            ('field',)
+        )
+        self.classifications = self.registry.counter(
+            'nutriscout_classifications_total',
+            "Scored children by status on each indicator, cached responses included",
+            INDICATOR_COLUMNS
+        )
+        self.indicator_statuses = self.registry.counter(
+            'nutriscout_indicator_statuses_total',
+            "Statuses of the indicators of requests that list their indicators",
+            ('indicator', 'status')
+        )
+        # Label values of every combination of status bands
+        self._band_labels = {
+            bands: tuple(labels[band] for labels, band in zip(STATUS_LABELS, bands))
+            for bands in itertools.product(*(range(len(labels)) for labels in STATUS_LABELS))
+        }
+        self.exceptions = self.registry.counter(
+            'nutriscout_exceptions_total', "Unexpected exceptions by endpoint and type",
+            ('endpoint', 'exception')
+        )
+
+    def timer(self, endpoint):
+        """StageTimer for one request to endpoint"""
+        if self.snapshots is not None:
+            self.snapshots.start()
+        return StageTimer(self.stage_seconds, endpoint)
+
+    def response(self, status, timer):
+        """Count a response and record the total time of its request"""
+        self.request_seconds.add((timer.endpoint,), time.perf_counter() - timer.started)
+        self.responses.add((timer.endpoint, status))
+
+    def error(self, endpoint, status, fields=None, count=1):
+        """Count count errors answered with status, and the invalid fields behind them"""
+        self.errors.inc(endpoint, ERROR_KINDS.get(status, 'other'), amount=count)
+        for field in fields or ():
+            self.invalid_fields.inc(field)
+
+    def exception(self, endpoint, error):
+        """Count an unexpected exception that became a server error"""
+        self.errors.inc(endpoint, 'server_error')
+        self.exceptions.inc(endpoint, type(error).__name__)
+
+    def classified(self, bands):
+        """Count one child's (height, weight-for-age, weight-for-height) status bands"""
+        self.classifications.add(self._band_labels[tuple(bands)])
+
+    def assessed(self, results):
+        """Count the statuses of one child's indicator_scores() results.
+
+        An assessment of all the original indicators is counted in
+        classifications as well.
+        """
+        bands = {}
+        for indicator, _, band in results:
+            self.indicator_statuses.add((indicator.name, indicator.labels[band]))
+            bands[indicator.name] = band
+        if all(name in bands for name in INDICATOR_COLUMNS):
+            self.classified([bands[name] for name in INDICATOR_COLUMNS])
+
+    def scored(self, endpoint, scores):
+        """Count the status bands and the errors of every row of score_many() columns"""
+        bands = np.column_stack([scores[f"{name}_band"] for name in INDICATOR_COLUMNS])
+        rows, counts = np.unique(bands[bands[:, 0] >= 0], axis=0, return_counts=True)
+        for row, count in zip(rows.tolist(), counts.tolist()):
+            self.classifications.add(self._band_labels[tuple(row)], count)
+
+        statuses, counts = np.unique(scores['status'], return_counts=True)
+        for status, count in zip(statuses.tolist(), counts.tolist()):
+            if status != 200:
+                self.error(endpoint, status, count=count)
+        for errors in scores['errors']:
+            for field in errors or ():
+                self.invalid_fields.inc(field)
+
+    def render(self):
+        if self.snapshots is None:
+            return self.registry.render()
+        self.snapshots.write()
+        return self.registry.render(self.snapshots.read())
+
+
+class NullTimer:
+    """StageTimer that records nothing"""
+
+    __slots__ = ()
+
+    def lap(self, stage):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class NullMetrics:
+    """Metrics turned off: every call is a no-op and there is nothing to render"""
+
+    enabled = False
+
+    def timer(self, endpoint):
+        return NULL_TIMER
+
+    def response(self, status, timer):
+        pass
+
+    def error(self, endpoint, status, fields=None, count=1):
+        pass
+
+    def exception(self, endpoint, error):
+        pass
+
+    def classified(self, bands):
+        pass
+
+    def assessed(self, results):
+        pass
+
+    def scored(self, endpoint, scores):
+        pass
+
+    def render(self):
+        return None
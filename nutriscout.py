@@ -0,0 +1,1072 @@
+"""Scoring core of the nutrition recommendation service, free of any web framework.
+
+Everything behind /get_nutrition_recommendations lives here: loading the
+growth tables, validating a child's measurements, the Z-scores and their
+classification, and the regional recommendations. The Flask and ASGI apps,
+score_bulk.py and the build tools all call into it. It can also be embedded
+directly, e.g. in an ETL worker:
+
+    import nutriscout
+
+    nutriscout.score({"age": 24, "gender": "girl", "height": 82.5,
+                      "weight": 10.1, "location": "Central"})
+
+    nutriscout.score_many({"age": ages, "gender": genders, "height": heights,
+                           "weight": weights, "location": locations})
+
+score() returns the same dict the endpoint sends and raises ScoringError
+where the endpoint would answer with an error. score_many() scores columns
+of any length at once with NumPy and returns columns of results. classify()
+and score_many(..., z_scores=False) give the statuses alone, comparing the
+measurements with precomputed cutoffs in cm and kg (see cutoffs.py).
+assess() scores any subset of the indicators registered in indicators.py,
+BMI-for-age, MUAC-for-age and head circumference-for-age included, and
+score_many(..., indicators=[...]) scores columns of children on them.
+"""
+import bisect
+import logging
+import os
+
+import numpy as np
+
+import indicators
+from cutoffs import CutoffTables
+from indicators import (
+    AGE, DEFAULT_INDICATORS, MEASURES, REGISTRY, add_indicator_tables, available_indicators,
+    table_thresholds
+)
+from lms import DAYS_PER_MONTH, compile_lms_tables, lms_z_score, lms_z_scores
+from recommendations import INDICATORS, RecommendationStore
+from result_table import load_result_table
+from validation import (
+    CONSTRAINT, INVALID, MISSING, MISSING_MESSAGE, Choice, Number, Schema, Subset, field_errors,
+    present, summary
+)
+from reference_tables import (
+    SEXES, compile_reference_tables, file_checksum, load_reference_tables, sex_index
+)
+
+logger = logging.getLogger(__name__)
+
+AGE_MODES = ('months', 'continuous')
+WFH_MODES = ('nearest', 'interpolated')
+
+config = {
+    # Default age handling when a child does not set "age_mode": "months" looks
+    # up whole-month rows, "continuous" interpolates LMS parameters between them
+    'AGE_MODE': os.environ.get('NUTRISCOUT_AGE_MODE', 'months'),
+    # Default weight-for-height lookup when a child does not set "wfh_mode":
+    # "nearest" snaps to the closest table row, "interpolated" reads the dense grid
+    'WFH_MODE': os.environ.get('NUTRISCOUT_WFH_MODE', 'nearest'),
+    # Optional JSON file of regional recommendations, reloaded when it changes
+    'RECOMMENDATIONS_PATH': os.environ.get('NUTRISCOUT_RECOMMENDATIONS'),
+    # Optional result table built by build_result_table.py, serving whole-month
+    # ages and nearest-row weight-for-height on the 0.1 cm / 0.1 kg grid
+    'RESULT_TABLE_PATH': os.environ.get('NUTRISCOUT_RESULT_TABLE'),
+    # "1" rejects fractional ages in months mode; by default they are
+    # truncated to whole months, as the API always did
+    'STRICT_AGE': os.environ.get('NUTRISCOUT_STRICT_AGE', '0') == '1',
+}
+
+# Source workbook and the compiled artifact built from it by build_tables.py
+DATASET_PATH = "dataset.xlsx"
+TABLES_PATH = "reference_tables.npz"
+RESULT_TABLE_PATH = "result_table.npz"
+
+# Column name prefixes of score_many() results, in the order of INDICATORS
+INDICATOR_COLUMNS = ('height', 'weight_for_age', 'weight_for_height')
+
+
+class ScoringError(Exception):
+    """A child that cannot be scored, with the HTTP status the API answers with.
+
+    errors maps each invalid field to its message when the input failed
+    validation.
+    """
+
+    def __init__(self, message, status, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors
+
+
+def load_growth_data():
+    """Load and prepare all growth standard datasets with proper type conversion"""
+    # pandas/openpyxl are only needed here, when the tables artifact has to be rebuilt
+    import pandas as pd
+
+    # Load height-for-age data
+    height_data = pd.read_excel(DATASET_PATH, header=None, skiprows=3, nrows=61)
+    height_data.columns = ['AGE', 'BOYS_MEDIAN_HEIGHT', 'BOYS_SD_HEIGHT',
+                         'GIRLS_MEDIAN_HEIGHT', 'GIRLS_SD_HEIGHT']
+
+
+    # Load weight-for-age data
+    weight_data = pd.read_excel(DATASET_PATH, header=None, skiprows=67, nrows=61)
+    weight_data.columns = ['AGE', 'BOYS_MEDIAN_WEIGHT', 'BOYS_SD_WEIGHT',
+                        'GIRLS_MEDIAN_WEIGHT', 'GIRLS_SD_WEIGHT']
+
+    # Load weight-for-height data
+    wfh_data = pd.read_excel(DATASET_PATH, skiprows=132, nrows=101)
+
+    # Split into gender-specific tables properly
+    # Columns: HEIGHT, GIRLS_MEDIAN, GIRLS_SD, BOYS_MEDIAN, BOYS_SD
+    wfh_girls = wfh_data.iloc[:, 0:3].copy()
+    wfh_girls.columns = ['HEIGHT', 'GIRLS_MEDIAN_WEIGHT', 'GIRLS_SD_WEIGHT']
+
+    wfh_boys = wfh_data.iloc[:, [0, 3, 4]].copy()
+    wfh_boys.columns = ['HEIGHT', 'BOYS_MEDIAN_WEIGHT', 'BOYS_SD_WEIGHT']
+
+
+    # Convert all numeric columns to float and handle missing values
+    for df in [height_data, weight_data, wfh_girls, wfh_boys]:
+        for col in df.columns[1:]:  # Skip the first column (AGE/HEIGHT)
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+
+    return {
+        'height': height_data,
+        'weight': weight_data,
+        'wfh_girls': wfh_girls,
+        'wfh_boys': wfh_boys
+    }
+
+
+def load_growth_tables():
+    """Load compiled growth tables, reading the workbook only if the artifact is missing or stale.
+
+    The artifact is memory-mapped read-only, so all gunicorn workers share
+    one copy of the weight-for-height tables through the page cache. The
+    CSV tables of indicators.py are appended to the age tables.
+    """
+    tables = load_reference_tables(TABLES_PATH, file_checksum(DATASET_PATH), mmap=True)
+    if tables is None:
+        logger.warning("%s missing or stale, compiling tables from %s", TABLES_PATH, DATASET_PATH)
+        tables = compile_reference_tables(load_growth_data())
+    return add_indicator_tables(tables, indicators.config['TABLE_DIR'])
+
+
+_growth_tables = None
+
+
+def get_growth_tables():
+    """Growth tables for serving, loaded on first use rather than at import"""
+    global _growth_tables
+    if _growth_tables is None:
+        _growth_tables = load_growth_tables()
+    return _growth_tables
+
+
+_lms_tables = None
+
+
+def get_lms_tables():
+    """LMS tables for continuous-age scoring, compiled from the growth tables on first use"""
+    global _lms_tables
+    if _lms_tables is None:
+        _lms_tables = compile_lms_tables(get_growth_tables())
+    return _lms_tables
+
+
+_cutoff_tables = None
+
+
+def get_cutoff_tables():
+    """Status cutoffs in cm and kg for the growth tables, compiled on first use"""
+    global _cutoff_tables
+    if _cutoff_tables is None:
+        tables = get_growth_tables()
+        _cutoff_tables = CutoffTables(tables, table_thresholds(tables))
+    return _cutoff_tables
+
+
+_result_table = None
+
+
+def get_result_table():
+    """Precomputed result table if one is configured and current, loaded on first use"""
+    global _result_table
+    path = config['RESULT_TABLE_PATH']
+    if not path:
+        return None
+    if _result_table is None:
+        _result_table = load_result_table(path, file_checksum(DATASET_PATH), mmap=True)
+        if _result_table is None:
+            logger.warning("%s missing or stale, scoring every request live", path)
+            _result_table = False
+    return _result_table or None
+
+
+REGION_RECOMMENDATIONS = {
+    "Central": {
+        "Stunting": "Provide a balanced diet rich in proteins (eggs, fish, beans), energy-giving foods (sweet potatoes, matoke), and vegetables for vitamins.",
+        "Wasting": "Ensure high-energy foods like full-fat milk, millet porridge, and groundnut paste. Seek medical help for severe cases.",
+        "Underweight": "Increase meal frequency and include foods like avocado, peanut sauce, and fresh fruits. If no improvement, consult a nutritionist.",
+        "Low BMI": "Add an extra meal or snack a day of energy-dense foods such as matoke with groundnut sauce, avocado, and full-fat milk. Weigh the child monthly until BMI improves.",
+        "Low MUAC": "Refer the child to a health centre for screening and therapeutic feeding. Meanwhile give full-fat milk, groundnut paste, and enriched porridge several times a day."
+    },
+    "Western": {
+        "Stunting": "Include milk, millet bread, beef, and leafy greens. Regular checkups are recommended to monitor growth.",
+        "Wasting": "Give high-energy foods such as millet porridge, ghee, roasted groundnuts, and milk. Seek medical care for severe cases.",
+        "Underweight": "Increase portions of protein-rich foods (beans, chicken) and serve meals with avocado. Encourage fresh milk consumption.",
+        "Low BMI": "Serve extra portions of millet bread with ghee, beef, and fresh milk. Weigh the child monthly until BMI improves.",
+        "Low MUAC": "Refer the child to a health centre for screening and therapeutic feeding. Meanwhile give milk, ghee, and millet porridge several times a day."
+    },
+    "Eastern": {
+        "Stunting": "Encourage millet porridge with groundnut paste, rice with fish, and leafy greens. Seek medical assessment if stunting persists.",
+        "Wasting": "Provide fish, energy-rich porridge with milk, and fresh fruit. Severe cases require immediate medical attention.",
+        "Underweight": "Increase portions of rice, beans, and cassava, and add roasted groundnuts. Fresh fruits and vegetables improve overall health.",
+        "Low BMI": "Add an extra meal of rice with fish, cassava, and roasted groundnuts each day. Weigh the child monthly until BMI improves.",
+        "Low MUAC": "Refer the child to a health centre for screening and therapeutic feeding. Meanwhile give fish, porridge with milk, and groundnut paste several times a day."
+    },
+    "Northern": {
+        "Stunting": "Give nutrient-rich foods like sorghum bread, goat meat, and leafy greens. Periodic health checkups are essential.",
+        "Wasting": "Include sorghum porridge with groundnut paste, dry fish, and sim-sim. Seek urgent medical attention for severe malnutrition.",
+        "Underweight": "Increase meals with protein (goat meat, beans) and energy foods (cassava, avocado). If weight gain is slow, seek medical advice.",
+        "Low BMI": "Give extra meals of sorghum bread with sim-sim paste and goat meat. Weigh the child monthly until BMI improves.",
+        "Low MUAC": "Refer the child to a health centre urgently for screening and therapeutic feeding. Meanwhile give sorghum porridge with groundnut paste and sim-sim several times a day."
+    }
+}
+
+recommendation_store = RecommendationStore(
+    REGION_RECOMMENDATIONS, config['RECOMMENDATIONS_PATH']
+)
+
+
+def safe_float_conversion(value):
+    """Safely convert value to float, return 0 if conversion fails"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def calculate_z_score(value, median, sd):
+    """Safe Z-score calculation with type checking"""
+    try:
+        value = safe_float_conversion(value)
+        median = safe_float_conversion(median)
+        sd = safe_float_conversion(sd)
+
+        if sd == 0:
+            return 0.0
+        return (value - median) / sd
+    except:
+        return 0.0
+
+
+def get_closest_height_data(height, gender):
+    """Find closest height with robust type handling"""
+    try:
+        sex = 'girl' if gender == 'girl' else 'boy'
+        height = safe_float_conversion(height)
+
+        closest, median, sd = get_growth_tables().closest_height_row(sex_index(sex), height)
+        return {
+            'HEIGHT': closest,
+            f"{sex.upper()}S_MEDIAN_WEIGHT": median,
+            f"{sex.upper()}S_SD_WEIGHT": sd
+        }
+    except Exception as e:
+        raise ValueError(f"Error finding closest height: {str(e)}")
+
+
+def calculate_z_scores(values, medians, sds):
+    """Vectorized calculate_z_score over float arrays"""
+    with np.errstate(all='ignore'):
+        z_scores = (values - medians) / sds
+    return np.where(sds == 0, 0.0, z_scores)
+
+
+def age_z_score(indicator, gender, age, value, age_mode):
+    """Z-score of a measurement for age, or None if the table has no data at that age"""
+    if age_mode == 'continuous':
+        table = get_lms_tables()[indicator, sex_index(gender)]
+        if not table.covers(age):
+            return None
+        return table.z_score(age, value)
+
+    tables = get_growth_tables()
+    row = tables.age_row(indicator, gender, age)
+    if row is None:
+        return None
+    i = tables.indicators.index(indicator)
+    if tables.lms[i]:
+        return lms_z_score(value, *row, tables.restricted[i])
+    return calculate_z_score(value, *row)
+
+
+def age_z_scores(indicator, sexes, ages, values, continuous):
+    """Vectorized age_z_score, returning (z_scores, found) arrays"""
+    z_scores = np.zeros(len(ages))
+    found = np.zeros(len(ages), dtype=bool)
+
+    months = ~continuous
+    if months.any():
+        tables = get_growth_tables()
+        i = tables.indicators.index(indicator)
+        *rows, found[months] = tables.age_rows(
+            indicator, sexes[months], ages[months].astype(np.int64)
+        )
+        if tables.lms[i]:
+            with np.errstate(all='ignore'):
+                z_scores[months] = lms_z_scores(values[months], *rows, tables.restricted[i])
+        else:
+            z_scores[months] = calculate_z_scores(values[months], *rows)
+
+    for s in np.unique(sexes[continuous]):
+        rows = continuous & (sexes == s)
+        z_scores[rows] = get_lms_tables()[indicator, s].z_scores(ages[rows], values[rows])
+        found[rows] = get_lms_tables()[indicator, s].covers_all(ages[rows])
+
+    return z_scores, found
+
+
+def wfh_z_score(gender, height, weight, wfh_mode):
+    """Weight-for-height Z-score from the nearest table row or the interpolated grid"""
+    if wfh_mode == 'interpolated':
+        median, sd = get_growth_tables().interpolated_height_row(sex_index(gender), height)
+        return calculate_z_score(weight, median, sd)
+
+    wfh_row = get_closest_height_data(height, gender)
+    return calculate_z_score(
+        weight,
+        wfh_row[f"{gender.upper()}S_MEDIAN_WEIGHT"],
+        wfh_row[f"{gender.upper()}S_SD_WEIGHT"]
+    )
+
+
+def wfh_z_scores(sexes, heights, weights, interpolated):
+    """Vectorized wfh_z_score, returning (z_scores, found) arrays"""
+    medians = np.zeros(len(heights))
+    sds = np.zeros(len(heights))
+    found = np.zeros(len(heights), dtype=bool)
+    tables = get_growth_tables()
+
+    nearest = ~interpolated
+    if nearest.any():
+        _, medians[nearest], sds[nearest], found[nearest] = tables.closest_height_rows(
+            sexes[nearest], heights[nearest]
+        )
+    if interpolated.any():
+        medians[interpolated], sds[interpolated], found[interpolated] = (
+            tables.interpolated_height_rows(sexes[interpolated], heights[interpolated])
+        )
+
+    return calculate_z_scores(weights, medians, sds), found
+
+
+def z_score_bands(thresholds, z_scores):
+    """Status bands of unrounded Z-scores against thresholds, rounded as the API rounds them"""
+    return np.searchsorted(thresholds, round_z_scores(z_scores), side='right')
+
+
+def age_bands(indicator, sexes, ages, values, continuous):
+    """Status bands of measurements for age without their Z-scores, returning (bands, found).
+
+    Whole-month ages are compared with the cutoffs in cm and kg; continuous
+    ages and rows without usable cutoffs go through the Z-scores.
+    """
+    bands = np.zeros(len(ages), dtype=np.int8)
+    found = np.zeros(len(ages), dtype=bool)
+    exact = np.zeros(len(ages), dtype=bool)
+    cutoffs = get_cutoff_tables()
+
+    months = ~continuous
+    if months.any():
+        bands[months], found[months], exact[months] = cutoffs.age_bands(
+            indicator, sexes[months], ages[months], values[months]
+        )
+    rest = continuous | (found & ~exact)
+    if rest.any():
+        z_scores, found[rest] = age_z_scores(
+            indicator, sexes[rest], ages[rest], values[rest], continuous[rest]
+        )
+        thresholds = cutoffs.thresholds[cutoffs.tables.indicators.index(indicator)]
+        bands[rest] = z_score_bands(thresholds, z_scores)
+    return bands, found
+
+
+def wfh_bands(sexes, heights, weights, interpolated):
+    """Weight-for-height counterpart of age_bands, cutoffs serving the nearest-row lookups"""
+    bands = np.zeros(len(heights), dtype=np.int8)
+    found = np.zeros(len(heights), dtype=bool)
+    exact = np.zeros(len(heights), dtype=bool)
+
+    nearest = ~interpolated
+    if nearest.any():
+        bands[nearest], found[nearest], exact[nearest] = get_cutoff_tables().wfh_bands(
+            sexes[nearest], heights[nearest], weights[nearest]
+        )
+    rest = interpolated | (found & ~exact)
+    if rest.any():
+        z_scores, found[rest] = wfh_z_scores(
+            sexes[rest], heights[rest], weights[rest], interpolated[rest]
+        )
+        bands[rest] = z_score_bands(get_cutoff_tables().thresholds[-1], z_scores)
+    return bands, found
+
+
+def classify_growth(z_score, thresholds, labels):
+    """Classify growth status based on Z-score thresholds"""
+    for i, threshold in enumerate(thresholds):
+        if z_score < threshold:
+            return labels[i]
+    return labels[-1]
+
+
+# Child fields in the order they are checked; the first failing field
+# (after any missing or unparsable ones) gives the "error" message
+CHILD_SCHEMA = Schema([
+    Choice('age_mode', AGE_MODES, "age_mode must be 'months' or 'continuous'",
+           required=False, default=lambda: config['AGE_MODE']),
+    Choice('wfh_mode', WFH_MODES, "wfh_mode must be 'nearest' or 'interpolated'",
+           required=False, default=lambda: config['WFH_MODE']),
+    # The upper bound is checked after months are truncated
+    # Strings hold whole months, as int() read them; fractional ages are sent as numbers
+    Number('age', "Age must be between 1-60 months", minimum=1, required=False,
+           integer_strings=True, invalid="Age must be a number of months"),
+    Number('age_days', "age_days must be between 1-60 months",
+           summary="Age must be between 1-60 months", required=False,
+           invalid="age_days must be a number of days"),
+    Number('height', "Height must be a positive number", exclusive_minimum=0,
+           summary="Height and weight must be positive"),
+    Number('weight', "Weight must be a positive number", exclusive_minimum=0,
+           summary="Height and weight must be positive"),
+    Choice('gender', ('boy', 'girl'), "Gender must be 'boy' or 'girl'", lower=True),
+    # Any value that is not a known region is reported as one, null and numbers included
+    Choice('location', lambda: recommendation_store.get().regions, "Invalid location specified",
+           any_type=True),
+])
+
+# Error of a record listing "indicators" in a batch
+BATCH_INDICATORS_MESSAGE = "indicators are only assessed one child at a time, not in batches"
+
+WHOLE_MONTHS_MESSAGE = "Age must be whole months unless age_mode is 'continuous'"
+
+
+def validate_child(input_data, schema=CHILD_SCHEMA):
+    """Validate one request payload, returning (child, None) or (None, (message, status, errors)).
+
+    Age is whole months by default, fractional months being truncated, or
+    rejected when config['STRICT_AGE'] is set. With "age_mode": "continuous"
+    it may be fractional, and "age_days" can be sent instead of "age" to the
+    same effect.
+    "wfh_mode" picks the weight-for-height lookup. errors maps every failing
+    field to its message.
+
+    schema may extend CHILD_SCHEMA with more fields, as ASSESS_SCHEMA does;
+    their errors are reported with the child's and their values added to it.
+    """
+    if not isinstance(input_data, dict):
+        return None, ("Request must be a JSON object", 400, {})
+
+    values, errors = schema.validate(input_data)
+
+    # "age_days" takes precedence over "age" and implies continuous age
+    age_mode = values.get('age_mode')
+    age = None
+    if 'age_days' in input_data:
+        age_mode = 'continuous'
+        if 'age_days' in values:
+            age = values['age_days'] / DAYS_PER_MONTH
+            if not 1 <= age <= 60:
+                errors.append(schema.error(CONSTRAINT, 'age_days'))
+    elif 'age' not in input_data:
+        errors.append(schema.error(MISSING, 'age', MISSING_MESSAGE))
+    elif 'age' in values:
+        age = values['age']
+        if age_mode == 'months':
+            if age != int(age) and config['STRICT_AGE']:
+                errors.append(schema.error(INVALID, 'age', WHOLE_MONTHS_MESSAGE))
+            age = int(age)
+        if age > 60:
+            errors.append(schema.error(CONSTRAINT, 'age'))
+
+    if errors:
+        return None, (summary(errors), 400, field_errors(errors))
+
+    child = {
+        'age': age,
+        'gender': values['gender'],
+        'height': values['height'],
+        'weight': values['weight'],
+        'location': values['location'],
+        'age_mode': age_mode,
+        'wfh_mode': values['wfh_mode']
+    }
+    for field in schema.fields[len(CHILD_SCHEMA.fields):]:
+        child[field.name] = values[field.name]
+    return child, None
+
+
+def validate_children(columns, size, schema=CHILD_SCHEMA):
+    """Vectorized validate_child over columns of raw field values.
+
+    columns maps field names to sequences of size values, as
+    Schema.record_columns builds them; absent fields may be left out.
+    Returns (children, errors): children maps each child field to an array or
+    list over all rows, only meaningful for valid ones, and errors maps the
+    index of every invalid row to its error tuples. The fields schema adds
+    to CHILD_SCHEMA are validated and returned too.
+    """
+    values, errors = schema.validate_columns(columns, size)
+
+    has_days = present(columns.get('age_days'), size)
+    has_age = present(columns.get('age'), size)
+    age_modes = np.array(values['age_mode'], dtype=object)
+    with np.errstate(invalid='ignore'):
+        ages = np.where(has_days, values['age_days'] / DAYS_PER_MONTH, values['age'])
+        days_out_of_range = has_days & ~np.isnan(ages) & ~((ages >= 1) & (ages <= 60))
+    months = ~has_days & (age_modes == 'months')
+    fractional = months & ~np.isnan(ages) & (ages != np.trunc(ages))
+    ages = np.where(months, np.trunc(ages), ages)
+    too_old = ~has_days & (ages > 60)
+
+    for i in np.flatnonzero(days_out_of_range).tolist():
+        errors.setdefault(i, []).append(CHILD_SCHEMA.error(CONSTRAINT, 'age_days'))
+    for i in np.flatnonzero(~has_days & ~has_age).tolist():
+        errors.setdefault(i, []).append(CHILD_SCHEMA.error(MISSING, 'age', MISSING_MESSAGE))
+    if config['STRICT_AGE']:
+        for i in np.flatnonzero(fractional).tolist():
+            errors.setdefault(i, []).append(
+                CHILD_SCHEMA.error(INVALID, 'age', WHOLE_MONTHS_MESSAGE)
+            )
+    for i in np.flatnonzero(too_old).tolist():
+        errors.setdefault(i, []).append(CHILD_SCHEMA.error(CONSTRAINT, 'age'))
+
+    age_modes[has_days] = 'continuous'
+    children = {
+        'age': ages,
+        'gender': values['gender'],
+        'height': values['height'],
+        'weight': values['weight'],
+        'location': values['location'],
+        'age_mode': age_modes,
+        'wfh_mode': np.array(values['wfh_mode'], dtype=object)
+    }
+    for field in schema.fields[len(CHILD_SCHEMA.fields):]:
+        children[field.name] = values[field.name]
+    return children, errors
+
+
+def build_response(location, height_z, weight_z, wfh_z, bands=None):
+    """Classify the rounded Z-scores and attach regional recommendations"""
+    return recommendation_store.get().build(location, (height_z, weight_z, wfh_z), bands)
+
+
+def lookup_result(child):
+    """(z_scores, bands) from the result table, or None to score the child live"""
+    table = get_result_table()
+    if table is None or child['age_mode'] != 'months' or child['wfh_mode'] != 'nearest':
+        return None
+    return table.lookup(sex_index(child['gender']), child['age'], child['height'], child['weight'])
+
+
+def child_z_scores(child, timer=None):
+    """Rounded (height-for-age, weight-for-age, weight-for-height) Z-scores of a validated child.
+
+    Raises ScoringError with status 404 when the tables hold no data for the
+    child's age, and with status 500 when the calculation fails. timer, e.g.
+    a metrics.StageTimer, is lapped after the age and weight-for-height lookups.
+    """
+    age, gender, height, weight = child['age'], child['gender'], child['height'], child['weight']
+    try:
+        # Height-for-age
+        height_z = age_z_score('height', gender, age, height, child['age_mode'])
+        if height_z is None:
+            raise ScoringError(f"No height data for age {age} months", 404)
+
+        height_z = round(height_z, 2)
+
+        # Weight-for-age
+        weight_z = age_z_score('weight', gender, age, weight, child['age_mode'])
+        if weight_z is None:
+            raise ScoringError(f"No weight data for age {age} months", 404)
+
+        weight_z = round(weight_z, 2)
+        if timer is not None:
+            timer.lap('age_lookup')
+
+        # Weight-for-height
+        wfh_z = round(wfh_z_score(gender, height, weight, child['wfh_mode']), 2)
+        if timer is not None:
+            timer.lap('wfh_lookup')
+
+    except ScoringError:
+        raise
+    except Exception as e:
+        raise ScoringError(f"Calculation error: {str(e)}", 500)
+
+    return height_z, weight_z, wfh_z
+
+
+def score(input_data):
+    """Response dict for one child's measurements, as the API returns it.
+
+    input_data is the request payload. Raises ScoringError where the API
+    answers with an error.
+    """
+    child, error = validate_child(input_data)
+    if error:
+        raise ScoringError(*error)
+
+    engine = recommendation_store.get()
+    result = lookup_result(child)
+    if result is not None:
+        z_scores, bands = result
+        return engine.build(child['location'], z_scores, bands)
+    return engine.build(child['location'], child_z_scores(child))
+
+
+def classify(input_data, z_scores=False):
+    """Status of each indicator for one child's measurements, without recommendations.
+
+    Children with whole-month ages and nearest-row weight-for-height are
+    classified by comparing their height and weight with the cutoffs in cm
+    and kg; Z-scores are only computed, and added to the result, when
+    z_scores is true. Raises ScoringError as score() does.
+    """
+    child, error = validate_child(input_data)
+    if error:
+        raise ScoringError(*error)
+
+    bands = None
+    if not z_scores and child['age_mode'] == 'months' and child['wfh_mode'] == 'nearest':
+        cutoffs = get_cutoff_tables()
+        sex = sex_index(child['gender'])
+        try:
+            bands = (
+                cutoffs.age_band('height', sex, child['age'], child['height']),
+                cutoffs.age_band('weight', sex, child['age'], child['weight']),
+                cutoffs.wfh_band(sex, child['height'], child['weight']),
+            )
+        except Exception:
+            bands = None
+    if bands is None or None in bands:
+        # Off the cutoffs, no row for the age or a failed lookup: the Z-score
+        # path raises the same ScoringError as score()
+        all_z = child_z_scores(child)
+        bands = [
+            labels.index(classify_growth(z, thresholds, labels))
+            for z, (_, thresholds, labels, _, _) in zip(all_z, INDICATORS)
+        ]
+    result = {}
+    for i, (key, _, labels, _, _) in enumerate(INDICATORS):
+        result[key] = {"Status": labels[bands[i]]}
+        if z_scores:
+            result[key]["Z-score"] = all_z[i]
+    return result
+
+
+# Measurements in cm that some indicators need on top of height and weight
+MEASUREMENT_FIELDS = (
+    Number('muac', "muac must be a positive number (cm)", exclusive_minimum=0, required=False),
+    Number('head_circumference', "head_circumference must be a positive number (cm)",
+           exclusive_minimum=0, required=False),
+)
+
+# CHILD_SCHEMA and the fields an assessment takes on top of it
+ASSESS_SCHEMA = Schema(CHILD_SCHEMA.fields + (
+    Subset('indicators', REGISTRY, "indicators must be a list of: " + ", ".join(REGISTRY),
+           required=False, default=lambda: list(DEFAULT_INDICATORS)),
+) + MEASUREMENT_FIELDS)
+
+# The columns score_many() reads when given indicators, which apply to every row
+MEASUREMENTS_SCHEMA = Schema(CHILD_SCHEMA.fields + MEASUREMENT_FIELDS)
+
+
+def assess(input_data, z_scores=True):
+    """Response dict for any subset of the registered indicators of one child.
+
+    input_data is a request payload that may also hold "indicators", a list
+    of indicators.REGISTRY names (by default the original three), and the
+    "muac" and "head_circumference" measurements in cm the indicators on them
+    need. Each indicator gets its Status, its Z-score when z_scores is true
+    and its Recommendation when it has regional advice. Raises ScoringError
+    where score() would, with status 404 for an indicator whose reference
+    table is not installed.
+    """
+    child, error = validate_child(input_data, ASSESS_SCHEMA)
+    if error:
+        raise ScoringError(*error)
+    return assess_child(child, z_scores)
+
+
+def assess_child(child, z_scores=True):
+    """assess() for a child validate_child() accepted against ASSESS_SCHEMA"""
+    return assessment_response(
+        child['location'], indicator_scores(child, child['indicators'], z_scores)
+    )
+
+
+def assessment_response(location, results):
+    """Response dict of indicator_scores() results, with the region's recommendations"""
+    advice = recommendation_store.get().regions[location]
+    response = {}
+    for indicator, z_score, band in results:
+        entry = {} if z_score is None else {"Z-score": z_score}
+        entry["Status"] = indicator.labels[band]
+        if indicator.advice and band >= indicator.cut:
+            entry["Recommendation"] = indicator.normal
+        elif indicator.advice in advice:
+            # Recommendation files may lack the advice of the newer indicators
+            entry["Recommendation"] = advice[indicator.advice]
+        response[indicator.key] = entry
+    response["Region"] = location
+    return response
+
+
+def indicator_scores(child, names, z_scores=True):
+    """(indicator, rounded Z-score, band) for each named indicator, in REGISTRY order.
+
+    Whole-month ages and nearest-row weight-for-height are classified
+    against the cutoffs in cm and kg, and the Z-score, None unless z_scores
+    is true, costs one more row lookup. Other lookups go through the
+    Z-scores, interpolated between ages. Raises ScoringError like
+    child_z_scores().
+    """
+    tables, cutoffs = get_growth_tables(), get_cutoff_tables()
+    available = available_indicators(tables)
+    age, gender, height = child['age'], child['gender'], child['height']
+    sex = sex_index(gender)
+    months = child['age_mode'] == 'months'
+    nearest = child['wfh_mode'] == 'nearest'
+
+    results = []
+    for name, indicator in REGISTRY.items():
+        if name not in names:
+            continue
+        if name not in available:
+            raise ScoringError(f"No reference table for {indicator.key}", 404)
+        value = MEASURES[indicator.measure](child)
+        if value is None:
+            raise ScoringError(f"{indicator.measure} is required for {indicator.key}", 400,
+                               {indicator.measure: MISSING_MESSAGE})
+        try:
+            if indicator.axis == AGE:
+                band = cutoffs.age_band(indicator.table, sex, age, value) if months else None
+                z_score = None
+                if band is None or z_scores:
+                    z_score = age_z_score(indicator.table, gender, age, value, child['age_mode'])
+                    if z_score is None:
+                        raise ScoringError(
+                            f"No {indicator.noun} data for age {age} months", 404
+                        )
+            else:
+                band = cutoffs.wfh_band(sex, height, value) if nearest else None
+                z_score = None
+                if band is None or z_scores:
+                    z_score = wfh_z_score(gender, height, value, child['wfh_mode'])
+        except ScoringError:
+            raise
+        except Exception as e:
+            raise ScoringError(f"Calculation error: {str(e)}", 500)
+
+        if z_score is not None:
+            z_score = round(z_score, 2)
+            if band is None:
+                band = bisect.bisect_right(indicator.thresholds, z_score)
+        results.append((indicator, z_score if z_scores else None, band))
+    return results
+
+
+def round_z_scores(z_scores):
+    """round(z, 2) of every Z-score in an array, exactly as Python rounds each one"""
+    with np.errstate(all='ignore'):
+        scaled = z_scores * 100
+        rounded = np.rint(scaled) / 100
+        # Away from a tie, rint picks the same hundredth as round(); values
+        # close enough to a tie for the scaling error to matter go through round()
+        unsure = ~(np.abs(scaled - np.floor(scaled) - 0.5) > 1e-6) | ~(np.abs(scaled) < 2.0 ** 52)
+    if unsure.any():
+        rounded[unsure] = [round(z, 2) for z in z_scores[unsure].tolist()]
+    return rounded
+
+
+def empty_scores(size, z_scores=True, names=INDICATOR_COLUMNS):
+    """score_many() columns for size children and the named indicators, none scored yet"""
+    scores = {}
+    for name in names:
+        if z_scores:
+            scores[f"{name}_z"] = np.full(size, np.nan)
+        scores[f"{name}_band"] = np.full(size, -1, dtype=np.int8)
+    scores['location'] = [None] * size
+    scores['status'] = np.full(size, 200, dtype=np.int16)
+    scores['error'] = [None] * size
+    scores['errors'] = [None] * size
+    return scores
+
+
+def child_arrays(children, rows):
+    """(ages, sex indexes, continuous, interpolated) of rows of validate_children() columns"""
+    genders = np.asarray(children['gender'], dtype=object)[rows]
+    sexes = np.zeros(len(rows), dtype=np.intp)
+    for s, sex in enumerate(SEXES):
+        sexes[genders == sex] = s
+    return (
+        children['age'][rows], sexes, children['age_mode'][rows] == 'continuous',
+        children['wfh_mode'][rows] == 'interpolated'
+    )
+
+
+def score_columns(columns, size, z_scores=True):
+    """Validate and score columns of raw field values, returning score_many()'s columns"""
+    children, errors = validate_children(columns, size)
+
+    scores = empty_scores(size, z_scores)
+    scores['location'] = list(children['location'])
+    for k, row_errors in errors.items():
+        scores['status'][k] = 400
+        scores['error'][k] = summary(row_errors)
+        scores['errors'][k] = field_errors(row_errors)
+
+    valid = np.ones(size, dtype=bool)
+    valid[list(errors)] = False
+    rows = np.flatnonzero(valid)
+    if not len(rows):
+        return scores
+
+    ages, sexes, continuous, interpolated = child_arrays(children, rows)
+    heights = children['height'][rows]
+    weights = children['weight'][rows]
+
+    if z_scores:
+        height_z, hfa_found = age_z_scores('height', sexes, ages, heights, continuous)
+        weight_z, wfa_found = age_z_scores('weight', sexes, ages, weights, continuous)
+        wfh_z, wfh_found = wfh_z_scores(sexes, heights, weights, interpolated)
+    else:
+        height_band, hfa_found = age_bands('height', sexes, ages, heights, continuous)
+        weight_band, wfa_found = age_bands('weight', sexes, ages, weights, continuous)
+        wfh_band, wfh_found = wfh_bands(sexes, heights, weights, interpolated)
+
+    scored = hfa_found & wfa_found & wfh_found
+    for k in np.flatnonzero(~scored).tolist():
+        i = rows[k]
+        # Whole-month ages are reported as integers, as validate_child returns them
+        age = ages[k].item() if continuous[k] else int(ages[k])
+        if not hfa_found[k]:
+            scores['status'][i] = 404
+            scores['error'][i] = f"No height data for age {age} months"
+        elif not wfa_found[k]:
+            scores['status'][i] = 404
+            scores['error'][i] = f"No weight data for age {age} months"
+        else:
+            # Let the scalar lookup produce the exact error message
+            try:
+                z = wfh_z_score(SEXES[sexes[k]], heights[k].item(), weights[k].item(),
+                                'interpolated' if interpolated[k] else 'nearest')
+                if z_scores:
+                    wfh_z[k] = z
+                else:
+                    wfh_band[k] = z_score_bands(INDICATORS[2][1], np.array([z]))[0]
+                scored[k] = True
+            except Exception as e:
+                scores['status'][i] = 500
+                scores['error'][i] = f"Calculation error: {str(e)}"
+
+    done = rows[scored]
+    if not z_scores:
+        for name, bands in zip(INDICATOR_COLUMNS, (height_band, weight_band, wfh_band)):
+            scores[f"{name}_band"][done] = bands[scored]
+        return scores
+
+    all_z = (height_z, weight_z, wfh_z)
+    for indicator, (name, z_scores) in enumerate(zip(INDICATOR_COLUMNS, all_z)):
+        rounded = round_z_scores(z_scores[scored])
+        scores[f"{name}_z"][done] = rounded
+        scores[f"{name}_band"][done] = np.searchsorted(
+            INDICATORS[indicator][1], rounded, side='right'
+        )
+    return scores
+
+
+def indicator_columns(columns, size, names, z_scores=True):
+    """score_columns() for the named REGISTRY indicators, as indicator_scores() scores them.
+
+    A child's error is the one of the first indicator, in REGISTRY order,
+    it cannot be scored on.
+    """
+    children, errors = validate_children(columns, size, MEASUREMENTS_SCHEMA)
+    selected = [indicator for name, indicator in REGISTRY.items() if name in names]
+
+    scores = empty_scores(size, z_scores, [indicator.name for indicator in selected])
+    scores['location'] = list(children['location'])
+    for k, row_errors in errors.items():
+        scores['status'][k] = 400
+        scores['error'][k] = summary(row_errors)
+        scores['errors'][k] = field_errors(row_errors)
+
+    valid = np.ones(size, dtype=bool)
+    valid[list(errors)] = False
+    rows = np.flatnonzero(valid)
+    if not len(rows):
+        return scores
+
+    ages, sexes, continuous, interpolated = child_arrays(children, rows)
+    measured = {name: children[name][rows]
+                for name in ('height', 'weight', 'muac', 'head_circumference')}
+    heights = measured['height']
+    available = available_indicators(get_growth_tables())
+
+    # Rows every indicator so far could score
+    pending = np.ones(len(rows), dtype=bool)
+    results = []
+    for indicator in selected:
+        if indicator.name not in available:
+            scores['status'][rows[pending]] = 404
+            for i in rows[pending].tolist():
+                scores['error'][i] = f"No reference table for {indicator.key}"
+            pending[:] = False
+            break
+
+        values = MEASURES[indicator.measure](measured)
+        missing = pending & np.isnan(values)
+        scores['status'][rows[missing]] = 400
+        for i in rows[missing].tolist():
+            scores['error'][i] = f"{indicator.measure} is required for {indicator.key}"
+            scores['errors'][i] = {indicator.measure: MISSING_MESSAGE}
+        pending &= ~missing
+
+        if indicator.axis == AGE:
+            if z_scores:
+                scored, found = age_z_scores(indicator.table, sexes, ages, values, continuous)
+            else:
+                scored, found = age_bands(indicator.table, sexes, ages, values, continuous)
+            for k in np.flatnonzero(pending & ~found).tolist():
+                age = ages[k].item() if continuous[k] else int(ages[k])
+                scores['status'][rows[k]] = 404
+                scores['error'][rows[k]] = f"No {indicator.noun} data for age {age} months"
+            pending &= found
+        else:
+            if z_scores:
+                scored, found = wfh_z_scores(sexes, heights, values, interpolated)
+            else:
+                scored, found = wfh_bands(sexes, heights, values, interpolated)
+            for k in np.flatnonzero(pending & ~found).tolist():
+                # Let the scalar lookup produce the exact error message
+                try:
+                    z = wfh_z_score(SEXES[sexes[k]], heights[k].item(), values[k].item(),
+                                    'interpolated' if interpolated[k] else 'nearest')
+                    if not z_scores:
+                        z = z_score_bands(indicator.thresholds, np.array([z]))[0]
+                    scored[k] = z
+                except Exception as e:
+                    pending[k] = False
+                    scores['status'][rows[k]] = 500
+                    scores['error'][rows[k]] = f"Calculation error: {str(e)}"
+        results.append((indicator, scored))
+
+    done = rows[pending]
+    for indicator, scored in results:
+        if not z_scores:
+            scores[f"{indicator.name}_band"][done] = scored[pending]
+            continue
+        rounded = round_z_scores(scored[pending])
+        scores[f"{indicator.name}_z"][done] = rounded
+        scores[f"{indicator.name}_band"][done] = np.searchsorted(
+            indicator.thresholds, rounded, side='right'
+        )
+    return scores
+
+
+def score_many(arrays, z_scores=True, indicators=None):
+    """Score columns of children's measurements at once.
+
+    arrays maps field names (age or age_days, gender, height, weight and
+    location, optionally age_mode and wfh_mode) to equal-length sequences
+    such as lists or NumPy arrays. Returns a dict of columns:
+
+    - <indicator>_z for each of INDICATOR_COLUMNS: rounded Z-scores, NaN
+      where the child was not scored. Left out when z_scores is false, in
+      which case children with whole-month ages and nearest-row
+      weight-for-height are classified against the cutoffs in cm and kg
+      without computing any
+    - <indicator>_band: index of the status in the indicator's labels in
+      recommendations.INDICATORS, -1 where the child was not scored
+    - location: the region, None where it was invalid
+    - status: the HTTP status the API would answer with for the child
+    - error: the error message, None for scored children
+    - errors: field name to message for invalid input, otherwise None
+
+    indicators, a list of indicators.REGISTRY names, scores those instead of
+    INDICATOR_COLUMNS, each <name>_band indexing the indicator's labels, and
+    every child is scored on all of them as assess() would: arrays may then
+    also hold muac and head_circumference.
+    """
+    if indicators is not None:
+        unknown = set(indicators) - set(REGISTRY)
+        if unknown or not indicators:
+            raise ValueError("indicators must be a list of: " + ", ".join(REGISTRY))
+    columns = {
+        name: column if isinstance(column, (list, np.ndarray)) else np.asarray(column)
+        for name, column in arrays.items()
+    }
+    sizes = {len(column) for column in columns.values()}
+    if len(sizes) > 1:
+        raise ValueError("All columns must have the same length")
+    size = sizes.pop() if sizes else 0
+    if indicators is None:
+        return score_columns(columns, size, z_scores)
+    return indicator_columns(columns, size, indicators, z_scores)
+
+
+def score_record_columns(records):
+    """score_many() over a list of request payloads.
+
+    Records that are not objects get a 400, as do records listing
+    "indicators": those are assessed one child at a time, by assess().
+    """
+    rejected = {
+        i: ("Record must be a JSON object", None) if not isinstance(record, dict) else
+        (BATCH_INDICATORS_MESSAGE, {'indicators': BATCH_INDICATORS_MESSAGE})
+        for i, record in enumerate(records)
+        if not isinstance(record, dict) or 'indicators' in record
+    }
+    rows = [i for i in range(len(records)) if i not in rejected]
+    scores = score_columns(CHILD_SCHEMA.record_columns([records[i] for i in rows]), len(rows))
+    if len(rows) == len(records):
+        return scores
+
+    merged = empty_scores(len(records))
+    merged['status'][:] = 400
+    for i, (error, errors) in rejected.items():
+        merged['error'][i] = error
+        merged['errors'][i] = errors
+    for name, column in scores.items():
+        if isinstance(column, np.ndarray):
+            merged[name][rows] = column
+        else:
+            for k, i in enumerate(rows):
+                merged[name][i] = column[k]
+    return merged
+
+
+def score_records(records):
+    """Score a list of request payloads, returning one response or error per record.
+
+    Validation, table lookups and Z-scores all run over the whole list at
+    once with NumPy.
+    """
+    return build_results(score_record_columns(records))
+
+
+def build_results(scores):
+    """One response or error dict per row of score_many() columns"""
+    engine = recommendation_store.get()
+    z_scores = [scores[f"{name}_z"].tolist() for name in INDICATOR_COLUMNS]
+    bands = [scores[f"{name}_band"].tolist() for name in INDICATOR_COLUMNS]
+    results = []
+    for i, status in enumerate(scores['status'].tolist()):
+        if status == 200:
+            results.append(engine.build(
+                scores['location'][i], [z[i] for z in z_scores], [b[i] for b in bands]
+            ))
+        elif scores['errors'][i] is not None:
+            results.append(
+                {"error": scores['error'][i], "errors": scores['errors'][i], "status": status}
+            )
+        else:
+            results.append({"error": scores['error'][i], "status": status})
+
+    return results
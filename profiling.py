@@ -0,0 +1,235 @@
+"""Opt-in CPU profiling of live workers.
+
+Two tools, both off unless configured and free when off:
+
+- RequestProfiler runs single requests under cProfile and saves each
+  profile as a .pstats file. A request is profiled when it carries the
+  X-Nutriscout-Profile header set to NUTRISCOUT_PROFILE_TOKEN, or at random
+  with probability NUTRISCOUT_PROFILE_RATE. Read the files with
+  `python -m pstats` or snakeviz.
+
+- StackSampler samples the stacks of every thread in the worker at a fixed
+  interval and writes them as collapsed stacks ("a;b;c count" lines), the
+  input of flamegraph.pl and speedscope. It is started and stopped at
+  runtime by sending the worker SIGUSR2 (under gunicorn, a worker's pid,
+  never the master's, which upgrades itself on USR2), and stops by itself
+  after NUTRISCOUT_SAMPLE_SECONDS.
+
+Files go to NUTRISCOUT_PROFILE_DIR, where only the newest
+NUTRISCOUT_PROFILE_KEEP are kept.
+"""
+import cProfile
+import hmac
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Nutriscout-Profile'
+
+config = {
+    # Directory of saved profiles, and how many of the newest to keep
+    'DIR': os.environ.get('NUTRISCOUT_PROFILE_DIR', 'profiles'),
+    'KEEP': int(os.environ.get('NUTRISCOUT_PROFILE_KEEP', '200')),
+    # Fraction of requests profiled at random (0 for none)
+    'RATE': float(os.environ.get('NUTRISCOUT_PROFILE_RATE', '0')),
+    # Value of the profile header that asks for a profile (unset: the header is ignored)
+    'TOKEN': os.environ.get('NUTRISCOUT_PROFILE_TOKEN') or None,
+    # Seconds between stack samples, and the longest a sampling run lasts
+    'SAMPLE_INTERVAL': float(os.environ.get('NUTRISCOUT_SAMPLE_INTERVAL', '0.005')),
+    'SAMPLE_SECONDS': float(os.environ.get('NUTRISCOUT_SAMPLE_SECONDS', '60')),
+}
+
+
+def rotate(directory, keep, suffixes=('.pstats', '.folded')):
+    """Delete all but the newest keep profiles in directory"""
+    try:
+        entries = [
+            entry for entry in os.scandir(directory)
+            if entry.is_file() and entry.name.endswith(suffixes)
+        ]
+    except OSError:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in entries[keep:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            # Another worker removed it first
+            pass
+
+
+def profile_path(directory, name, suffix):
+    """Unique file name for a profile taken now by this process"""
+    stamp = time.strftime('%Y%m%dT%H%M%S')
+    return os.path.join(
+        directory, f"{name}-{stamp}-{time.time_ns() % 10**9:09d}-{os.getpid()}{suffix}"
+    )
+
+
+class RequestProfiler:
+    """Runs chosen requests under cProfile and saves their profiles.
+
+    enabled is False when neither a token nor a rate is set, so callers can
+    skip the profiler entirely with one attribute check.
+    """
+
+    def __init__(self, directory, rate=0.0, token=None, keep=200):
+        self.directory = directory
+        self.rate = rate
+        self.token = token
+        self.keep = keep
+        self.enabled = rate > 0 or token is not None
+
+    def wanted(self, header):
+        """Whether to profile a request that carries header (None when absent)"""
+        if header is not None and self.token is not None and hmac.compare_digest(
+            header.encode(), self.token.encode()
+        ):
+            return True
+        return self.rate > 0 and random.random() < self.rate
+
+    def run(self, name, function, *args):
+        """function(*args), profiled and saved under name"""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this thread
+            return function(*args)
+        try:
+            return function(*args)
+        finally:
+            profile.disable()
+            self.save(profile, name)
+
+    def save(self, profile, name):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(profile_path(self.directory, name, '.pstats'))
+        except OSError as e:
+            logger.warning("Could not save profile of %s: %s", name, e)
+            return
+        rotate(self.directory, self.keep)
+
+
+def frame_stack(frame):
+    """Collapsed-stack frames of a Python frame and its callers, outermost first"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Samples the stacks of all threads from a background thread while running.
+
+    Nothing runs until start(); stop() writes what was sampled to a
+    .folded file and returns its path.
+    """
+
+    def __init__(self, directory, interval=0.005, max_seconds=60.0, keep=200):
+        self.directory = directory
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.keep = keep
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = Counter()
+        # Reentrant, as a signal can arrive while the main thread holds it
+        self._lock = threading.RLock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stacks = Counter()
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='nutriscout-stack-sampler', daemon=True
+            )
+            self._thread.start()
+        logger.info("Sampling stacks every %.1f ms", self.interval * 1000)
+
+    def stop(self):
+        """Stop sampling and save the stacks; returns the file written, or None"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return None
+        self._stop.set()
+        if thread is not threading.current_thread():
+            thread.join()
+        return self.save()
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self._stacks[frame_stack(frame)] += 1
+            if time.monotonic() > deadline:
+                logger.info("Stack sampling stopped after %.0f s", self.max_seconds)
+                self.stop()
+                return
+
+    def save(self):
+        stacks = self._stacks
+        if not stacks:
+            return None
+        path = profile_path(self.directory, 'stacks', '.folded')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.warning("Could not save sampled stacks: %s", e)
+            return None
+        rotate(self.directory, self.keep)
+        logger.info("Wrote %d stack samples to %s", sum(stacks.values()), path)
+        return path
+
+
+request_profiler = RequestProfiler(config['DIR'], config['RATE'], config['TOKEN'], config['KEEP'])
+
+sampler = StackSampler(
+    config['DIR'], config['SAMPLE_INTERVAL'], config['SAMPLE_SECONDS'], config['KEEP']
+)
+
+
+def install_sampler_signal(signum=None):
+    """Toggle the stack sampler when this process receives signum (default SIGUSR2).
+
+    Must be called from the main thread; returns False where the signal
+    cannot be installed.
+    """
+    signum = signum or getattr(signal, 'SIGUSR2', None)
+    if signum is None:
+        return False
+    try:
+        signal.signal(signum, lambda signum, frame: sampler.toggle())
+    except (ValueError, OSError):
+        return False
+    return True
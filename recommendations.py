@@ -0,0 +1,190 @@
+"""Precomputed recommendation responses per region, indicator and status band.
+
+Every (region, indicator, status band) fragment, both as a dict and as
+pre-serialized JSON bytes, is built once, so a response is the cached
+fragments stitched around the Z-scores. The bytes match Flask's compact
+jsonify output exactly: sorted keys, "," and ":" separators, ASCII escapes
+and a trailing newline.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Response key, Z-score thresholds, status labels, regional advice key and
+# the text used when the Z-score is not below RECOMMEND_BELOW
+INDICATORS = (
+    ("Height", [-3, -2, 2],
+     ["Severely Stunted", "Moderately Stunted", "Normal Height", "Above Average"],
+     "Stunting", "Normal height for age"),
+    ("Weight-for-Age", [-3, -2, 1],
+     ["Severely Underweight", "Moderately Underweight", "Normal Weight", "Overweight"],
+     "Underweight", "Normal weight for age"),
+    ("Weight-for-Height", [-3, -2],
+     ["Severe Wasting", "Moderate Wasting", "Normal"],
+     "Wasting", "Normal weight for height"),
+)
+
+# Regional advice is given for Z-scores below this value
+RECOMMEND_BELOW = -2
+
+ADVICE_KEYS = tuple(advice for _, _, _, advice, _ in INDICATORS)
+
+# Advice for the indicators only assess() scores (BMI- and MUAC-for-age).
+# Recommendation files written before them may leave these out; a region
+# without one gives no recommendation for its indicator
+OPTIONAL_ADVICE_KEYS = ("Low BMI", "Low MUAC")
+
+
+def json_number(value):
+    """Encode a float the way json.dumps does, including NaN and infinities"""
+    if value != value:
+        return b'NaN'
+    if value == float('inf'):
+        return b'Infinity'
+    if value == float('-inf'):
+        return b'-Infinity'
+    return float.__repr__(value).encode()
+
+
+def validate_regions(regions):
+    """Check a regions mapping has string advice for every indicator, optional keys aside"""
+    if not isinstance(regions, dict) or not regions:
+        raise ValueError("Recommendations must map region names to advice")
+    for region, advice in regions.items():
+        if not isinstance(advice, dict) or not all(
+            isinstance(advice.get(key), str) for key in ADVICE_KEYS
+        ):
+            raise ValueError(f"Region {region!r} needs text for {', '.join(ADVICE_KEYS)}")
+        for key in OPTIONAL_ADVICE_KEYS:
+            if not isinstance(advice.get(key, ''), str):
+                raise ValueError(f"Region {region!r} has non-text advice for {key}")
+
+
+class RecommendationEngine:
+    """Response fragments precomputed for every region, indicator and status band"""
+
+    def __init__(self, regions):
+        validate_regions(regions)
+        self.regions = {region: dict(advice) for region, advice in regions.items()}
+        # Identifies the advice content, e.g. to key cached responses across reloads
+        self.version = hashlib.sha256(
+            json.dumps(self.regions, sort_keys=True).encode()
+        ).hexdigest()[:16]
+
+        # Bands at or past the cut get the "normal" text; -2 is one of every
+        # indicator's thresholds, so the band alone decides the recommendation
+        self._cuts = [bisect.bisect_left(thresholds, RECOMMEND_BELOW) + 1
+                      for _, thresholds, _, _, _ in INDICATORS]
+
+        self._fields = {}
+        self._fragments = {}
+        for region, advice in self.regions.items():
+            region_json = json.dumps(region)
+            fields, fragments = [], []
+            for i, (key, thresholds, labels, advice_key, normal) in enumerate(INDICATORS):
+                band_fields, band_fragments = [], []
+                for band, label in enumerate(labels):
+                    text = advice[advice_key] if band < self._cuts[i] else normal
+                    band_fields.append({"Status": label, "Recommendation": text})
+                    # Keys sorted as jsonify does: Height, Region, Weight-for-Age, Weight-for-Height
+                    prefix = '{' if i == 0 else '},'
+                    if i == 1:
+                        prefix += f'"Region":{region_json},'
+                    band_fragments.append((
+                        f'{prefix}{json.dumps(key)}:{{"Recommendation":{json.dumps(text)},'
+                        f'"Status":{json.dumps(label)},"Z-score":'
+                    ).encode())
+                fields.append(band_fields)
+                fragments.append(band_fragments)
+            self._fields[region] = fields
+            self._fragments[region] = fragments
+
+    def band(self, indicator, z_score):
+        """Status band of a Z-score, matching classify_growth on the same thresholds"""
+        return bisect.bisect_right(INDICATORS[indicator][1], z_score)
+
+    def build(self, location, z_scores, bands=None):
+        """Response dict for a region and the (height, weight-for-age, weight-for-height) Z-scores.
+
+        bands, when given, are the precomputed status bands of the Z-scores.
+        """
+        fields = self._fields[location]
+        if bands is None:
+            bands = [self.band(i, z_score) for i, z_score in enumerate(z_scores)]
+        response = {}
+        for i, z_score in enumerate(z_scores):
+            response[INDICATORS[i][0]] = {"Z-score": z_score, **fields[i][bands[i]]}
+        response["Region"] = location
+        return response
+
+    def render(self, location, z_scores, bands=None):
+        """Compact JSON bytes of build(), stitched from the cached fragments"""
+        fragments = self._fragments[location]
+        if bands is None:
+            bands = [self.band(i, z_score) for i, z_score in enumerate(z_scores)]
+        parts = []
+        for i, z_score in enumerate(z_scores):
+            parts.append(fragments[i][bands[i]])
+            parts.append(json_number(z_score))
+        parts.append(b'}}\n')
+        return b''.join(parts)
+
+
+class RecommendationStore:
+    """Serves a RecommendationEngine, rebuilding it when its data file changes.
+
+    Without a path the built-in regions are used. With one, the JSON file
+    (same shape as REGION_RECOMMENDATIONS) is checked at most every
+    check_interval seconds; a file that fails to load leaves the previous
+    recommendations in place.
+    """
+
+    def __init__(self, default_regions, path=None, check_interval=1.0):
+        self.default_regions = default_regions
+        self.path = path
+        self.check_interval = check_interval
+        self._engine = None
+        self._mtime = None
+        self._checked = 0.0
+        self._error = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Current engine, reloading the data file first if it changed"""
+        if self._engine is not None and (
+            self.path is None or time.monotonic() - self._checked < self.check_interval
+        ):
+            return self._engine
+        with self._lock:
+            self._refresh()
+        return self._engine
+
+    def _refresh(self):
+        if self.path is None:
+            if self._engine is None:
+                self._engine = RecommendationEngine(self.default_regions)
+            return
+
+        self._checked = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime and self._engine is not None:
+                return
+            # Remember the version even if it fails, so a broken file is reported once
+            self._mtime = mtime
+            with open(self.path, encoding='utf-8') as f:
+                self._engine = RecommendationEngine(json.load(f))
+            self._error = None
+            logger.info("Loaded recommendations from %s", self.path)
+        except (OSError, ValueError) as e:
+            if str(e) != self._error:
+                logger.warning("Could not load recommendations from %s: %s", self.path, e)
+            self._error = str(e)
+            if self._engine is None:
+                self._engine = RecommendationEngine(self.default_regions)
@@ -0,0 +1,461 @@
+import hashlib
+import math
+import os
+import struct
+import tempfile
+import zipfile
+
+import numpy as np
+
+# Order of the sex axis in every compiled array
+SEXES = ('boy', 'girl')
+
+# Bumped whenever the arrays stored in a tables artifact change
+ARTIFACT_VERSION = 1
+
+# Spacing in cm of the dense weight-for-height grid used for interpolation
+WFH_GRID_STEP = 0.1
+
+# Age-indexed tables from load_growth_data() and the measurement column prefix
+AGE_INDICATORS = {
+    'height': 'HEIGHT',
+    'weight': 'WEIGHT',
+}
+
+
+def sex_index(gender):
+    """Position of a gender on the sex axis of the compiled arrays"""
+    return SEXES.index(gender)
+
+
+class ReferenceTables:
+    """Growth standards compiled into contiguous float64 arrays.
+
+    age_values has shape (indicator, sex, age, 2) holding (median, sd) and
+    age_present has shape (indicator, age) marking which ages the source
+    table actually lists, so a lookup is plain array indexing. indicators
+    names the tables along the first axis: the workbook's AGE_INDICATORS,
+    then any WHO LMS tables add_lms_tables() appended. Rows of an LMS table
+    hold (M, S), age_l of shape (indicator, sex, age) holds their L, NaN for
+    the median/SD tables, and lms marks those tables; restricted marks the
+    ones scored with WHO's restricted method beyond +/-3 SD.
+
+    Weight-for-height is kept per sex as heights sorted ascending, the
+    matching (median, sd) rows and each row's position in the source table,
+    which is what breaks ties between equally close heights. A dense grid of
+    linearly interpolated (median, sd) every WFH_GRID_STEP cm is derived from
+    it for the interpolated lookup mode.
+
+    fingerprint identifies the tables' contents, e.g. in the keys of results
+    computed from them.
+    """
+
+    def __init__(self, age_values, age_present, wfh_heights, wfh_values, wfh_rows,
+                 indicators=tuple(AGE_INDICATORS), age_l=None, restricted=()):
+        self.indicators = tuple(indicators)
+        self.age_values = np.ascontiguousarray(age_values, dtype=np.float64)
+        self.age_present = np.ascontiguousarray(age_present, dtype=bool)
+        if age_l is None:
+            age_l = np.full(self.age_values.shape[:3], np.nan)
+        self.age_l = np.ascontiguousarray(age_l, dtype=np.float64)
+        self.lms = tuple(not np.isnan(l).all() for l in self.age_l)
+        self.restricted = tuple(name in restricted for name in self.indicators)
+        self.max_age = self.age_values.shape[2] - 1
+        self.wfh_heights = tuple(np.ascontiguousarray(h, dtype=np.float64) for h in wfh_heights)
+        self.wfh_values = tuple(np.ascontiguousarray(v, dtype=np.float64) for v in wfh_values)
+        self.wfh_rows = tuple(np.ascontiguousarray(r, dtype=np.int64) for r in wfh_rows)
+        self.fingerprint = array_checksum(
+            [np.array(self.indicators), np.array(self.restricted), self.age_values,
+             self.age_present, self.age_l, *self.wfh_heights, *self.wfh_values, *self.wfh_rows]
+        )
+
+        self.wfh_grid_step = WFH_GRID_STEP
+        self.wfh_grid_start = []
+        self.wfh_grid = []
+        for heights, values in zip(self.wfh_heights, self.wfh_values):
+            if len(heights) == 0:
+                self.wfh_grid_start.append(0.0)
+                self.wfh_grid.append(np.zeros((0, 2)))
+                continue
+            points = heights[0] + WFH_GRID_STEP * np.arange(
+                int(round((heights[-1] - heights[0]) / WFH_GRID_STEP)) + 1
+            )
+            self.wfh_grid_start.append(float(heights[0]))
+            self.wfh_grid.append(np.column_stack([
+                np.interp(points, heights, values[:, 0]),
+                np.interp(points, heights, values[:, 1]),
+            ]))
+
+    def age_row(self, indicator, gender, age):
+        """Return (median, sd), or (L, M, S) for an LMS table, at a whole-month age, or None"""
+        i = self.indicators.index(indicator)
+        if age < 0 or age > self.max_age or not self.age_present[i, age]:
+            return None
+        s = sex_index(gender)
+        row = self.age_values[i, s, age]
+        if self.lms[i]:
+            return float(self.age_l[i, s, age]), float(row[0]), float(row[1])
+        return float(row[0]), float(row[1])
+
+    def age_rows(self, indicator, sexes, ages):
+        """Vectorized age_row: (medians, sds, present), or (ls, ms, ss, present) for LMS tables"""
+        i = self.indicators.index(indicator)
+        ages = np.asarray(ages, dtype=np.int64)
+        present = (ages >= 0) & (ages <= self.max_age)
+        ages = np.where(present, ages, 0)
+        present &= self.age_present[i, ages]
+        rows = self.age_values[i, sexes, ages]
+        if self.lms[i]:
+            return self.age_l[i, sexes, ages], rows[:, 0], rows[:, 1], present
+        return rows[:, 0], rows[:, 1], present
+
+    def closest_height_row(self, sex, height):
+        """Return (height, median, sd) of the weight-for-height row nearest to height.
+
+        Matches an idxmin() over the absolute differences: among rows at the
+        same distance the one listed first in the source table wins.
+        """
+        best = self.closest_height_position(sex, height)
+        median, sd = self.wfh_values[sex][best]
+        return float(self.wfh_heights[sex][best]), float(median), float(sd)
+
+    def closest_height_position(self, sex, height):
+        """Position in the sorted table of the row closest_height_row returns"""
+        heights = self.wfh_heights[sex]
+        n = len(heights)
+        if n == 0:
+            raise ValueError("No valid height data available")
+        if height != height:
+            raise ValueError("Encountered all NA values")
+
+        pos = int(np.searchsorted(heights, height))
+        lo, hi = max(pos - 1, 0), min(pos, n - 1)
+        d_lo, d_hi = abs(heights[lo] - height), abs(heights[hi] - height)
+        first = last = hi if d_hi < d_lo else lo
+        distance = min(d_lo, d_hi)
+
+        # Differences can round to the same value for several rows
+        while first > 0 and abs(heights[first - 1] - height) == distance:
+            first -= 1
+        while last < n - 1 and abs(heights[last + 1] - height) == distance:
+            last += 1
+        rows = self.wfh_rows[sex]
+        return first + int(np.argmin(rows[first:last + 1])) if last > first else first
+
+    def interpolated_height_row(self, sex, height):
+        """Return (median, sd) interpolated at height from the dense grid.
+
+        Heights outside the table are clamped to its first or last row, as
+        the nearest-row lookup does.
+        """
+        grid = self.wfh_grid[sex]
+        if len(grid) == 0:
+            raise ValueError("No valid height data available")
+        if height != height:
+            raise ValueError("Height is not a number")
+        i = (height - self.wfh_grid_start[sex]) / self.wfh_grid_step + 0.5
+        i = 0 if i < 0 else min(int(i), len(grid) - 1)
+        return float(grid[i, 0]), float(grid[i, 1])
+
+    def interpolated_height_rows(self, sexes, heights):
+        """Vectorized interpolated_height_row, returning (medians, sds, found)"""
+        heights = np.asarray(heights, dtype=np.float64)
+        medians = np.zeros_like(heights)
+        sds = np.zeros_like(heights)
+        found = ~np.isnan(heights)
+
+        for sex, grid in enumerate(self.wfh_grid):
+            mask = (sexes == sex) & found
+            if not mask.any():
+                continue
+            if len(grid) == 0:
+                raise ValueError("No valid height data available")
+            i = (heights[mask] - self.wfh_grid_start[sex]) / self.wfh_grid_step + 0.5
+            i = np.clip(i, 0, len(grid) - 1).astype(np.intp)
+            medians[mask], sds[mask] = grid[i, 0], grid[i, 1]
+
+        return medians, sds, found
+
+    def closest_height_positions(self, sexes, heights):
+        """Position in its sex's sorted table of the row closest_height_row picks, per child.
+
+        Returns (positions, found); found is False for NaN heights, whose
+        positions are meaningless.
+        """
+        heights = np.asarray(heights, dtype=np.float64)
+        positions = np.zeros(len(heights), dtype=np.intp)
+        found = ~np.isnan(heights)
+
+        for sex, table in enumerate(self.wfh_heights):
+            mask = np.flatnonzero((sexes == sex) & found)
+            if len(mask) == 0:
+                continue
+            n = len(table)
+            if n == 0:
+                raise ValueError("No valid height data available")
+
+            h = heights[mask]
+            pos = np.searchsorted(table, h)
+            lo, hi = np.maximum(pos - 1, 0), np.minimum(pos, n - 1)
+            d_lo, d_hi = np.abs(table[lo] - h), np.abs(table[hi] - h)
+            best = np.where(d_hi < d_lo, hi, lo)
+            distance = np.minimum(d_lo, d_hi)
+
+            first, last = best.copy(), best.copy()
+            while True:
+                step = first > 0
+                step[step] = np.abs(table[first[step] - 1] - h[step]) == distance[step]
+                if not step.any():
+                    break
+                first[step] -= 1
+            while True:
+                step = last < n - 1
+                step[step] = np.abs(table[last[step] + 1] - h[step]) == distance[step]
+                if not step.any():
+                    break
+                last[step] += 1
+
+            # Rare exact ties: earliest source row wins
+            rows = self.wfh_rows[sex]
+            for k in np.flatnonzero(last > first):
+                best[k] = first[k] + int(np.argmin(rows[first[k]:last[k] + 1]))
+            positions[mask] = best
+
+        return positions, found
+
+    def closest_height_rows(self, sexes, heights):
+        """Vectorized closest_height_row over arrays of sex indexes and heights.
+
+        Returns (closest, medians, sds, found); found is False for NaN heights,
+        whose other outputs are meaningless.
+        """
+        positions, found = self.closest_height_positions(sexes, heights)
+        closest = np.empty(len(positions))
+        medians = np.empty(len(positions))
+        sds = np.empty(len(positions))
+
+        for sex, table in enumerate(self.wfh_heights):
+            mask = (sexes == sex) & found
+            if not mask.any():
+                continue
+            best = positions[mask]
+            closest[mask] = table[best]
+            medians[mask] = self.wfh_values[sex][best, 0]
+            sds[mask] = self.wfh_values[sex][best, 1]
+
+        return closest, medians, sds, found
+
+
+def _table_ages(df):
+    """Whole-month ages of a table, None for rows that can never match"""
+    ages = []
+    for value in df['AGE'].tolist():
+        # Only numeric cells compare equal to an int age in the DataFrame mask
+        if (isinstance(value, (int, float)) and math.isfinite(value)
+                and value >= 0 and value == int(value)):
+            ages.append(int(value))
+        else:
+            ages.append(None)
+    return ages
+
+
+def _to_float(value):
+    """Numeric coercion of a table cell, NaN when it is not a number"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return float('nan')
+
+
+def _compile_wfh(df, sex):
+    """Clean and sort one weight-for-height table by height"""
+    heights = np.array([_to_float(h) for h in df['HEIGHT'].tolist()], dtype=np.float64)
+    rows = np.flatnonzero(~np.isnan(heights))
+    order = rows[np.argsort(heights[rows], kind='stable')]
+    values = np.column_stack([
+        df[f"{sex.upper()}S_MEDIAN_WEIGHT"].to_numpy(dtype=np.float64)[order],
+        df[f"{sex.upper()}S_SD_WEIGHT"].to_numpy(dtype=np.float64)[order],
+    ]).reshape(-1, 2)
+    return heights[order], values, order
+
+
+def compile_reference_tables(growth_data):
+    """Build ReferenceTables from the DataFrames returned by load_growth_data()"""
+    table_ages = {name: _table_ages(growth_data[name]) for name in AGE_INDICATORS}
+    n_ages = 1 + max(
+        (a for ages in table_ages.values() for a in ages if a is not None),
+        default=-1
+    )
+
+    age_values = np.zeros((len(AGE_INDICATORS), len(SEXES), n_ages, 2))
+    age_present = np.zeros((len(AGE_INDICATORS), n_ages), dtype=bool)
+
+    for i, (name, measure) in enumerate(AGE_INDICATORS.items()):
+        df = growth_data[name]
+        columns = [
+            (df[f"{sex.upper()}S_MEDIAN_{measure}"].to_numpy(dtype=np.float64),
+             df[f"{sex.upper()}S_SD_{measure}"].to_numpy(dtype=np.float64))
+            for sex in SEXES
+        ]
+        for row, age in enumerate(table_ages[name]):
+            # Keep the first row for an age, as the DataFrame lookup did
+            if age is None or age_present[i, age]:
+                continue
+            age_present[i, age] = True
+            for s, (medians, sds) in enumerate(columns):
+                age_values[i, s, age] = medians[row], sds[row]
+
+    wfh = [_compile_wfh(growth_data[f"wfh_{sex}s"], sex) for sex in SEXES]
+
+    return ReferenceTables(
+        age_values, age_present,
+        [h for h, _, _ in wfh], [v for _, v, _ in wfh], [r for _, _, r in wfh]
+    )
+
+
+def add_lms_tables(tables, lms_tables, restricted=()):
+    """ReferenceTables holding the age tables of tables followed by WHO LMS tables.
+
+    lms_tables maps table names to (present, values): present marks the
+    whole-month ages a table lists and values holds their (L, M, S) rows
+    with shape (sex, age, 3). restricted names the tables WHO scores with
+    its restricted method. The weight-for-height arrays are shared.
+    """
+    names = tables.indicators + tuple(lms_tables)
+    n_ages = max([tables.max_age + 1] + [len(present) for present, _ in lms_tables.values()])
+    age_values = np.zeros((len(names), len(SEXES), n_ages, 2))
+    age_present = np.zeros((len(names), n_ages), dtype=bool)
+    age_l = np.full((len(names), len(SEXES), n_ages), np.nan)
+
+    n = len(tables.indicators)
+    age_values[:n, :, :tables.max_age + 1] = tables.age_values
+    age_present[:n, :tables.max_age + 1] = tables.age_present
+    age_l[:n, :, :tables.max_age + 1] = tables.age_l
+    for i, (present, values) in enumerate(lms_tables.values(), n):
+        ages = np.flatnonzero(present)
+        age_present[i, ages] = True
+        age_l[i][:, ages] = values[:, ages, 0]
+        age_values[i][:, ages] = values[:, ages, 1:]
+
+    restricted = [name for name, r in zip(tables.indicators, tables.restricted) if r] + [
+        name for name in lms_tables if name in restricted
+    ]
+    return ReferenceTables(
+        age_values, age_present, tables.wfh_heights, tables.wfh_values, tables.wfh_rows,
+        names, age_l, restricted
+    )
+
+
+def array_checksum(arrays):
+    """Short SHA-256 of the shapes, types and contents of a list of arrays"""
+    digest = hashlib.sha256()
+    for array in arrays:
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def file_checksum(path):
+    """SHA-256 of a file's contents, or None if the file does not exist"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def save_reference_tables(tables, path, source_checksum):
+    """Write compiled tables to an uncompressed .npz artifact, atomically.
+
+    Only the workbook's tables are written; add_lms_tables() appends the
+    LMS tables after loading.
+    """
+    n = len(AGE_INDICATORS)
+    arrays = {
+        'version': np.array(ARTIFACT_VERSION),
+        'source_sha256': np.array(source_checksum or ''),
+        'age_values': tables.age_values[:n],
+        'age_present': tables.age_present[:n],
+    }
+    for s, sex in enumerate(SEXES):
+        arrays[f'wfh_heights_{sex}'] = tables.wfh_heights[s]
+        arrays[f'wfh_values_{sex}'] = tables.wfh_values[s]
+        arrays[f'wfh_rows_{sex}'] = tables.wfh_rows[s]
+    write_npz(path, arrays)
+
+
+def write_npz(path, arrays):
+    """Write arrays to an uncompressed .npz, replacing path atomically"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def map_npz(path):
+    """Memory-map every array member of an uncompressed .npz read-only.
+
+    The pages come from the OS page cache, so every process mapping the same
+    artifact shares one copy of the tables.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} is compressed and cannot be mapped")
+
+            # Skip the local file header, whose extra field may differ from the central directory
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(f"{info.filename} holds Python objects")
+
+            name = info.filename[:-len('.npy')]
+            if shape == ():
+                arrays[name] = np.fromfile(f, dtype=dtype, count=1).reshape(())
+            else:
+                arrays[name] = np.memmap(
+                    path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                    order='F' if fortran_order else 'C'
+                )
+    return arrays
+
+
+def load_reference_tables(path, source_checksum=None, mmap=False):
+    """Read a tables artifact, memory-mapping its arrays when mmap is true.
+
+    Returns None if the file is missing, unreadable, from another artifact
+    version or, when source_checksum is given, built from a different source.
+    """
+    try:
+        if mmap:
+            data = map_npz(path)
+        else:
+            with np.load(path, allow_pickle=False) as archive:
+                data = {name: archive[name] for name in archive.files}
+
+        if int(data['version']) != ARTIFACT_VERSION:
+            return None
+        if source_checksum and str(data['source_sha256']) != source_checksum:
+            return None
+        return ReferenceTables(
+            data['age_values'], data['age_present'],
+            [data[f'wfh_heights_{sex}'] for sex in SEXES],
+            [data[f'wfh_values_{sex}'] for sex in SEXES],
+            [data[f'wfh_rows_{sex}'] for sex in SEXES],
+        )
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile, struct.error):
+        return None
@@ -0,0 +1,178 @@
+"""Bounded LRU cache of rendered responses, optionally backed by a shared store.
+
+Screening sessions repeat the same rounded measurements many times, so the
+rendered response for a normalized input tuple is cached in-process. A shared
+backend lets gunicorn workers reuse each other's results: SqliteBackend keeps
+them in a local file, MemoryBackend is an in-process stand-in with the same
+interface.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """Dict-backed stand-in for a shared backend"""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class SqliteBackend:
+    """Shared cache in a local SQLite file, safe to use from several processes.
+
+    Errors are treated as misses so the cache never fails a request, and each
+    distinct error is logged once.
+    """
+
+    def __init__(self, path, maxsize=100000):
+        self.path = path
+        self.maxsize = maxsize
+        self._connection = None
+        self._pid = None
+        self._writes = 0
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Connections must not cross a fork, so each worker opens its own
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=0.05, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB)"
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT value FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            self._report(e)
+            return None
+
+    def set(self, key, value):
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO responses (key, value) VALUES (?, ?)", (key, value)
+                    )
+                    # Trim the oldest rows now and then rather than on every write
+                    self._writes += 1
+                    if self._writes % 1000 == 0:
+                        connection.execute(
+                            "DELETE FROM responses WHERE rowid <= "
+                            "(SELECT MAX(rowid) FROM responses) - ?", (self.maxsize,)
+                        )
+        except sqlite3.Error as e:
+            self._report(e)
+
+    def _report(self, error):
+        if str(error) != self._error:
+            logger.warning("Shared response cache %s unavailable: %s", self.path, error)
+        self._error = str(error)
+
+
+def backend_from_config(spec):
+    """Shared backend from a config string: '', 'memory' or 'sqlite:<path>'"""
+    if not spec:
+        return None
+    if spec == 'memory':
+        return MemoryBackend()
+    if spec.startswith('sqlite:'):
+        return SqliteBackend(spec[len('sqlite:'):])
+    raise ValueError(f"Unknown cache backend {spec!r}")
+
+
+class ResponseCache:
+    """Thread-safe LRU of response bodies with hit, miss and eviction counters.
+
+    A maxsize of 0 keeps nothing in-process, leaving only the backend.
+    """
+
+    def __init__(self, maxsize=4096, backend=None):
+        self.maxsize = maxsize
+        self.backend = backend
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value for key, or None"""
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self.backend is not None:
+            value = self.backend.get(repr(key))
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Cache value locally and in the shared backend"""
+        self._store(key, value)
+        if self.backend is not None:
+            self.backend.set(repr(key), value)
+
+    def _store(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Counters and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "backend": type(self.backend).__name__ if self.backend else None
+            }
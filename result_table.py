@@ -0,0 +1,185 @@
+"""Precomputed Z-scores and status bands for the quantized input space.
+
+Screening ages are whole months and heights and weights are recorded to
+0.1, so the whole plausible input space can be scored once at build time.
+build_result_table.py does this through the live scoring code. Each rounded
+Z-score is stored as int16 hundredths next to its uint8 status band, in an
+uncompressed .npz that is memory-mapped like the reference tables. Serving a
+tabulated child is one array index per indicator. Anything off the grid or
+not tabulated falls back to the live path.
+"""
+import math
+import struct
+import zipfile
+
+import numpy as np
+
+from recommendations import INDICATORS
+from reference_tables import SEXES, map_npz, write_npz
+
+RESULT_TABLE_VERSION = 1
+
+# Indicator names, in the order of recommendations.INDICATORS
+NAMES = ('height_for_age', 'weight_for_age', 'weight_for_height')
+
+# Code for values the table does not hold; the live path decides those
+MISSING = int(np.iinfo(np.int16).min)
+
+MAX_AGE = 60
+
+# Default grids in cm and kg, roughly +/-5 SD around the tabulated medians
+HEIGHT_RANGE = (35.0, 135.0)
+WEIGHT_RANGE = (0.5, 35.0)
+
+
+def grid_tenths(start, stop):
+    """Integer tenths from start to stop inclusive"""
+    return np.arange(round(start * 10), round(stop * 10) + 1)
+
+
+def encode_z_scores(z_scores):
+    """Z-scores rounded as the API rounds them, as int16 hundredths.
+
+    Values that are not finite or do not fit in an int16 become MISSING.
+    """
+    codes = np.full(len(z_scores), MISSING, dtype=np.int16)
+    for i, z in enumerate(np.asarray(z_scores, dtype=np.float64).tolist()):
+        if math.isfinite(z):
+            code = round(round(z, 2) * 100)
+            if MISSING < code <= np.iinfo(np.int16).max:
+                codes[i] = code
+    return codes
+
+
+def status_bands(indicator, codes):
+    """Status band of each code, as RecommendationEngine.band gives for code / 100"""
+    thresholds = INDICATORS[indicator][1]
+    return np.searchsorted(thresholds, codes / 100, side='right').astype(np.uint8)
+
+
+def _grid_index(value, start, size):
+    """Position of value on a 0.1 grid starting at start tenths, or None if off the grid"""
+    if not start / 10 <= value <= (start + size - 1) / 10:
+        return None
+    tenths = round(value * 10)
+    if tenths / 10 != value:
+        return None
+    return tenths - start
+
+
+class ResultTable:
+    """Z-score codes and status bands over ages x heights x weights, per sex.
+
+    codes[0] and bands[0] (height-for-age) are indexed [sex, age, height],
+    codes[1] and bands[1] (weight-for-age) [sex, age, weight], and codes[2]
+    and bands[2] (weight-for-height) [sex, height, weight]. Heights and
+    weights are grid positions counted from height_start and weight_start
+    tenths.
+    """
+
+    def __init__(self, height_start, weight_start, codes, bands):
+        self.height_start = int(height_start)
+        self.weight_start = int(weight_start)
+        # Plain ndarray views of mapped arrays; np.memmap indexing is several times slower
+        self.codes = tuple(np.asarray(a) for a in codes)
+        self.bands = tuple(np.asarray(a) for a in bands)
+        self.max_age = self.codes[0].shape[1] - 1
+        self.n_heights = self.codes[0].shape[2]
+        self.n_weights = self.codes[1].shape[2]
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.codes + self.bands)
+
+    def lookup(self, sex, age, height, weight):
+        """((height_z, weight_z, wfh_z), (bands)) for a tabulated child, or None.
+
+        Only whole-month ages and weight-for-height from the nearest table row
+        are tabulated.
+        """
+        if type(age) is not int or not 1 <= age <= self.max_age:
+            return None
+        h = _grid_index(height, self.height_start, self.n_heights)
+        w = _grid_index(weight, self.weight_start, self.n_weights)
+        if h is None or w is None:
+            return None
+
+        height_code = self.codes[0].item(sex, age, h)
+        weight_code = self.codes[1].item(sex, age, w)
+        wfh_code = self.codes[2].item(sex, h, w)
+        if MISSING in (height_code, weight_code, wfh_code):
+            return None
+        return (height_code / 100, weight_code / 100, wfh_code / 100), (
+            self.bands[0].item(sex, age, h), self.bands[1].item(sex, age, w),
+            self.bands[2].item(sex, h, w)
+        )
+
+
+def compile_result_table(score_age, score_wfh, height_range=HEIGHT_RANGE,
+                         weight_range=WEIGHT_RANGE, max_age=MAX_AGE):
+    """Score every grid point with the live scoring functions.
+
+    score_age(indicator, sexes, ages, values) and score_wfh(sexes, heights,
+    weights) return (z_scores, found) arrays for whole-month ages and
+    nearest-row weight-for-height. Points that are not found are MISSING.
+    """
+    height_tenths = grid_tenths(*height_range)
+    weight_tenths = grid_tenths(*weight_range)
+    heights = height_tenths / 10
+    weights = weight_tenths / 10
+    ages = np.arange(max_age + 1)
+
+    def score(fn, *axes):
+        grids = np.meshgrid(np.arange(len(SEXES)), *axes, indexing='ij')
+        z_scores, found = fn(*(grid.ravel() for grid in grids))
+        codes = encode_z_scores(z_scores)
+        codes[~np.asarray(found, dtype=bool)] = MISSING
+        return codes.reshape(grids[0].shape)
+
+    codes = [
+        score(lambda s, a, v: score_age('height', s, a, v), ages, heights),
+        score(lambda s, a, v: score_age('weight', s, a, v), ages, weights),
+        score(score_wfh, heights, weights),
+    ]
+    # Ages below one month are never served
+    codes[0][:, 0] = MISSING
+    codes[1][:, 0] = MISSING
+
+    bands = [status_bands(i, code) for i, code in enumerate(codes)]
+    return ResultTable(height_tenths[0], weight_tenths[0], codes, bands)
+
+
+def save_result_table(table, path, source_checksum):
+    """Write a result table to an uncompressed .npz, atomically"""
+    arrays = {
+        'version': np.array(RESULT_TABLE_VERSION),
+        'source_sha256': np.array(source_checksum or ''),
+        'height_start': np.array(table.height_start),
+        'weight_start': np.array(table.weight_start),
+    }
+    for name, codes, bands in zip(NAMES, table.codes, table.bands):
+        arrays[f'{name}_z'] = codes
+        arrays[f'{name}_band'] = bands
+    write_npz(path, arrays)
+
+
+def load_result_table(path, source_checksum=None, mmap=True):
+    """Read a result table, or None if it is missing, unreadable or stale"""
+    try:
+        if mmap:
+            data = map_npz(path)
+        else:
+            with np.load(path, allow_pickle=False) as archive:
+                data = {name: archive[name] for name in archive.files}
+
+        if int(data['version']) != RESULT_TABLE_VERSION:
+            return None
+        if source_checksum and str(data['source_sha256']) != source_checksum:
+            return None
+        return ResultTable(
+            data['height_start'], data['weight_start'],
+            [data[f'{name}_z'] for name in NAMES],
+            [data[f'{name}_band'] for name in NAMES]
+        )
+    except (OSError, KeyError, ValueError, IndexError, zipfile.BadZipFile, struct.error):
+        return None
@@ -0,0 +1,351 @@
+"""Score CSV or NDJSON files of child measurements offline.
+
+Rows are read and scored in fixed-size chunks through the same validation,
+Z-score and classify_growth logic as the API, and results are written as
+each chunk finishes, so memory use does not grow with the input. With
+--workers the chunks are scored in a pool of processes, each mapping the
+compiled reference tables read-only. Results are still written in input
+order, so the output is the same for any number of workers.
+
+Besides CSV and NDJSON, results can be streamed as Parquet or Arrow (see
+columnar.py), with float32 Z-scores and dictionary-encoded statuses. NPZ
+cannot be appended to, so it is refused here.
+
+    python score_bulk.py registry.csv scored.csv
+    python score_bulk.py visits.ndjson - --output-format ndjson
+    python score_bulk.py national.csv scored.csv --workers 0
+    python score_bulk.py national.csv scored.parquet --workers 0
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import columnar
+import nutriscout
+from nutriscout import (
+    DATASET_PATH, TABLES_PATH, empty_scores, load_growth_data, score_record_columns,
+    score_records
+)
+from reference_tables import (
+    compile_reference_tables, file_checksum, load_reference_tables, save_reference_tables
+)
+
+INDICATORS = [
+    ('height', 'Height'),
+    ('weight_for_age', 'Weight-for-Age'),
+    ('weight_for_height', 'Weight-for-Height'),
+]
+
+RESULT_FIELDS = [
+    field
+    for name, _ in INDICATORS
+    for field in (f"{name}_z", f"{name}_status")
+] + ['error']
+
+
+# Output formats by file extension, beyond the csv default
+EXTENSIONS = {
+    '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.parquet': 'parquet', '.arrow': 'arrow',
+    '.feather': 'arrow', '.npz': 'npz',
+}
+
+
+def detect_format(path, explicit):
+    """Pick a format from an explicit option or the file extension"""
+    if explicit:
+        return explicit
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+
+def read_ndjson(lines):
+    """Yield each non-blank NDJSON line as a parsed value"""
+    for line in lines:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def read_blocks(lines, size, quoted=False):
+    """Group raw input lines into lists of about size records.
+
+    With quoted (CSV), a block only ends where the double quotes seen so far
+    balance, so a quoted field spanning several lines stays in one block.
+    """
+    block, open_quote = [], False
+    for line in lines:
+        block.append(line)
+        if quoted and line.count('"') % 2:
+            open_quote = not open_quote
+        if len(block) >= size and not open_quote:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def parse_block(input_format, header, lines):
+    """Records of one block of raw lines; header is the CSV column names"""
+    if input_format == 'csv':
+        return list(csv.DictReader(lines, fieldnames=header))
+    return list(read_ndjson(lines))
+
+
+def flatten_result(record, result):
+    """Flat CSV row for one input record and its scoring result"""
+    row = dict(record) if isinstance(record, dict) else {}
+    if "error" in result:
+        row['error'] = result["error"]
+        return row
+    for name, key in INDICATORS:
+        row[f"{name}_z"] = result[key]["Z-score"]
+        row[f"{name}_status"] = result[key]["Status"]
+    return row
+
+
+def input_fields(first_record, result_fields):
+    """Input columns carried into the output, taken from the first record"""
+    return [
+        field for field in (first_record if isinstance(first_record, dict) else {})
+        if field not in result_fields
+    ]
+
+
+class TextResultFormatter:
+    """Scores a chunk through score_records() and formats the results as text"""
+
+    def score(self, records):
+        """(text, errors) for a chunk of records"""
+        results = score_records(records)
+        errors = sum(1 for result in results if "error" in result)
+        return self.format(records, results), errors
+
+
+class CsvResultFormatter(TextResultFormatter):
+    """Flattened results as CSV, with the input columns of the first record"""
+
+    def __init__(self):
+        self.fieldnames = None
+
+    def start(self, first_record):
+        """Fix the columns from the first record and return the header line"""
+        self.fieldnames = input_fields(first_record, RESULT_FIELDS) + RESULT_FIELDS
+        return self.format_rows([dict(zip(self.fieldnames, self.fieldnames))])
+
+    def format(self, records, results):
+        return self.format_rows(
+            flatten_result(record, result) for record, result in zip(records, results)
+        )
+
+    def format_rows(self, rows):
+        text = io.StringIO()
+        csv.DictWriter(
+            text, fieldnames=self.fieldnames, extrasaction='ignore', lineterminator='\n'
+        ).writerows(rows)
+        return text.getvalue()
+
+
+class NdjsonResultFormatter(TextResultFormatter):
+    """One JSON result object per line"""
+
+    def start(self, first_record):
+        return ''
+
+    def format(self, records, results):
+        return ''.join(json.dumps(result) + '\n' for result in results)
+
+
+class ColumnarResultFormatter:
+    """Result columns for a ColumnarWriter, after the input columns of the first record.
+
+    Input values are carried over as strings, as in CSV output.
+    """
+
+    def __init__(self):
+        self.input_fields = None
+
+    def start(self, first_record):
+        self.input_fields = input_fields(first_record, columnar.result_columns(empty_scores(0)))
+        return None
+
+    def score(self, records):
+        """(columns, errors) for a chunk of records"""
+        scores = score_record_columns(records)
+        columns = {}
+        for field in self.input_fields:
+            values = (record.get(field) if isinstance(record, dict) else None for record in records)
+            columns[field] = [None if value is None else str(value) for value in values]
+        columns.update(columnar.result_columns(scores))
+        return columns, int((scores['status'] != 200).sum())
+
+
+def score_block(input_format, header, formatter, lines):
+    """Parse, score and format one block of input lines: (output, rows, errors)"""
+    records = parse_block(input_format, header, lines)
+    output, errors = formatter.score(records)
+    return output, len(records), errors
+
+
+def ensure_tables_artifact():
+    """Write the compiled tables artifact if it is missing or stale.
+
+    Workers then map it read-only instead of each parsing dataset.xlsx.
+    """
+    checksum = file_checksum(DATASET_PATH)
+    if checksum and load_reference_tables(TABLES_PATH, checksum, mmap=True) is None:
+        save_reference_tables(compile_reference_tables(load_growth_data()), TABLES_PATH, checksum)
+        print(f"Wrote {TABLES_PATH} from {DATASET_PATH}", file=sys.stderr)
+
+
+def init_worker():
+    """Map the reference tables once per worker process"""
+    nutriscout.get_growth_tables()
+
+
+def ordered_map(executor, function, jobs, window):
+    """Results of function(*job) for each job, in order, with at most window jobs in flight"""
+    pending = deque()
+    for job in jobs:
+        pending.append(executor.submit(function, *job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def score_stream(lines, input_format, formatter, stream, chunk_size=10000, progress=None,
+                 workers=1):
+    """Score an iterator of raw input lines chunk by chunk, returning (rows, errors).
+
+    stream takes each chunk's output: a text file, or a ColumnarWriter.
+    """
+    lines = iter(lines)
+    header = next(csv.reader(lines), None) if input_format == 'csv' else None
+    blocks = read_blocks(lines, chunk_size, quoted=input_format == 'csv')
+
+    # The first record fixes the CSV output columns before any block is farmed out;
+    # without any, the input header does, so the output still has its column row
+    records = []
+    for first in blocks:
+        records = parse_block(input_format, header, first)
+        if records:
+            break
+    header_text = formatter.start(records[0] if records else dict.fromkeys(header or ()))
+    if header_text:
+        stream.write(header_text)
+    if not records:
+        return 0, 0
+
+    def jobs():
+        yield input_format, header, formatter, first
+        for block in blocks:
+            yield input_format, header, formatter, block
+
+    total = errors = 0
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, initializer=init_worker)
+        results = ordered_map(executor, score_block, jobs(), workers * 2)
+    else:
+        results = (score_block(*job) for job in jobs())
+    try:
+        for output, rows, block_errors in results:
+            stream.write(output)
+            total += rows
+            errors += block_errors
+            if progress:
+                progress(total)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return total, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help="input file, or - for stdin")
+    parser.add_argument('output', help="output file, or - for stdout")
+    parser.add_argument('--input-format', choices=['csv', 'ndjson'])
+    parser.add_argument('--output-format', choices=['csv', 'ndjson', *columnar.STREAM_FORMATS],
+                        help="parquet and arrow need pyarrow")
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help="records scored together (default: 10000)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="scoring processes, 0 for one per CPU (default: 1)")
+    parser.add_argument('--quiet', action='store_true', help="no progress on stderr")
+    args = parser.parse_args(argv)
+
+    input_format = detect_format(args.input, args.input_format)
+    if args.output == '-':
+        output_format = args.output_format or input_format
+    else:
+        output_format = detect_format(args.output, args.output_format)
+    workers = args.workers or os.cpu_count() or 1
+    binary = output_format in columnar.FORMATS
+    if binary:
+        try:
+            columnar.check_format(output_format)
+        except ValueError as e:
+            parser.error(str(e))
+        if output_format not in columnar.STREAM_FORMATS:
+            parser.error(f"{output_format} output cannot be streamed, write "
+                         f"{' or '.join(columnar.STREAM_FORMATS)} instead")
+
+    # Load the tables before forking, so forked workers inherit the mapping
+    if workers > 1:
+        ensure_tables_artifact()
+    nutriscout.get_growth_tables()
+
+    source = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    if binary:
+        target = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    elif args.output == '-':
+        target = sys.stdout
+    else:
+        target = open(args.output, 'w', newline='', encoding='utf-8')
+
+    started = time.perf_counter()
+
+    def progress(total):
+        if not args.quiet:
+            elapsed = time.perf_counter() - started
+            print(f"\r{total} rows, {total / elapsed:,.0f} rows/s", end='', file=sys.stderr)
+
+    try:
+        if binary:
+            formatter = ColumnarResultFormatter()
+            stream = columnar.ColumnarWriter(target, output_format)
+        else:
+            formatter = CsvResultFormatter() if output_format == 'csv' else NdjsonResultFormatter()
+            stream = target
+        total, errors = score_stream(
+            source, input_format, formatter, stream, args.chunk_size, progress, workers
+        )
+        if binary:
+            stream.close()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target not in (sys.stdout, sys.stdout.buffer):
+            target.close()
+
+    elapsed = time.perf_counter() - started
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(
+        f"Scored {total} rows ({errors} errors) in {elapsed:.2f}s, "
+        f"{total / elapsed if elapsed else 0:,.0f} rows/s",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
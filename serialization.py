@@ -0,0 +1,67 @@
+"""JSON encoding of API responses, using orjson when it is installed.
+
+Every encoder writes compact JSON with sorted keys and a trailing newline,
+the same document as Flask's jsonify outside debug mode. orjson may spell
+some numbers differently (5e-6 for 5e-06) and leaves non-ASCII text as
+UTF-8, but the values are identical. It writes NaN and infinities as null,
+so documents holding any are encoded with the json module instead, which
+keeps NaN and Infinity the way Flask does.
+"""
+import functools
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(obj):
+    """Encode with the standard library, byte for byte as jsonify does"""
+    return (json.dumps(obj, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+def finite(obj):
+    """Whether every float in a document is finite"""
+    if isinstance(obj, float):
+        return math.isfinite(obj)
+    if isinstance(obj, dict):
+        return all(finite(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return all(finite(value) for value in obj)
+    return True
+
+
+def dumps_orjson(obj):
+    """Encode with orjson, falling back to dumps_json for non-finite floats"""
+    if not finite(obj):
+        return dumps_json(obj)
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+    except TypeError:
+        # orjson.JSONEncodeError, e.g. integers beyond 64 bits
+        return dumps_json(obj)
+
+
+ENCODERS = {'json': dumps_json, 'orjson': dumps_orjson}
+
+
+class Serializer:
+    """Response encoder chosen by name: 'json', 'orjson', or 'auto' for orjson when installed"""
+
+    def __init__(self, name='auto'):
+        if name == 'auto':
+            name = 'orjson' if orjson is not None else 'json'
+        if name not in ENCODERS:
+            raise ValueError(f"Unknown JSON encoder {name!r}")
+        if name == 'orjson' and orjson is None:
+            raise ValueError("The orjson encoder needs the orjson package")
+        self.name = name
+        self.dumps = ENCODERS[name]
+        # Error bodies are mostly a handful of fixed messages, so keep them encoded
+        self.error = functools.lru_cache(maxsize=1024)(self._error)
+
+    def _error(self, message):
+        """Encoded {"error": message}"""
+        return self.dumps({"error": message})
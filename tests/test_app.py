@@ -0,0 +1,30 @@
+import pytest
+
+import app
+import nutriscout
+from response_cache import MemoryBackend, ResponseCache
+
+CHILD = {"age": 24, "gender": "girl", "height": 82.5, "weight": 10.1, "location": "Central"}
+
+
+@pytest.fixture
+def child():
+    return nutriscout.validate_child(CHILD)[0]
+
+
+def test_cache_keys_identify_the_growth_tables(monkeypatch, child):
+    engine = nutriscout.recommendation_store.get()
+    key = app.response_key(child, engine)
+    assert nutriscout.get_growth_tables().fingerprint in key
+
+    monkeypatch.setattr(nutriscout.get_growth_tables(), 'fingerprint', 'rebuilt')
+    assert app.response_key(child, engine) != key
+
+
+def test_shared_backend_is_used_without_a_local_cache(monkeypatch, child):
+    engine = nutriscout.recommendation_store.get()
+    monkeypatch.setattr(app, 'response_cache', ResponseCache(0, MemoryBackend()))
+    assert app.response_key(child, engine) is not None
+
+    monkeypatch.setattr(app, 'response_cache', ResponseCache(0))
+    assert app.response_key(child, engine) is None
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import pytest
+
+import app
+import asgi
+
+
+def request(method, path, body=b'', content_type=b'application/json'):
+    """(status, headers, body) of one request to the ASGI app"""
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+             'headers': [(b'content-type', content_type)]}
+    messages = [{'type': 'http.request', 'body': body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    start, response_body = sent
+    return start['status'], dict(start['headers']), response_body['body']
+
+
+@pytest.mark.parametrize("path", ['/cache_stats', '/metrics'])
+def test_head_on_get_routes_sends_headers_only(path):
+    status, headers, body = request('HEAD', path)
+    _, get_headers, get_body = request('GET', path)
+    assert status == 200
+    assert body == b''
+    assert headers[b'content-type'] == get_headers[b'content-type']
+    assert int(headers[b'content-length']) > 0
+
+
+def test_head_on_post_routes_is_not_allowed():
+    status, headers, _ = request('HEAD', '/get_nutrition_recommendations')
+    assert status == 405
+    assert headers[b'allow'] == b'POST, OPTIONS'
+
+
+def test_options_lists_head_for_get_routes():
+    assert request('OPTIONS', '/cache_stats')[1][b'allow'] == b'GET, HEAD, OPTIONS'
+
+
+def test_recommendations_match_the_flask_app():
+    child = {"age": 24, "gender": "girl", "height": 82.5, "weight": 10.1, "location": "Central"}
+    status, _, body = request('POST', '/get_nutrition_recommendations', json.dumps(child).encode())
+    flask_response = app.app.test_client().post('/get_nutrition_recommendations', json=child)
+    assert (status, body) == (flask_response.status_code, flask_response.data)
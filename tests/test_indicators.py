@@ -0,0 +1,179 @@
+import bisect
+
+import numpy as np
+import pytest
+
+import nutriscout
+from indicators import REGISTRY, available_indicators
+
+CHILD = {"age": 24, "gender": "girl", "height": 85.0, "weight": 11.5, "location": "Central",
+         "muac": 15.5, "head_circumference": 47.0}
+
+NEW_INDICATORS = ('bmi_for_age', 'muac_for_age', 'head_circumference_for_age')
+
+
+def lms_table(name, gender):
+    return nutriscout.get_lms_tables()[name, nutriscout.SEXES.index(gender)]
+
+
+def test_new_indicators_are_shipped():
+    assert set(NEW_INDICATORS) <= available_indicators(nutriscout.get_growth_tables())
+
+
+@pytest.mark.parametrize("name", NEW_INDICATORS)
+@pytest.mark.parametrize("gender", ['boy', 'girl'])
+def test_scores_the_median_as_normal(name, gender):
+    child = dict(CHILD, gender=gender, indicators=[name])
+    median = lms_table(name, gender).m[list(lms_table(name, gender).axis).index(24)]
+    if name == 'bmi_for_age':
+        child['weight'] = median * (child['height'] / 100) ** 2
+    else:
+        child[REGISTRY[name].measure] = median
+
+    entry = nutriscout.assess(child)[REGISTRY[name].key]
+
+    assert entry["Z-score"] == 0.0
+    assert entry["Status"] == "Normal"
+
+
+# Published WHO SD lines, rounded to 0.1: (table, gender, age, SD, measurement)
+WHO_SD_LINES = [
+    ('head_circumference_for_age', 'boy', 0, -3, 30.7),
+    ('head_circumference_for_age', 'boy', 0, 2, 37.0),
+    ('head_circumference_for_age', 'girl', 36, -2, 45.7),
+    ('bmi_for_age', 'girl', 60, -2, 12.7),
+    ('bmi_for_age', 'girl', 60, -3, 11.6),
+    ('bmi_for_age', 'boy', 6, 3, 22.3),
+]
+
+
+@pytest.mark.parametrize("name, gender, age, sd, value", WHO_SD_LINES)
+def test_matches_who_sd_lines(name, gender, age, sd, value):
+    assert lms_table(name, gender).z_score(age, value) == pytest.approx(sd, abs=0.05)
+
+
+@pytest.mark.parametrize("name", NEW_INDICATORS)
+def test_cutoffs_agree_with_z_scores(name):
+    indicator = REGISTRY[name]
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        gender = rng.choice(['boy', 'girl'])
+        age = int(rng.integers(3, 61))
+        child = dict(CHILD, gender=gender, age=age, indicators=[name])
+        table = lms_table(name, gender)
+        median = table.m[list(table.axis).index(age)]
+        value = float(median * rng.uniform(0.6, 1.5))
+        if name == 'bmi_for_age':
+            child['weight'] = value * (child['height'] / 100) ** 2
+        else:
+            child[indicator.measure] = value
+
+        z_score = nutriscout.assess(child)[indicator.key]["Z-score"]
+        status = nutriscout.assess(child, z_scores=False)[indicator.key]["Status"]
+        assert status == indicator.labels[bisect.bisect_right(indicator.thresholds, z_score)]
+
+
+def test_scores_continuous_ages():
+    child = dict(CHILD, age_days=400, indicators=list(NEW_INDICATORS))
+    response = nutriscout.assess(child)
+    for name in NEW_INDICATORS:
+        assert response[REGISTRY[name].key]["Status"] in REGISTRY[name].labels
+
+
+def test_muac_has_no_data_before_three_months():
+    with pytest.raises(nutriscout.ScoringError) as error:
+        nutriscout.assess(dict(CHILD, age=2, indicators=['muac_for_age']))
+    assert error.value.status == 404
+
+
+def test_reports_child_and_assessment_errors_together():
+    with pytest.raises(nutriscout.ScoringError) as error:
+        nutriscout.assess(dict(CHILD, gender="x", muac=-1, indicators=['bogus']))
+    assert error.value.status == 400
+    assert set(error.value.errors) == {'gender', 'muac', 'indicators'}
+
+
+def test_batches_reject_indicators():
+    results = nutriscout.score_records([dict(CHILD, indicators=['bmi_for_age']), CHILD])
+    assert results[0]["status"] == 400
+    assert results[0]["error"] == nutriscout.BATCH_INDICATORS_MESSAGE
+    assert "Height" in results[1]
+
+
+@pytest.mark.parametrize("name, advice", [('bmi_for_age', "Low BMI"), ('muac_for_age', "Low MUAC")])
+def test_low_scores_get_their_own_advice(name, advice):
+    child = dict(CHILD, muac=10.0, weight=7.0, indicators=[name])
+    entry = nutriscout.assess(child)[REGISTRY[name].key]
+    assert entry["Status"] == REGISTRY[name].labels[0]
+    assert entry["Recommendation"] == nutriscout.REGION_RECOMMENDATIONS["Central"][advice]
+
+
+def test_lms_tables_share_the_age_arrays():
+    tables = nutriscout.get_growth_tables()
+    for name in NEW_INDICATORS:
+        i = tables.indicators.index(name)
+        assert tables.lms[i]
+        _, m, _ = tables.age_row(name, 'girl', 24)
+        assert m == lms_table(name, 'girl').m[list(lms_table(name, 'girl').axis).index(24)]
+    assert tables.lms[:2] == (False, False)
+
+
+def children(size, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for k in range(size):
+        child = dict(CHILD, gender=str(rng.choice(['boy', 'girl'])), age=int(rng.integers(0, 61)),
+                     height=float(rng.uniform(50, 115)), weight=float(rng.uniform(3, 25)),
+                     muac=float(rng.uniform(9, 20)), head_circumference=float(rng.uniform(32, 54)))
+        if k % 5 == 1:
+            child.update(age_mode='continuous', age=float(rng.uniform(1, 60)))
+        if k % 7 == 2:
+            del child['muac']
+        rows.append(child)
+    return rows
+
+
+@pytest.mark.parametrize("z_scores", [True, False])
+def test_score_many_scores_any_indicators_as_assess_does(z_scores):
+    records = children(300)
+    scores = nutriscout.score_many(
+        nutriscout.MEASUREMENTS_SCHEMA.record_columns(records), z_scores, list(REGISTRY)
+    )
+    for i, child in enumerate(records):
+        try:
+            expected = nutriscout.assess(dict(child, indicators=list(REGISTRY)), z_scores)
+        except nutriscout.ScoringError as error:
+            assert scores['status'][i] == error.status
+            assert scores['error'][i] == str(error)
+            continue
+        assert scores['status'][i] == 200
+        for name, indicator in REGISTRY.items():
+            entry = expected[indicator.key]
+            assert indicator.labels[scores[f"{name}_band"][i]] == entry["Status"]
+            if z_scores:
+                assert scores[f"{name}_z"][i] == entry["Z-score"]
+
+
+def test_score_many_defaults_to_the_original_indicators():
+    columns = nutriscout.CHILD_SCHEMA.record_columns(children(100))
+    expected = nutriscout.score_many(columns)
+    scores = nutriscout.score_many(columns, indicators=list(nutriscout.DEFAULT_INDICATORS))
+    assert set(scores) == set(expected)
+    for name, column in expected.items():
+        if isinstance(column, np.ndarray):
+            assert np.array_equal(scores[name], column, equal_nan=True)
+        else:
+            assert scores[name] == column
+
+
+def test_score_many_requires_the_measurements_of_its_indicators():
+    scores = nutriscout.score_many({"age": [24], "gender": ["girl"], "height": [85.0],
+                                    "weight": [11.5], "location": ["Central"]},
+                                   indicators=['muac_for_age'])
+    assert scores['status'][0] == 400
+    assert scores['errors'][0] == {'muac': "Missing required field"}
+
+
+def test_score_many_rejects_unknown_indicators():
+    with pytest.raises(ValueError):
+        nutriscout.score_many({"age": [24]}, indicators=['bogus'])
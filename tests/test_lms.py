@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import nutriscout
+from lms import LMSTable, MedianSDTable
+
+
+def test_median_sd_tables_interpolate_the_sd():
+    table = MedianSDTable([0, 1], [10.0, 20.0], [1.0, 3.0])
+    # Halfway the median is 15 and the SD 2, not 15 * mean(0.1, 0.15)
+    assert table.z_score(0.5, 19.0) == 2.0
+    assert table.z_score(0.25, 12.5) == 0.0
+    assert np.isnan(table.z_score(1.5, 19.0))
+    np.testing.assert_array_equal(
+        table.z_scores([0.5, 0.25, 1.5], [19.0, 12.5, 19.0]), [2.0, 0.0, np.nan]
+    )
+
+
+def test_median_sd_tables_with_zero_sd_score_zero():
+    table = MedianSDTable([0, 1], [10.0, 10.0], [0.0, 0.0])
+    assert table.z_score(0.5, 12.0) == 0.0
+    assert table.z_scores([0.5], [12.0]).tolist() == [0.0]
+
+
+@pytest.mark.parametrize("indicator, value", [('height', 82.5), ('weight', 10.1)])
+@pytest.mark.parametrize("gender", ['boy', 'girl'])
+def test_continuous_ages_match_whole_months_at_rows(indicator, value, gender):
+    for age in range(1, 60):
+        months = nutriscout.age_z_score(indicator, gender, age, value, 'months')
+        if months is not None:
+            assert nutriscout.age_z_score(indicator, gender, float(age), value,
+                                          'continuous') == months
+
+
+@pytest.mark.parametrize("gender", ['boy', 'girl'])
+def test_continuous_ages_interpolate_median_and_sd(gender):
+    tables = nutriscout.get_growth_tables()
+    (m0, sd0), (m1, sd1) = (tables.age_row('height', gender, age) for age in (24, 25))
+    expected = (82.5 - (m0 + (m1 - m0) * 0.25)) / (sd0 + (sd1 - sd0) * 0.25)
+    z_score = nutriscout.age_z_score('height', gender, 24.25, 82.5, 'continuous')
+    assert z_score == pytest.approx(expected, rel=1e-12)
+
+
+def test_lms_tables_restrict_beyond_three_sd():
+    table = LMSTable([0, 1], [1.0, 1.0], [10.0, 10.0], [0.1, 0.1], restricted=True)
+    assert table.z_score(0, 14.0) == pytest.approx(4.0)
+    assert table.z_score(0, 6.0) == pytest.approx(-4.0)
@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+from response_cache import MemoryBackend, ResponseCache, SqliteBackend, backend_from_config
+
+
+def test_evicts_least_recently_used():
+    cache = ResponseCache(maxsize=2)
+    cache.put('a', b'1')
+    cache.put('b', b'2')
+    assert cache.get('a') == b'1'
+    cache.put('c', b'3')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1'
+    assert cache.get('c') == b'3'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['size']) == (3, 1, 1, 2)
+
+
+def test_falls_back_to_the_shared_backend():
+    backend = MemoryBackend()
+    ResponseCache(backend=backend).put(('key', 1), b'body')
+
+    cache = ResponseCache(backend=backend)
+    assert cache.get(('key', 1)) == b'body'
+    assert cache.get(('key', 1)) == b'body'
+    assert cache.get(('key', 2)) is None
+    stats = cache.stats()
+    assert (stats['shared_hits'], stats['hits'], stats['misses']) == (1, 1, 1)
+
+
+def test_sqlite_backend_is_shared_between_caches(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    ResponseCache(backend=SqliteBackend(path)).put(('key',), b'body')
+    assert ResponseCache(backend=SqliteBackend(path)).get(('key',)) == b'body'
+
+
+def test_sqlite_errors_are_misses(tmp_path, caplog):
+    backend = SqliteBackend(str(tmp_path / 'missing' / 'cache.sqlite'))
+    cache = ResponseCache(backend=backend)
+
+    cache.put('a', b'1')
+    assert cache.get('a') == b'1'
+    assert cache.get('b') is None
+    assert backend.get('a') is None
+    assert len([r for r in caplog.records if 'unavailable' in r.getMessage()]) == 1
+
+
+def test_sqlite_errors_while_connected_are_misses(tmp_path):
+    backend = SqliteBackend(str(tmp_path / 'cache.sqlite'))
+    backend.set('a', b'1')
+    backend._connection.execute("DROP TABLE responses")
+    assert backend.get('a') is None
+    backend.set('a', b'1')
+
+
+@pytest.mark.parametrize("spec, backend", [
+    ('', type(None)), ('memory', MemoryBackend), ('sqlite:/tmp/x.sqlite', SqliteBackend),
+])
+def test_backend_from_config(spec, backend):
+    assert isinstance(backend_from_config(spec), backend)
+
+
+def test_backend_from_config_rejects_unknown_backends():
+    with pytest.raises(ValueError):
+        backend_from_config('redis://localhost')
+
+
+def test_sqlite_trims_old_rows(tmp_path):
+    backend = SqliteBackend(str(tmp_path / 'cache.sqlite'), maxsize=10)
+    for i in range(1000):
+        backend.set(str(i), b'x')
+    rows = sqlite3.connect(backend.path).execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    assert rows == 10
+    assert backend.get('999') == b'x'
+
+
+def test_zero_size_leaves_only_the_backend():
+    backend = MemoryBackend()
+    cache = ResponseCache(maxsize=0, backend=backend)
+    cache.put('a', b'1')
+    assert cache.get('a') == b'1'
+    stats = cache.stats()
+    assert (stats['size'], stats['evictions'], stats['shared_hits']) == (0, 0, 1)
@@ -0,0 +1,26 @@
+import io
+
+import score_bulk
+
+HEADER = "age,gender,height,weight,location\n"
+
+
+def test_header_only_csv_writes_the_column_row():
+    stream = io.StringIO()
+    rows = score_bulk.score_stream(
+        io.StringIO(HEADER), 'csv', score_bulk.CsvResultFormatter(), stream
+    )
+    assert rows == (0, 0)
+    assert stream.getvalue().splitlines() == [
+        ",".join(["age", "gender", "height", "weight", "location"] + score_bulk.RESULT_FIELDS)
+    ]
+
+
+def test_csv_rows_follow_the_column_row():
+    stream = io.StringIO()
+    rows = score_bulk.score_stream(
+        io.StringIO(HEADER + "24,girl,82.5,10.1,Central\n"), 'csv',
+        score_bulk.CsvResultFormatter(), stream
+    )
+    assert rows == (1, 0)
+    assert len(stream.getvalue().splitlines()) == 2
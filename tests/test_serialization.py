@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import serialization
+from serialization import Serializer, dumps_json, dumps_orjson
+
+DOCUMENTS = [
+    {"b": 1, "a": [1.5, -0.0, 5e-06], "c": {"z": "x", "y": None}},
+    {"Height": {"Z-score": -2.32, "Status": "Moderately Stunted"}, "Region": "Central"},
+    {"text": "café – \U0001f600"},
+]
+
+
+def test_json_matches_jsonify():
+    for document in DOCUMENTS:
+        assert dumps_json(document) == (
+            json.dumps(document, sort_keys=True, separators=(',', ':')) + '\n'
+        ).encode()
+
+
+def test_orjson_encodes_the_same_values():
+    pytest.importorskip('orjson')
+    for document in DOCUMENTS:
+        body = dumps_orjson(document)
+        assert body.endswith(b'\n')
+        assert json.loads(body) == json.loads(dumps_json(document))
+
+
+@pytest.mark.parametrize("document", [
+    {"Z-score": float('nan')}, {"Z-score": float('inf')}, {"big": 2 ** 70}, {"none": None},
+])
+def test_orjson_falls_back_to_json(document):
+    pytest.importorskip('orjson')
+    assert dumps_orjson(document) == dumps_json(document)
+
+
+def test_auto_uses_json_without_orjson(monkeypatch):
+    monkeypatch.setattr(serialization, 'orjson', None)
+    assert Serializer('auto').name == 'json'
+    with pytest.raises(ValueError):
+        Serializer('orjson')
+
+
+def test_rejects_unknown_encoders():
+    with pytest.raises(ValueError):
+        Serializer('yaml')
+
+
+def test_error_bodies():
+    serializer = Serializer('json')
+    assert serializer.error("Invalid input values") == b'{"error":"Invalid input values"}\n'
+
+
+def test_orjson_keeps_documents_that_only_say_null(monkeypatch):
+    orjson = pytest.importorskip('orjson')
+
+    def unexpected(obj):
+        raise AssertionError("fell back to json")
+
+    monkeypatch.setattr(serialization, 'dumps_json', unexpected)
+    document = {"error": "Field is null", "value": None, "nested": [{"z": -1.5}]}
+    assert dumps_orjson(document) == orjson.dumps(
+        document, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+    )
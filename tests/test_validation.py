@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+import nutriscout
+from validation import ABSENT, Number, Schema
+
+CHILD = {"age": 24, "gender": "girl", "height": 82.5, "weight": 10.1, "location": "Central"}
+
+NUMBER = Number('n', "n must be positive", exclusive_minimum=0)
+SCHEMA = Schema([NUMBER])
+
+
+@pytest.mark.parametrize("field, value", [
+    ('age', np.int64(24)),
+    ('age', np.uint8(24)),
+    ('age', np.float32(24)),
+    ('height', np.float64(82.5)),
+    ('weight', np.float32(10.1)),
+])
+def test_score_accepts_numpy_scalars(field, value):
+    expected = nutriscout.score(dict(CHILD, **{field: value.item()}))
+    assert nutriscout.score(dict(CHILD, **{field: value})) == expected
+
+
+def test_score_rejects_numpy_bool():
+    with pytest.raises(nutriscout.ScoringError) as error:
+        nutriscout.score(dict(CHILD, age=np.bool_(True)))
+    assert error.value.status == 400
+    assert error.value.errors == {'age': "Age must be a number of months"}
+
+
+def test_score_many_accepts_lists_of_numpy_scalars():
+    arrays = {
+        'age': np.array([6, 24, 48]),
+        'gender': np.array(['boy', 'girl', 'boy']),
+        'height': np.array([65.0, 82.5, 100.0]),
+        'weight': np.array([7.0, 10.1, 15.0], dtype=np.float32),
+        'location': np.array(['Central'] * 3),
+    }
+    from_arrays = nutriscout.score_many(arrays)
+    from_lists = nutriscout.score_many({name: list(column) for name, column in arrays.items()})
+
+    assert from_lists['status'].tolist() == [200, 200, 200]
+    for name in nutriscout.INDICATOR_COLUMNS:
+        np.testing.assert_array_equal(from_lists[f"{name}_z"], from_arrays[f"{name}_z"])
+        np.testing.assert_array_equal(from_lists[f"{name}_band"], from_arrays[f"{name}_band"])
+
+
+@pytest.mark.parametrize("value", [
+    True, np.bool_(False), None, [24], float('nan'), float('inf'), "nan", "-inf", "abc", np.nan,
+])
+def test_number_rejects_non_numbers(value):
+    with pytest.raises((ValueError, TypeError)):
+        NUMBER.parse(value)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (24, 24.0), ("24.5", 24.5), (np.int32(3), 3.0), (np.float64(2.5), 2.5), (" 7 ", 7.0),
+])
+def test_number_accepts_numbers_and_numeric_strings(value, expected):
+    assert NUMBER.parse(value) == expected
+
+
+def test_columns_agree_with_single_records():
+    raw = [24, 24.5, "24", True, np.bool_(True), None, float('nan'), float('inf'), "x", 0, -1,
+           np.int64(5), np.float32(2.5), 10 ** 400, ABSENT]
+    values, kinds = NUMBER.parse_column(raw)
+    for value, parsed, kind in zip(raw, values.tolist(), kinds.tolist()):
+        if value is ABSENT:
+            assert kind == -1
+            continue
+        errors = SCHEMA.validate({'n': value})[1]
+        if errors:
+            assert kind == errors[0][0] and parsed != parsed
+        else:
+            assert kind == -1 and parsed == SCHEMA.validate({'n': value})[0]['n']
+
+
+def test_fractional_months_are_truncated():
+    assert nutriscout.score(dict(CHILD, age=24.7)) == nutriscout.score(CHILD)
+    assert nutriscout.score(dict(CHILD, age=12.99)) == nutriscout.score(dict(CHILD, age=12))
+
+
+def test_strict_age_rejects_fractional_months(monkeypatch):
+    monkeypatch.setitem(nutriscout.config, 'STRICT_AGE', True)
+    with pytest.raises(nutriscout.ScoringError) as error:
+        nutriscout.score(dict(CHILD, age=24.7))
+    assert error.value.errors == {'age': nutriscout.WHOLE_MONTHS_MESSAGE}
+    assert nutriscout.score(dict(CHILD, age=24.0)) == nutriscout.score(CHILD)
+
+
+@pytest.mark.parametrize("age, message", [
+    ("abc", "Age must be a number of months"),
+    (float('nan'), "Age must be a number of months"),
+    (True, "Age must be a number of months"),
+    (0, "Age must be between 1-60 months"),
+    (61, "Age must be between 1-60 months"),
+])
+def test_age_errors(age, message):
+    with pytest.raises(nutriscout.ScoringError) as error:
+        nutriscout.score(dict(CHILD, age=age))
+    assert error.value.status == 400
+    assert error.value.errors == {'age': message}
+
+
+@pytest.mark.parametrize("strict", [False, True])
+def test_batches_validate_like_single_records(monkeypatch, strict):
+    monkeypatch.setitem(nutriscout.config, 'STRICT_AGE', strict)
+    records = [
+        dict(CHILD, **changes) for changes in [
+            {}, {'age': 24.7}, {'age': 60.5}, {'age': 61}, {'age': "abc"}, {'age': True},
+            {'age': None}, {'height': 0}, {'weight': float('nan')}, {'weight': "10.1"},
+            {'gender': "BOY"}, {'gender': 1}, {'location': "Nowhere"}, {'age_days': 400},
+            {'age_days': 10}, {'age_mode': "continuous", 'age': 24.7}, {'age': np.int64(7)},
+            {'age': "24"}, {'age': "24.5"}, {'location': None}, {'location': 5},
+            {'location': ["Central"]}, {'gender': "x", 'location': 5},
+        ]
+    ]
+    for record, result in zip(records, nutriscout.score_records(records)):
+        try:
+            expected = nutriscout.score(record)
+        except nutriscout.ScoringError as e:
+            assert (result["status"], result["error"]) == (e.status, e.message)
+            assert result.get("errors", {}) == (e.errors or {})
+        else:
+            assert result == expected
+
+
+@pytest.mark.parametrize("location", [None, 5, ["Central"], "Nowhere"])
+def test_any_unknown_location_is_reported_as_such(location):
+    with pytest.raises(nutriscout.ScoringError) as error:
+        nutriscout.score(dict(CHILD, location=location))
+    assert error.value.message == "Invalid location specified"
+
+
+def test_gender_errors_outrank_location_errors():
+    with pytest.raises(nutriscout.ScoringError) as error:
+        nutriscout.score(dict(CHILD, gender="x", location=None))
+    assert error.value.message == "Gender must be 'boy' or 'girl'"
+
+
+@pytest.mark.parametrize("age", ["24.5", "24.0", "1e1", ""])
+def test_age_strings_must_hold_whole_months(age):
+    with pytest.raises(nutriscout.ScoringError) as error:
+        nutriscout.score(dict(CHILD, age=age))
+    assert error.value.message == "Invalid input values"
+    assert error.value.errors == {'age': "Age must be a number of months"}
+
+
+def test_age_strings_of_whole_months_are_accepted():
+    assert nutriscout.score(dict(CHILD, age=" 24 ")) == nutriscout.score(CHILD)
@@ -0,0 +1,317 @@
+"""Declarative request schemas compiled into single-record and columnar validators.
+
+A Schema is a list of fields built once at import. validate() makes one pass
+over a payload and collects every field error instead of stopping at the
+first. validate_columns() checks columns of values over many payloads one
+field at a time, with NumPy doing the numeric checks, for the batch endpoint
+and bulk scoring; record_columns() turns a list of payloads into columns.
+
+Each error has a kind: MISSING, INVALID (wrong type or unparsable) or
+CONSTRAINT (parsed but out of range). summary() picks the single message the
+API has always returned in "error"; the per-field messages go in "errors".
+"""
+import math
+import numbers
+
+import numpy as np
+
+# Error kinds, in the order summary() prefers them
+MISSING, INVALID, CONSTRAINT = 0, 1, 2
+
+MISSING_MESSAGE = "Missing required field"
+
+SUMMARIES = {MISSING: "Missing required fields", INVALID: "Invalid input values"}
+
+# Marks a key absent from a payload
+ABSENT = object()
+
+
+class Field:
+    """A named payload field with its error messages and handling when absent.
+
+    message reports a value out of range, invalid one of the wrong type.
+    """
+
+    def __init__(self, name, message, summary=None, required=True, default=None, invalid=None):
+        self.name = name
+        self.message = message
+        self.invalid = invalid or message
+        self.summary = summary or message
+        self.required = required
+        self.default = default
+
+    def default_value(self):
+        return self.default() if callable(self.default) else self.default
+
+    def absent_column(self, size):
+        """(values, kinds) for a column absent from every row"""
+        return [self.default_value()] * size, np.full(size, -1, dtype=np.int8)
+
+
+class Number(Field):
+    """A finite number, or a string holding one, within optional bounds.
+
+    Any real number is accepted, NumPy scalars included. Booleans are not
+    numbers here, and NaN or infinite values are invalid. With
+    integer_strings, a string must hold a whole number as int() reads it.
+    """
+
+    def __init__(self, name, message, minimum=None, exclusive_minimum=None, maximum=None,
+                 integer_strings=False, **kwargs):
+        super().__init__(name, message, **kwargs)
+        self.integer_strings = integer_strings
+        self.minimum = minimum
+        self.exclusive_minimum = exclusive_minimum
+        self.maximum = maximum
+
+        # Bounds folded into one check; infinities stand in for missing bounds
+        low = -math.inf if minimum is None else minimum
+        high = math.inf if maximum is None else maximum
+        if exclusive_minimum is not None:
+            self.check = lambda value: exclusive_minimum < value and low <= value <= high
+        else:
+            self.check = lambda value: low <= value <= high
+
+    def parse(self, value):
+        # bool passes as int and NumPy's bool_ converts to float, but neither is a number
+        if isinstance(value, (bool, np.bool_)) or not isinstance(value, (numbers.Real, str)):
+            raise ValueError(value)
+        if self.integer_strings and isinstance(value, str):
+            value = int(value)
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError(value)
+        return value
+
+    def parse_column(self, raw):
+        """(values, kinds) for a column; values are NaN where absent or rejected"""
+        values = None
+        if isinstance(raw, np.ndarray) and raw.dtype.kind in 'iuf':
+            values = raw.astype(np.float64)
+            kinds = np.where(np.isfinite(values), -1, INVALID).astype(np.int8)
+        elif all(type(value) is float or type(value) is int for value in raw):
+            try:
+                values = np.array(raw, dtype=np.float64)
+                kinds = np.where(np.isfinite(values), -1, INVALID).astype(np.int8)
+            except OverflowError:
+                pass
+        if values is None:
+            values, kinds = self._parse_each(raw)
+
+        with np.errstate(invalid='ignore'):
+            out_of_range = np.zeros(len(values), dtype=bool)
+            if self.minimum is not None:
+                out_of_range |= values < self.minimum
+            if self.exclusive_minimum is not None:
+                out_of_range |= values <= self.exclusive_minimum
+            if self.maximum is not None:
+                out_of_range |= values > self.maximum
+        kinds[(kinds < 0) & out_of_range] = CONSTRAINT
+        values[kinds >= 0] = np.nan
+        return values, kinds
+
+    def absent_column(self, size):
+        default = self.default_value()
+        values = np.full(size, np.nan if default is None else default, dtype=np.float64)
+        return values, np.full(size, -1, dtype=np.int8)
+
+    def _parse_each(self, raw):
+        values = np.full(len(raw), np.nan)
+        kinds = np.full(len(raw), -1, dtype=np.int8)
+        for i, value in enumerate(raw):
+            if value is ABSENT:
+                continue
+            try:
+                values[i] = self.parse(value)
+            except (ValueError, TypeError, OverflowError):
+                kinds[i] = INVALID
+        return values, kinds
+
+
+class Choice(Field):
+    """A string from a fixed set, or from a callable returning the current set.
+
+    Values that are not strings are invalid, unless any_type is set: then
+    they are just not among the choices.
+    """
+
+    def __init__(self, name, choices, message, lower=False, any_type=False, **kwargs):
+        super().__init__(name, message, **kwargs)
+        self.choices = choices
+        self.lower = lower
+        self.any_type = any_type
+
+    def allowed(self):
+        return self.choices() if callable(self.choices) else self.choices
+
+    def parse(self, value):
+        if not isinstance(value, str):
+            if self.any_type:
+                return value
+            raise ValueError(value)
+        return value.lower() if self.lower else value
+
+    def check(self, value):
+        return isinstance(value, str) and value in self.allowed()
+
+    def parse_column(self, raw):
+        """(values, kinds) for a column; values are None where absent or invalid"""
+        if isinstance(raw, np.ndarray) and raw.dtype.kind == 'U':
+            # Each distinct string is checked once
+            uniques, inverse = np.unique(raw, return_inverse=True)
+            values, kinds = self.parse_column(uniques.tolist())
+            return np.array(values, dtype=object)[inverse], kinds[inverse]
+
+        values = [None] * len(raw)
+        kinds = np.full(len(raw), -1, dtype=np.int8)
+        allowed = self.allowed()
+        for i, value in enumerate(raw):
+            if value is ABSENT:
+                continue
+            if not isinstance(value, str):
+                kinds[i] = CONSTRAINT if self.any_type else INVALID
+                continue
+            value = value.lower() if self.lower else value
+            if value in allowed:
+                values[i] = value
+            else:
+                kinds[i] = CONSTRAINT
+        return values, kinds
+
+
+class Subset(Choice):
+    """A non-empty list of distinct strings, each from a fixed set or a callable returning it"""
+
+    def parse(self, value):
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            raise ValueError(value)
+        return value
+
+    def check(self, value):
+        allowed = self.allowed()
+        return bool(value) and len(set(value)) == len(value) and all(
+            item in allowed for item in value
+        )
+
+    def parse_column(self, raw):
+        """(values, kinds) for a column; values are None where absent or invalid"""
+        values = [None] * len(raw)
+        kinds = np.full(len(raw), -1, dtype=np.int8)
+        for i, value in enumerate(raw):
+            if value is ABSENT:
+                continue
+            try:
+                value = self.parse(value)
+            except ValueError:
+                kinds[i] = INVALID
+                continue
+            if self.check(value):
+                values[i] = value
+            else:
+                kinds[i] = CONSTRAINT
+        return values, kinds
+
+
+class Schema:
+    """Fields validated in declaration order; earlier fields win the summary"""
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.positions = {field.name: i for i, field in enumerate(self.fields)}
+        # Bound methods looked up once rather than per payload
+        self._plan = [
+            (field.name, field.parse, field.check, field.required, field.default_value)
+            for field in self.fields
+        ]
+
+    def error(self, kind, name, message=None, summary=None):
+        """Error tuple for a field, e.g. from a cross-field rule"""
+        field = self.fields[self.positions[name]]
+        if message is None:
+            message = field.invalid if kind == INVALID else field.message
+        return (kind, self.positions[name], name, message, summary or field.summary)
+
+    def validate(self, payload):
+        """(values, errors) for one payload dict, with defaults for absent optional fields"""
+        values, errors = {}, []
+        for name, parse, check, required, default_value in self._plan:
+            value = payload.get(name, ABSENT)
+            if value is ABSENT:
+                if required:
+                    errors.append(self.error(MISSING, name, MISSING_MESSAGE))
+                else:
+                    values[name] = default_value()
+                continue
+            try:
+                value = parse(value)
+            except (ValueError, TypeError, OverflowError):
+                errors.append(self.error(INVALID, name))
+                continue
+            if check(value):
+                values[name] = value
+            else:
+                errors.append(self.error(CONSTRAINT, name))
+        return values, errors
+
+    def record_columns(self, records):
+        """Raw values of every field over a list of payload dicts, ABSENT where a key is missing"""
+        return {
+            field.name: [record.get(field.name, ABSENT) for record in records]
+            for field in self.fields
+        }
+
+    def validate_columns(self, columns, size):
+        """validate() over columns of raw values, a field at a time.
+
+        columns maps field names to sequences of size values, e.g. from
+        record_columns(); a field left out is absent from every row. Returns
+        (values, errors): values maps field names to a float array (numbers,
+        NaN where unusable) or a list or object array (choices, None where
+        unusable), and errors maps row indices to their error tuples.
+        """
+        values, errors = {}, {}
+        for field in self.fields:
+            raw = columns.get(field.name)
+            if raw is None:
+                column, kinds = field.absent_column(size)
+                if field.required:
+                    kinds[:] = MISSING
+            else:
+                column, kinds = field.parse_column(raw)
+                absent = np.flatnonzero(~present(raw, size))
+                if len(absent):
+                    if field.required:
+                        kinds[absent] = MISSING
+                    else:
+                        default = field.default_value()
+                        if default is not None:
+                            for i in absent.tolist():
+                                column[i] = default
+
+            for i in np.flatnonzero(kinds >= 0).tolist():
+                kind = int(kinds[i])
+                message = MISSING_MESSAGE if kind == MISSING else None
+                errors.setdefault(i, []).append(self.error(kind, field.name, message))
+            values[field.name] = column
+        return values, errors
+
+
+def present(raw, size):
+    """Boolean array of the rows of a raw column that hold a value"""
+    if raw is None:
+        return np.zeros(size, dtype=bool)
+    if isinstance(raw, np.ndarray) or ABSENT not in raw:
+        return np.ones(size, dtype=bool)
+    return np.array([value is not ABSENT for value in raw], dtype=bool)
+
+
+def field_errors(errors):
+    """Field name to message, for the "errors" member of a response"""
+    return {name: message for _, _, name, message, _ in errors}
+
+
+def summary(errors):
+    """The one message for "error": missing fields first, then invalid values,
+    then the earliest field that is out of range"""
+    kind, _, _, _, message = min(errors)
+    return SUMMARIES.get(kind, message)